@@ -0,0 +1,61 @@
+import numpy as np
+
+
+def rmat_edges(scale, edge_factor=16, a=0.57, b=0.19, c=0.19, seed=0):
+    """
+    Returns the undirected edges of an R-MAT graph as two aligned int64
+    arrays (src, dst), every edge once with src < dst. Self loops and
+    duplicate edges are dropped, so slightly fewer edges than requested are
+    returned.
+
+    The degree skew is set with a, the probability of recursing into the
+    top left quadrant. a = b = c = 0.25 gives a uniform random graph, the
+    default Graph500 parameters give a power-law degree distribution.
+
+    scale: the graph has 2**scale vertices
+    edge_factor: number of edges drawn per vertex
+    a, b, c: quadrant probabilities, d is 1 - a - b - c
+    seed: seed of the random generator
+    """
+    rng = np.random.default_rng(seed)
+    n_edges = edge_factor * 2**scale
+    src = np.zeros(n_edges, dtype=np.int64)
+    dst = np.zeros(n_edges, dtype=np.int64)
+    for bit in range(scale):
+        r = rng.random(n_edges)
+        # quadrants: a top left, b top right, c bottom left, d bottom right
+        src_bit = r >= a + b
+        dst_bit = ((r >= a) & (r < a + b)) | (r >= a + b + c)
+        src |= src_bit.astype(np.int64) << bit
+        dst |= dst_bit.astype(np.int64) << bit
+
+    # permute the ids, so high degree vertices are not clustered at 0
+    permutation = rng.permutation(2**scale)
+    src, dst = permutation[src], permutation[dst]
+    keep = src != dst
+    keys = np.unique(np.minimum(src[keep], dst[keep]) * 2**scale +
+                     np.maximum(src[keep], dst[keep]))
+    return keys // 2**scale, keys % 2**scale
+
+
+def power_law_edges(n_vertices, avg_degree=16, exponent=2.5, seed=0):
+    """
+    Returns the undirected edges of a Chung-Lu graph with a power-law
+    expected degree distribution as two aligned int64 arrays (src, dst),
+    every edge once with src < dst.
+
+    n_vertices: number of vertices
+    avg_degree: expected average degree
+    exponent: exponent of the degree distribution, smaller is more skewed
+    seed: seed of the random generator
+    """
+    rng = np.random.default_rng(seed)
+    weights = (np.arange(n_vertices) + 1.0) ** (-1 / (exponent - 1))
+    weights /= weights.sum()
+    n_edges = n_vertices * avg_degree // 2
+    src = rng.choice(n_vertices, n_edges, p=weights)
+    dst = rng.choice(n_vertices, n_edges, p=weights)
+    keep = src != dst
+    keys = np.unique(np.minimum(src[keep], dst[keep]) * n_vertices +
+                     np.maximum(src[keep], dst[keep]))
+    return keys // n_vertices, keys % n_vertices
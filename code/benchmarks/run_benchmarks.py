@@ -0,0 +1,320 @@
+# Load packages.
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Add structure of dirs to path for short imports.
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(ROOT, "classes"))
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+
+from generators import rmat_edges, power_law_edges
+from CSRGraph import CSRGraph
+from EdgeSet import EdgeSet
+from Enums import VertexStatus
+from Fire import Fire
+from Graph import Graph
+from HeadGraph import HeadGraph
+
+# registered benchmarks, in the order they run
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Registers a benchmark, it returns (number of operations, seconds)."""
+    def register(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return register
+
+
+class Workload:
+    def __init__(self, src, dst, args):
+        """
+        Synthetic graph shared by all benchmarks, every undirected edge once
+        in (src, dst).
+        """
+        self.src = src
+        self.dst = dst
+        self.vertex_ids = np.unique(np.concatenate((src, dst)))
+        self.args = args
+        self.tmp_dir = tempfile.mkdtemp(prefix="dsl-benchmarks-")
+
+    def dict_graph(self):
+        graph = Graph(None)
+        for vert_1, vert_2 in zip(self.src.tolist(), self.dst.tolist()):
+            graph.add_vertex_and_neighbor(vert_1, vert_2)
+            graph.add_vertex_and_neighbor(vert_2, vert_1)
+        return graph
+
+    def csr_graph(self):
+        graph = CSRGraph(None)
+        graph.build(np.concatenate((self.src, self.dst)),
+                    np.concatenate((self.dst, self.src)))
+        return graph
+
+    def graph(self, kind):
+        return self.csr_graph() if kind == "csr" else self.dict_graph()
+
+    def fire(self, kind, spread_mode="vertex"):
+        random.seed(self.args.seed)
+        fire = Fire(None, self.graph(kind), spread_mode=spread_mode)
+        fire.rng = np.random.default_rng(self.args.seed)
+        return fire
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+for kind in ("dict", "csr"):
+    @benchmark(f"graph.add_vertex_and_neighbor[{kind}]")
+    def bench_add_vertex_and_neighbor(work, kind=kind):
+        graph = Graph(None) if kind == "dict" else CSRGraph(None)
+        src, dst = work.src.tolist(), work.dst.tolist()
+
+        def run():
+            for vert_1, vert_2 in zip(src, dst):
+                graph.add_vertex_and_neighbor(vert_1, vert_2)
+                graph.add_vertex_and_neighbor(vert_2, vert_1)
+            # the csr graph builds its arrays on the first lookup
+            graph.num_local_vertices()
+        return 2 * len(src), timed(run)
+
+    @benchmark(f"graph.get_neighbors_with_status[{kind}]")
+    def bench_get_neighbors_with_status(work, kind=kind):
+        graph = work.graph(kind)
+        vertex_ids = work.vertex_ids.tolist()
+
+        def run():
+            for vertex_id in vertex_ids:
+                graph.get_neighbors_with_status(vertex_id,
+                                                VertexStatus.NOT_BURNED)
+        return len(vertex_ids), timed(run)
+
+    @benchmark(f"fire.ignite_random_node[{kind}]")
+    def bench_ignite_random_node(work, kind=kind):
+        fire = work.fire(kind)
+        n = min(len(work.vertex_ids), work.args.ignitions)
+
+        def run():
+            for _ in range(n):
+                fire.ignite_random_node()
+        return n, timed(run)
+
+
+for kind, spread_mode in (("dict", "vertex"), ("csr", "vertex"),
+                          ("csr", "frontier")):
+    @benchmark(f"fire.spread[{kind},{spread_mode}]")
+    def bench_spread(work, kind=kind, spread_mode=spread_mode):
+        fire = work.fire(kind, spread_mode)
+        n = work.args.spread_steps
+        if spread_mode == "frontier":
+            n = max(1, n // 100)
+        new_edges = EdgeSet()
+
+        def run():
+            for _ in range(n):
+                fire.spread(new_edges)
+        return n, timed(run)
+
+
+@benchmark("edgeset.add_edge")
+def bench_edgeset_add_edge(work):
+    edges = EdgeSet()
+    src, dst = work.src.tolist(), work.dst.tolist()
+
+    def run():
+        for vert_1, vert_2 in zip(src, dst):
+            edges.add_edge(vert_1, vert_2)
+        edges.as_array()
+    return len(src), timed(run)
+
+
+@benchmark("edgeset.add_edges")
+def bench_edgeset_add_edges(work):
+    edges = EdgeSet()
+
+    def run():
+        edges.add_edges(work.src, work.dst)
+        edges.as_array()
+    return len(work.src), timed(run)
+
+
+def head_graph(work, name):
+    return HeadGraph(len(work.vertex_ids), 1,
+                     os.path.join(work.tmp_dir, f"{name}.e"),
+                     os.path.join(work.tmp_dir, f"{name}.v"),
+                     work.vertex_ids)
+
+
+@benchmark("headgraph.add_edges")
+def bench_headgraph_add_edges(work):
+    graph = head_graph(work, "add_edges")
+    seconds = timed(graph.add_edges, work.src, work.dst, 0)
+    graph.write2file()
+    return len(work.src), seconds
+
+
+@benchmark("headgraph.edges2file")
+def bench_headgraph_edges2file(work):
+    graph = head_graph(work, "edges2file")
+    graph.add_edges(work.src, work.dst, 0)
+
+    def run():
+        graph.edges2file()
+        # wait for the writer, so the formatting and writing is included
+        graph.write2file()
+    return len(work.src), timed(run)
+
+
+@benchmark("headnode.stitch_sample")
+def bench_headnode_stitch_sample(work):
+    # HeadNode loads mpi4py, which runs as a single process without mpirun
+    from HeadNode import HeadNode
+
+    n_vertices = len(work.vertex_ids)
+    head_node = HeadNode(0, 2, 2.0, n_vertices,
+                         os.path.join(work.tmp_dir, "stitch.v"),
+                         os.path.join(work.tmp_dir, "stitch.e"),
+                         vertex_ids=work.vertex_ids)
+    head_node.rng = np.random.default_rng(work.args.seed)
+    src_sample = np.arange(n_vertices, dtype=np.int64)
+    dest_sample = src_sample + n_vertices
+    end = int(np.ceil(n_vertices * head_node.connectivity))
+    seconds = timed(head_node.stitch_sample, src_sample, dest_sample, end)
+    head_node.graph.write2file()
+    return end, seconds
+
+
+def run_benchmarks(args):
+    """
+    Runs the selected benchmarks args.repeat times on the synthetic graph
+    and returns the results, the fastest run of each benchmark counts.
+    """
+    if args.generator == "rmat":
+        src, dst = rmat_edges(args.scale, args.edge_factor, a=args.skew,
+                              b=(1 - args.skew) / 3, c=(1 - args.skew) / 3,
+                              seed=args.seed)
+    else:
+        src, dst = power_law_edges(2**args.scale, 2 * args.edge_factor,
+                                   exponent=args.exponent, seed=args.seed)
+    work = Workload(src, dst, args)
+    print(f"graph: {len(work.vertex_ids)} vertices, {len(src)} edges, "
+          f"max degree {np.bincount(np.concatenate((src, dst))).max()}")
+
+    results = {}
+    for name, func in BENCHMARKS:
+        if args.only and not any(part in name for part in args.only):
+            continue
+        runs = [func(work) for _ in range(args.repeat)]
+        ops = runs[0][0]
+        seconds = min(run[1] for run in runs)
+        results[name] = {"ops": ops, "seconds": seconds,
+                         "ops_per_second": ops / seconds if seconds else None,
+                         "runs": [run[1] for run in runs]}
+        print(f"{name:45s} {seconds:9.4f} s {ops / max(seconds, 1e-12):14.0f} ops/s")
+
+    return {
+        "meta": {"generator": args.generator, "scale": args.scale,
+                 "edge_factor": args.edge_factor, "skew": args.skew,
+                 "exponent": args.exponent, "seed": args.seed,
+                 "repeat": args.repeat, "n_vertices": len(work.vertex_ids),
+                 "n_edges": len(src), "python": platform.python_version(),
+                 "numpy": np.__version__, "machine": platform.node(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints the speed of every benchmark relative to the baseline and returns
+    the names of the ones that are more than threshold slower.
+    """
+    regressions = []
+    print(f"{'benchmark':45s} {'baseline':>12s} {'current':>12s} {'speedup':>8s}")
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:45s} {'-':>12s} {result['seconds']:12.4f}")
+            continue
+        base = baseline["results"][name]["seconds"]
+        speedup = base / result["seconds"] if result["seconds"] else float("inf")
+        flag = ""
+        if speedup < 1 - threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:45s} {base:12.4f} {result['seconds']:12.4f} "
+              f"{speedup:7.2f}x{flag}")
+    if baseline["meta"].get("n_edges") != current["meta"].get("n_edges"):
+        print("warning: baseline was run on a different graph")
+    return regressions
+
+
+def parse_args():
+    """Parses given arguments when calling the benchmarks."""
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks of the simulation hot paths on a "
+                    "synthetic graph, without MPI.")
+    parser.add_argument("--generator", choices=["rmat", "power-law"],
+                        default="rmat", help="Synthetic graph generator")
+    parser.add_argument("--scale", type=int, default=14,
+                        help="The graph has 2**scale vertices")
+    parser.add_argument("--edge-factor", type=int, default=8,
+                        help="Edges drawn per vertex")
+    parser.add_argument("--skew", type=float, default=0.57,
+                        help="R-MAT probability a, 0.25 is uniform, higher "
+                             "gives a more skewed degree distribution")
+    parser.add_argument("--exponent", type=float, default=2.5,
+                        help="Degree exponent of the power-law generator")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the generators and fires")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per benchmark, the fastest counts")
+    parser.add_argument("--spread-steps", type=int, default=20000,
+                        help="Spread steps per vertex fire run, frontier "
+                             "fires do a hundredth")
+    parser.add_argument("--ignitions", type=int, default=10000,
+                        help="Ignitions per run")
+    parser.add_argument("--only", nargs="+", default=None,
+                        help="Only run benchmarks containing one of these")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Compare against the results in this JSON file, "
+                             "exits with 1 on a regression")
+    parser.add_argument("--load", type=str, default=None,
+                        help="Compare results loaded from this JSON file "
+                             "instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown that counts as a regression")
+    args = parser.parse_args()
+    if args.load and not args.compare:
+        parser.error("--load needs --compare")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.load:
+        with open(args.load) as f:
+            current = json.load(f)
+    else:
+        current = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=4)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.threshold):
+            sys.exit(1)
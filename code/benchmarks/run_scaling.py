@@ -0,0 +1,321 @@
+# Load packages.
+import argparse
+import glob
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Add structure of dirs to path for short imports.
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(ROOT, "classes"))
+sys.path.append(os.path.join(ROOT, "benchmarks"))
+
+from generators import rmat_edges
+from CSRGraph import CSRGraph
+
+
+def write_dataset(data_dir, name, src, dst):
+    """Writes the vertex and edge file of a generated graph."""
+    os.makedirs(os.path.join(data_dir, name), exist_ok=True)
+    path = os.path.join(data_dir, name, name)
+    np.savetxt(f"{path}.v", np.unique(np.concatenate((src, dst))), fmt="%d")
+    np.savetxt(f"{path}.e", np.stack((src, dst), axis=1), fmt="%d")
+
+
+def write_partitions(data_dir, name, n_part, seed=0):
+    """
+    Splits a generated graph into n_part partitions, with the text files and
+    binary shards split_partitions writes. Vertices are assigned to
+    partitions at random instead of with KaHIP, so this needs no METIS
+    files. Existing partitions are kept.
+    """
+    path = os.path.join(data_dir, name, name)
+    part_dir = f"{path}-{n_part}-partitions"
+    if os.path.isdir(part_dir):
+        return
+    os.makedirs(part_dir)
+
+    edges = np.fromfile(f"{path}.e", dtype=np.int64, sep=" ").reshape(-1, 2)
+    vertex_ids = np.fromfile(f"{path}.v", dtype=np.int64, sep=" ")
+    ranks = np.random.default_rng(seed).integers(n_part, size=len(vertex_ids))
+
+    def rank_of(ldbc_ids):
+        return ranks[np.searchsorted(vertex_ids, ldbc_ids)]
+
+    # every edge is stored on the nodes of both its vertices
+    src = np.concatenate((edges[:, 0], edges[:, 1]))
+    dst = np.concatenate((edges[:, 1], edges[:, 0]))
+    owner = rank_of(src)
+    for i in range(n_part):
+        graph = CSRGraph(None)
+        graph.build(src[owner == i], dst[owner == i])
+        ghosts = graph.ldbc_ids[graph.n_local:]
+        ghost_ranks = rank_of(ghosts) + 1
+        node = f"{part_dir}/node{i + 1}"
+        np.savetxt(f"{node}.e", np.stack((src[owner == i], dst[owner == i]),
+                                         axis=1), fmt="%d")
+        np.savetxt(f"{node}.p", np.stack((ghosts, ghost_ranks), axis=1),
+                   fmt="%d")
+        graph.to_shard(i + 1, n_part, ghost_ranks).write(f"{node}.bin")
+
+
+def read_node_logs(res_dir):
+    """
+    Returns the timers and counters of every node log in res_dir, as
+    {rank: {"timer": {...}, "counter": {...}}}.
+    """
+    nodes = {}
+    for path in glob.glob(os.path.join(res_dir, "node-*.log")):
+        rank = int(os.path.basename(path)[len("node-"):-len(".log")])
+        node = {"timer": {}, "counter": {}}
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[0] in node:
+                    try:
+                        value = float(parts[2])
+                    except ValueError:
+                        continue
+                    # timers of classes with several instances are summed
+                    node[parts[0]][parts[1]] = \
+                        node[parts[0]].get(parts[1], 0) + value
+        nodes[rank] = node
+    return nodes
+
+
+def summarize(nodes):
+    """
+    Summarizes the node logs of a run: timers of the headnode, mean and
+    maximum timers of the compute nodes, bytes sent and peak memory.
+    """
+    head = nodes.get(0, {"timer": {}, "counter": {}})
+    workers = [node for rank, node in nodes.items() if rank != 0]
+    names = sorted({name for node in workers for name in node["timer"]})
+    rss = {rank: node["counter"].get("peak_rss_kb", 0) * 1024
+           for rank, node in nodes.items()}
+    return {
+        "head_timers": head["timer"],
+        "worker_timers_mean": {name: float(np.mean(
+            [node["timer"].get(name, 0) for node in workers]))
+            for name in names},
+        "worker_timers_max": {name: max(
+            node["timer"].get(name, 0) for node in workers)
+            for name in names},
+        "bytes_sent": sum(value for node in nodes.values()
+                          for name, value in node["counter"].items()
+                          if name.startswith("n_bytes")),
+        "peak_rss_bytes": {str(rank): rss[rank] for rank in sorted(rss)},
+        "peak_rss_bytes_max": max(rss.values(), default=0),
+        "peak_rss_bytes_total": sum(rss.values())
+    }
+
+
+def run_once(args, n_ranks, scale, res_dir):
+    """Runs the simulation once and returns its wall time and exit code."""
+    simulation = os.path.join(ROOT, "simulations",
+                              f"{args.sim}_forest_fire.py")
+    play_dir = os.path.join(args.work_dir, "playground")
+    os.makedirs(play_dir, exist_ok=True)
+    command = [sys.executable, os.path.join(ROOT, "run_simulation.py"),
+               simulation, str(scale), args.dataset, "True",
+               str(args.ring_stitch), str(args.connectivity), play_dir,
+               args.data, res_dir] + shlex.split(args.sim_args)
+    if args.launcher == "shm":
+        command += ["--backend", "shm", "--ranks", str(n_ranks)]
+    else:
+        command = ["mpirun", "-n", str(n_ranks)] + \
+            shlex.split(args.mpirun_args) + command
+
+    with open(os.path.join(res_dir, "out.txt"), "w") as out:
+        start = time.perf_counter()
+        try:
+            code = subprocess.call(command, stdout=out,
+                                   stderr=subprocess.STDOUT,
+                                   timeout=args.timeout)
+        except subprocess.TimeoutExpired:
+            code = None
+        return time.perf_counter() - start, code
+
+
+def add_scaling(runs, mode):
+    """
+    Adds speedup and efficiency to every run, relative to the run with the
+    fewest compute nodes. In strong mode runs with the same scale factor are
+    compared, in weak mode the scale factor grows with the compute nodes and
+    all runs are compared.
+    """
+    groups = {}
+    for run in runs:
+        key = run["scale"] if mode == "strong" else None
+        groups.setdefault(key, []).append(run)
+    for group in groups.values():
+        base = min(group, key=lambda run: run["compute_nodes"])
+        for run in group:
+            ratio = run["compute_nodes"] / base["compute_nodes"]
+            time_ratio = base["wall_time"] / run["wall_time"]
+            if mode == "strong":
+                run["speedup"] = time_ratio
+                run["efficiency"] = time_ratio / ratio
+            else:
+                run["efficiency"] = time_ratio
+                run["speedup"] = time_ratio * ratio
+
+
+def plot(runs, mode, path):
+    """Plots speedup and efficiency against the number of compute nodes."""
+    import matplotlib.pyplot as plt
+
+    fig, (ax_speedup, ax_efficiency) = plt.subplots(1, 2, figsize=(10, 4))
+    keys = sorted({run["scale"] for run in runs}) if mode == "strong" else [None]
+    for key in keys:
+        group = sorted([run for run in runs if key is None or run["scale"] == key],
+                       key=lambda run: run["compute_nodes"])
+        nodes = [run["compute_nodes"] for run in group]
+        label = f"scale {key}" if key is not None else "weak"
+        ax_speedup.plot(nodes, [run["speedup"] for run in group], "o-",
+                        label=label)
+        ax_efficiency.plot(nodes, [run["efficiency"] for run in group], "o-",
+                           label=label)
+    nodes = sorted({run["compute_nodes"] for run in runs})
+    ax_speedup.plot(nodes, [n / nodes[0] for n in nodes], "k--",
+                    label="linear")
+    ax_speedup.set_xlabel("compute nodes")
+    ax_speedup.set_ylabel("speedup")
+    ax_efficiency.set_xlabel("compute nodes")
+    ax_efficiency.set_ylabel("efficiency")
+    ax_efficiency.set_ylim(0, 1.2)
+    ax_speedup.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def parse_args():
+    """Parses given arguments when calling the scaling harness."""
+    parser = argparse.ArgumentParser(
+        description="Runs a simulation at several rank counts and scale "
+                    "factors on this machine and reports how it scales.")
+    parser.add_argument("sim", choices=["wild", "halted"],
+                        help="Simulation to run")
+    parser.add_argument("--ranks", type=int, nargs="+", default=[3, 5, 9],
+                        help="Numbers of ranks, the headnode included")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0],
+                        help="Scale factors, in weak mode per compute node "
+                             "of the smallest run")
+    parser.add_argument("--mode", choices=["strong", "weak"],
+                        default="strong",
+                        help="strong keeps the scale factor fixed, weak "
+                             "grows it with the number of compute nodes")
+    parser.add_argument("--dataset", type=str, default=None,
+                        help="Dataset in --data with partitions for every "
+                             "rank count, a graph is generated when omitted")
+    parser.add_argument("--data", type=str, default=None,
+                        help="Folder with the datasets, defaults to the work "
+                             "folder for generated graphs")
+    parser.add_argument("--graph-scale", type=int, default=14,
+                        help="The generated R-MAT graph has 2**graph_scale "
+                             "vertices")
+    parser.add_argument("--edge-factor", type=int, default=8,
+                        help="Edges per vertex of the generated graph")
+    parser.add_argument("--skew", type=float, default=0.57,
+                        help="R-MAT probability a of the generated graph")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the generated graph and partitions")
+    parser.add_argument("--ring-stitch", type=str, default="True",
+                        help="Ring stitching")
+    parser.add_argument("--connectivity", type=float, default=0.1,
+                        help="Connectivity of the stitching")
+    parser.add_argument("--sim-args", type=str, default="",
+                        help="Extra arguments for run_simulation.py, e.g. "
+                             "\"--graph csr --pipelined\"")
+    parser.add_argument("--launcher", choices=["mpirun", "shm"],
+                        default="mpirun",
+                        help="Start the ranks with mpirun or with the shared "
+                             "memory backend")
+    parser.add_argument("--mpirun-args", type=str, default="--oversubscribe",
+                        help="Extra arguments for mpirun")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Runs per configuration, the fastest counts")
+    parser.add_argument("--timeout", type=float, default=3600,
+                        help="Seconds after which a run is stopped")
+    parser.add_argument("--work-dir", type=str, default=None,
+                        help="Folder for generated data and results, a "
+                             "temporary folder by default")
+    parser.add_argument("--output", type=str, default="scaling.json",
+                        help="JSON file to write the results to")
+    parser.add_argument("--plot", type=str, default=None,
+                        help="Image file to plot speedup and efficiency to")
+    args = parser.parse_args()
+    if min(args.ranks) < 2:
+        parser.error("--ranks needs a headnode and a compute node")
+    if args.dataset is not None and args.data is None:
+        parser.error("--dataset needs --data")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.work_dir = args.work_dir or tempfile.mkdtemp(prefix="dsl-scaling-")
+    groups = 1
+    sim_args = shlex.split(args.sim_args)
+    if "--groups" in sim_args:
+        groups = int(sim_args[sim_args.index("--groups") + 1])
+
+    if args.dataset is None:
+        args.data = args.data or os.path.join(args.work_dir, "data")
+        args.dataset = f"rmat-{args.graph_scale}-{args.edge_factor}-{args.skew}"
+        if not os.path.isfile(os.path.join(args.data, args.dataset,
+                                           f"{args.dataset}.e")):
+            print(f"generating {args.dataset}")
+            write_dataset(args.data, args.dataset,
+                          *rmat_edges(args.graph_scale, args.edge_factor,
+                                      a=args.skew, b=(1 - args.skew) / 3,
+                                      c=(1 - args.skew) / 3, seed=args.seed))
+        for n_ranks in args.ranks:
+            write_partitions(args.data, args.dataset,
+                             (n_ranks - 1) // groups, args.seed)
+
+    runs = []
+    base_nodes = min(args.ranks) - 1
+    for n_ranks in sorted(args.ranks):
+        for scale in args.scales:
+            if args.mode == "weak":
+                scale = scale * (n_ranks - 1) / base_nodes
+            res_dir = os.path.join(args.work_dir, f"res_{n_ranks}_{scale}")
+            best = None
+            for i in range(args.repeat):
+                os.makedirs(res_dir, exist_ok=True)
+                wall_time, code = run_once(args, n_ranks, scale, res_dir)
+                if code != 0:
+                    print(f"{n_ranks} ranks, scale {scale}: failed "
+                          f"({'timeout' if code is None else code}), see "
+                          f"{res_dir}/out.txt")
+                    break
+                if best is None or wall_time < best["wall_time"]:
+                    best = {"ranks": n_ranks, "compute_nodes": n_ranks - 1,
+                            "scale": scale, "wall_time": wall_time,
+                            **summarize(read_node_logs(res_dir))}
+            if best is not None:
+                runs.append(best)
+
+    add_scaling(runs, args.mode)
+    print(f"{'ranks':>5s} {'scale':>7s} {'wall [s]':>9s} {'speedup':>8s} "
+          f"{'eff':>5s} {'sent [MB]':>10s} {'max rss [MB]':>12s} "
+          f"{'total rss [MB]':>14s}")
+    for run in runs:
+        print(f"{run['ranks']:5d} {run['scale']:7.2f} {run['wall_time']:9.2f} "
+              f"{run['speedup']:8.2f} {run['efficiency']:5.2f} "
+              f"{run['bytes_sent'] / 2**20:10.1f} "
+              f"{run['peak_rss_bytes_max'] / 2**20:12.1f} "
+              f"{run['peak_rss_bytes_total'] / 2**20:14.1f}")
+
+    with open(args.output, "w") as f:
+        json.dump({"mode": args.mode, "sim": args.sim,
+                   "dataset": args.dataset, "sim_args": args.sim_args,
+                   "launcher": args.launcher, "runs": runs}, f, indent=4)
+    if args.plot:
+        plot(runs, args.mode, args.plot)
@@ -0,0 +1,397 @@
+from array import array
+import numpy as np
+
+from Enums import VertexStatus
+from PartitionShard import PartitionShard
+
+# ids spanning at most this many values per vertex get a direct lookup table,
+# sparser ids are looked up with a binary search
+LOOKUP_TABLE_DENSITY = 4
+# rows up to this degree are filtered in Python, NumPy only pays off on
+# longer rows
+SMALL_ROW_DEGREE = 64
+
+
+class CSRGraph:
+    def __init__(self, compute_node):
+        """
+        Array backed partition graph, drop in replacement for Graph.
+
+        LDBC ids are remapped to dense local indices at load time. Indices
+        [0, n_local) are the vertices owned by this partition, indices
+        [n_local, n_total) are ghost vertices that only appear as neighbors.
+        Adjacency of the owned vertices is stored in CSR form (indptr/indices)
+        and the burn status of every index in a single int8 array.
+
+        Partitions split with a halo replicate the adjacency of the ghost
+        vertices within a number of hops of the partition. These halo
+        vertices are the first n_halo ghosts, their rows follow the rows of
+        the owned vertices.
+
+        compute_node: compute node that owns this partition
+        """
+        self.compute_node = compute_node
+        self.n_local = 0
+        self.n_halo = 0
+        self.ldbc_ids = np.empty(0, dtype=np.int64)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.status = np.empty(0, dtype=np.int8)
+        # rank owning each ghost index, only known when loaded from a shard
+        self.ghost_ranks = np.empty(0, dtype=np.int32)
+
+        # sorted view on ldbc_ids for translating LDBC ids to local indices
+        self._sorted_ids = np.empty(0, dtype=np.int64)
+        self._sorter = np.empty(0, dtype=np.int64)
+        # direct table of the index of every id from _min_id on, -1 for ids
+        # not in the partition, see _build_lookup
+        self._min_id = 0
+        self._lookup = array("q")
+        # memoryviews on the arrays, for scalar access without NumPy scalars
+        self._views = None
+
+        # edges added one at a time are buffered until the next lookup, which
+        # misses the emptied lookup table and flushes them
+        self._pending_src = []
+        self._pending_dst = []
+
+    def load_edge_file(self, path_to_edge_file):
+        """Builds the partition from an edge file in one pass."""
+        edges = np.fromfile(path_to_edge_file, dtype=np.int64, sep=" ")
+        edges = edges.reshape(-1, 2)
+        self.build(edges[:, 0], edges[:, 1])
+
+    def load_shard(self, shard: PartitionShard):
+        """
+        Uses the (memory mapped) arrays of a partition shard directly, so no
+        parsing or sorting is needed at startup.
+        """
+        # plain views on the memory maps, indexing a np.memmap is slower
+        self.n_local = shard.n_local
+        self.n_halo = shard.n_halo
+        self.ldbc_ids = np.asarray(shard.ldbc_ids)
+        self._sorter = np.asarray(shard.sorter)
+        self._sorted_ids = self.ldbc_ids[self._sorter]
+        self.indptr = np.asarray(shard.indptr)
+        self.indices = np.asarray(shard.indices)
+        self.ghost_ranks = np.asarray(shard.ghost_ranks)
+        self.status = np.full(len(self.ldbc_ids), VertexStatus.NOT_BURNED.value,
+                              dtype=np.int8)
+        self._build_lookup()
+
+    def load_ghost_ranks(self, path_to_partition_file):
+        """
+        Reads the rank of every ghost vertex from a text partition file, so
+        RankTable can be used instead of a dict.
+        """
+        mapping = np.fromfile(path_to_partition_file, dtype=np.int64,
+                              sep=" ").reshape(-1, 2)
+        order = np.argsort(mapping[:, 0], kind="stable")
+        ghosts = self.ldbc_ids[self.n_local:]
+        pos = np.searchsorted(mapping[order, 0], ghosts)
+        self.ghost_ranks = mapping[order[pos], 1].astype(np.int32)
+
+    def to_shared(self, partition_comm):
+        """
+        Moves the arrays of the partition into MPI shared memory windows, so
+        the ranks of partition_comm, which all burn this partition on the same
+        host, keep a single copy. Only rank 0 of partition_comm has to load
+        the partition, the other ranks attach to its windows. The burn status
+        stays private to every rank.
+
+        partition_comm: communicator of the ranks on this host sharing the
+                        partition, from Split_type(COMM_TYPE_SHARED)
+        """
+        # only imported here, the partition scripts do not need MPI
+        from mpi4py import MPI
+
+        if self._pending_src:
+            self._flush()
+        names = ["ldbc_ids", "_sorter", "_sorted_ids", "indptr", "indices",
+                 "ghost_ranks"]
+        leader = partition_comm.Get_rank() == 0
+        layout = None
+        if leader:
+            layout = (self.n_local, self.n_halo,
+                      [(getattr(self, name).dtype.str, len(getattr(self, name)))
+                       for name in names])
+        self.n_local, self.n_halo, layout = partition_comm.bcast(layout,
+                                                                 root=0)
+
+        self.windows = []
+        for name, (dtype, length) in zip(names, layout):
+            dtype = np.dtype(dtype)
+            window = MPI.Win.Allocate_shared(
+                dtype.itemsize * length if leader else 0, dtype.itemsize,
+                comm=partition_comm)
+            buffer, _ = window.Shared_query(0)
+            array = np.ndarray(length, dtype=dtype, buffer=buffer)
+            if leader:
+                array[:] = getattr(self, name)
+            setattr(self, name, array)
+            self.windows.append(window)
+        partition_comm.Barrier()
+        self.status = np.full(len(self.ldbc_ids), VertexStatus.NOT_BURNED.value,
+                              dtype=np.int8)
+        self._build_lookup()
+
+    def to_shard(self, rank, n_part, ghost_ranks):
+        """Returns the partition as a PartitionShard that can be written."""
+        if self._pending_src:
+            self._flush()
+        return PartitionShard(rank, n_part, self.n_local, self.ldbc_ids,
+                              self._sorter, self.indptr, self.indices,
+                              ghost_ranks, self.n_halo)
+
+    def build(self, src, dst, halo_src=None, halo_dst=None):
+        """
+        Builds the CSR arrays from two aligned arrays of LDBC ids. Every src
+        vertex is owned by this partition, dst vertices that are not a src are
+        ghosts. Duplicate edges are dropped.
+
+        halo_src, halo_dst: optional edges of the halo, every halo_src vertex
+                            that is not owned becomes a halo vertex
+        """
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        owned = np.unique(src)
+        halo = np.empty(0, dtype=np.int64)
+        if halo_src is not None:
+            halo_src = np.asarray(halo_src, dtype=np.int64)
+            halo = np.setdiff1d(np.unique(halo_src), owned, assume_unique=True)
+            src = np.concatenate((src, halo_src))
+            dst = np.concatenate((dst, np.asarray(halo_dst, dtype=np.int64)))
+        ghosts = np.setdiff1d(np.unique(dst), np.concatenate((owned, halo)))
+
+        self.n_local = len(owned)
+        self.n_halo = len(halo)
+        self.ldbc_ids = np.concatenate((owned, halo, ghosts))
+        self._sorter = np.argsort(self.ldbc_ids, kind="stable")
+        self._sorted_ids = self.ldbc_ids[self._sorter]
+        n_total = len(self.ldbc_ids)
+        n_rows = self.n_local + self.n_halo
+
+        # sort and deduplicate on a single key, giving rows in index order
+        keys = np.unique(self.to_local(src) * n_total + self.to_local(dst))
+        rows = keys // n_total
+
+        index_type = np.int32 if n_total < 2**31 else np.int64
+        self.indices = (keys % n_total).astype(index_type)
+        self.indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_rows),
+                  out=self.indptr[1:])
+        self.status = np.full(n_total, VertexStatus.NOT_BURNED.value,
+                              dtype=np.int8)
+        self._build_lookup()
+
+    def _build_lookup(self):
+        """
+        Builds the direct id to index table of the scalar lookups, when the
+        ids are dense enough. It is an array.array, indexing it returns plain
+        ints without the cost of NumPy scalars.
+        """
+        self._views = (memoryview(self.indptr), memoryview(self.indices),
+                       memoryview(self.status), memoryview(self.ldbc_ids))
+        self._lookup = array("q")
+        if len(self._sorted_ids) == 0:
+            return
+        self._min_id = int(self._sorted_ids[0])
+        span = int(self._sorted_ids[-1]) - self._min_id + 1
+        if span > LOOKUP_TABLE_DENSITY * len(self._sorted_ids):
+            return
+        table = np.full(span, -1, dtype=np.int64)
+        table[self._sorted_ids - self._min_id] = self._sorter
+        self._lookup.frombytes(table.tobytes())
+
+    def to_local(self, vertex_ids):
+        """Translates LDBC ids to local indices, unknown ids become -1."""
+        vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+        if len(self._sorted_ids) == 0:
+            return np.full(vertex_ids.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self._sorted_ids, vertex_ids),
+                         len(self._sorted_ids) - 1)
+        found = self._sorted_ids[pos] == vertex_ids
+        return np.where(found, self._sorter[pos], -1)
+
+    def _index(self, vertex_id):
+        offset = vertex_id - self._min_id
+        if 0 <= offset < len(self._lookup):
+            return self._lookup[offset]
+        return self._search(vertex_id)
+
+    def _search(self, vertex_id):
+        """
+        Slow path of _index, for ids outside the lookup table or without
+        one. Flushes the buffered edges first.
+        """
+        if self._pending_src:
+            self._flush()
+            return self._index(vertex_id)
+        pos = np.searchsorted(self._sorted_ids, vertex_id)
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == vertex_id:
+            return int(self._sorter[pos])
+        return -1
+
+    def _flush(self):
+        """Rebuilds the arrays with the buffered edges, keeping statuses."""
+        # halo rows are dropped, graphs with a halo are loaded from shards
+        n_owned_edges = self.indptr[self.n_local]
+        src = np.concatenate((
+            np.repeat(self.ldbc_ids[:self.n_local],
+                      np.diff(self.indptr[:self.n_local + 1])),
+            np.array(self._pending_src, dtype=np.int64)))
+        dst = np.concatenate((self.ldbc_ids[self.indices[:n_owned_edges]],
+                              np.array(self._pending_dst, dtype=np.int64)))
+        self._pending_src = []
+        self._pending_dst = []
+
+        old_ids = self.ldbc_ids[:self.n_local]
+        old_status = self.status[:self.n_local]
+        self.build(src, dst)
+        self.status[self.to_local(old_ids)] = old_status
+
+    def get_vertex_rank(self, vertex_id):
+        """Returns the rank owning a ghost vertex."""
+        idx = self._index(vertex_id)
+        if idx < self.n_local or idx - self.n_local >= len(self.ghost_ranks):
+            raise KeyError(vertex_id)
+        return int(self.ghost_ranks[idx - self.n_local])
+
+    def get_vertex_ranks(self, vertex_ids):
+        """Returns the ranks owning an array of ghost vertices."""
+        ghosts = self.to_local(vertex_ids) - self.n_local
+        # owned and unknown vertices would wrap around to another rank
+        invalid = (ghosts < 0) | (ghosts >= len(self.ghost_ranks))
+        if invalid.any():
+            raise KeyError(np.asarray(vertex_ids)[invalid].tolist())
+        return self.ghost_ranks[ghosts]
+
+    def num_local_vertices(self):
+        if self._pending_src:
+            self._flush()
+        return self.n_local
+
+    def local_index(self, vertex_id: int) -> int:
+        """Returns the dense index of a local vertex, or -1."""
+        idx = self._index(vertex_id)
+        return idx if idx < self.n_local else -1
+
+    def local_ids(self, indices) -> [int]:
+        """Returns the LDBC ids of the given dense indices."""
+        return self.ldbc_ids[np.asarray(indices, dtype=np.int64)].tolist()
+
+    def is_halo(self, vertex_id):
+        """Returns whether a vertex is a halo vertex, see __init__."""
+        return self.n_local <= self._index(vertex_id) < \
+            self.n_local + self.n_halo
+
+    def gather_neighbors(self, indices):
+        """
+        Returns the neighbors of a batch of owned or halo indices as two
+        aligned arrays: the position in `indices` each neighbor belongs to
+        and the local index of the neighbor.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.indptr[indices]
+        degrees = self.indptr[indices + 1] - starts
+        group = np.repeat(np.arange(len(indices)), degrees)
+        offsets = np.arange(degrees.sum()) - \
+            np.repeat(np.cumsum(degrees) - degrees, degrees)
+        return group, self.indices[starts[group] + offsets].astype(np.int64)
+
+    def set_vertex_status(self, vertex_id: int, status: VertexStatus):
+        # the status of halo vertices is what this partition knows of them
+        idx = self._index(vertex_id)
+        if 0 <= idx < self.n_local + self.n_halo:
+            self.status[idx] = status.value
+
+    def get_vertex_status(self, vertex_id: int):
+        idx = self._index(vertex_id)
+        if not 0 <= idx < self.n_local:
+            raise KeyError(vertex_id)
+        return VertexStatus(int(self.status[idx]))
+
+    def vert_exists_here(self, vertex_id):
+        return 0 <= self._index(vertex_id) < self.n_local
+
+    def get_neighbors(self, vertex_id: int) -> [int]:
+        idx = self._index(vertex_id)
+        if 0 <= idx < self.n_local:
+            nbrs = self.indices[self.indptr[idx]:self.indptr[idx + 1]]
+            return self.ldbc_ids[nbrs].tolist()
+        return []
+
+    def get_neighbors_with_status(self, vertex_id: int, status: VertexStatus) -> [int]:
+        n_rows = self.n_local + self.n_halo
+        idx = self._index(vertex_id)
+        if not 0 <= idx < n_rows:
+            return []
+        indptr, indices, vertex_status, ldbc_ids = self._views
+        start, end = indptr[idx], indptr[idx + 1]
+        # non-local neighbors are always returned, the fire determines if it
+        # should send a burn request, halo vertices are treated as local
+        if end - start <= SMALL_ROW_DEGREE:
+            value = status.value
+            return [ldbc_ids[nbr] for nbr in indices[start:end]
+                    if nbr >= n_rows or vertex_status[nbr] == value]
+        nbrs = self.indices[start:end]
+        keep = (nbrs >= n_rows) | (self.status[nbrs] == status.value)
+        return self.ldbc_ids[nbrs[keep]].tolist()
+
+    def get_vertex_ids_with_status(self, status: VertexStatus):
+        if self._pending_src:
+            self._flush()
+        local_status = self.status[:self.n_local]
+        return self.ldbc_ids[:self.n_local][local_status == status.value]
+
+    def add_vertex_and_neighbor(self, vertex_from: int, vertex_to: int):
+        """
+        Adds a single edge. Edges are buffered and the arrays are rebuilt on
+        the next lookup, so bulk loads should use load_edge_file instead.
+        """
+        self._pending_src.append(vertex_from)
+        self._pending_dst.append(vertex_to)
+        self._lookup = array("q")
+
+    def set_all_vertex_status(self, vertex_status):
+        if self._pending_src:
+            self._flush()
+        self.status[:] = vertex_status.value
+
+    def get_v_id_status_string(self):
+        if self._pending_src:
+            self._flush()
+        ret = ""
+        for v_id, status in zip(self.ldbc_ids[:self.n_local],
+                                self.status[:self.n_local]):
+            ret += str(v_id) + ": " + str(VertexStatus(int(status))) + "\n"
+        return ret
+
+
+class RankTable:
+    def __init__(self, graph: CSRGraph):
+        """
+        Read-only vertex -> rank mapping on top of the ghost ranks of a
+        CSRGraph, used in place of the dict read from a .p file.
+        """
+        self.graph = graph
+
+    def __getitem__(self, vertex_id):
+        return self.graph.get_vertex_rank(vertex_id)
+
+    def __contains__(self, vertex_id):
+        try:
+            self.graph.get_vertex_rank(vertex_id)
+        except KeyError:
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.graph.ghost_ranks)
+
+    def values(self):
+        return self.graph.ghost_ranks.tolist()
+
+    def lookup(self, vertex_ids):
+        """Vectorized __getitem__ for an array of ghost vertices."""
+        return self.graph.get_vertex_ranks(vertex_ids)
@@ -1,44 +1,173 @@
 import logging
+import os
+import time
+from collections import deque
 import numpy as np
 import mpi4py
 mpi4py.rc.recv_mprobe = False
 from mpi4py import MPI
 
 from TimeIt import timeit
-from Graph import Graph, GraphInterpreter
+from Profiler import profiler
+from TrackedComm import track, waitall
+from Graph import Graph
+from CSRGraph import CSRGraph, RankTable
+from PartitionShard import PartitionShard
 from Fire import Fire
+from GhostStatus import GhostStatus
+from HeartbeatAggregator import HeartbeatAggregator, tree_parent, \
+    tree_children
+from FireStepController import FireStepController
 from EdgeSet import EdgeSet
-from Enums import MPI_TAG, VertexStatus, SLEEP_TIMES
+from EdgeWriter import EdgeWriter
+from Enums import MPI_TAG, VertexStatus, SLEEP_TIMES, HEARTBEAT_FIELD, \
+    HEARTBEAT_HEADER_SIZE, AGGREGATE_HEADER_SIZE, STITCH_FIELD
 
-comm = MPI.COMM_WORLD
+comm = track(MPI.COMM_WORLD)
 
 # add function names here that needs timing
 func_to_time = ["send_heartbeat", "send_burn_requests",
-                "do_spread_steps", "init_partition", "receive_from_headnode", "do_tasks"]
+                "do_spread_steps", "init_partition", "receive_from_headnode", "do_tasks",
+                "poll_headnode", "stitch", "aggregate_heartbeats"]
 timer = {func:0 for func in func_to_time}
 counter = {func:0 for func in func_to_time}
 counter["n_edge_in_send_heartbeat"] = 0
+counter["n_bytes_in_send_heartbeat"] = 0
+counter["n_bytes_in_send_burn_requests"] = 0
+counter["n_bytes_in_ghost_updates"] = 0
+counter["n_burn_requests_suppressed"] = 0
+counter["n_halo_claims"] = 0
+counter["n_halo_claims_rejected"] = 0
+counter["n_bytes_in_halo_claims"] = 0
+counter["n_halo_edges_released"] = 0
+counter["n_halo_edges_dropped"] = 0
+counter["n_edges_aggregated"] = 0
+counter["n_duplicate_edges_dropped"] = 0
+counter["n_heartbeat_waits"] = 0
+counter["n_ignitions_received"] = 0
 
 
 class ComputeNode:
-    def __init__(self, rank, fires_wild, n_comp_nodes, machine_with_vertex):
+    def __init__(self, rank, fires_wild, n_comp_nodes, machine_with_vertex,
+                 graph="dict", spread="vertex", exchange="neighbor",
+                 pipelined=False, max_outstanding=4, output="head",
+                 out_e=None, stitch_on="head", step_interval=0.05,
+                 step_edges=20000, min_step=1, max_step=10000, groups=1,
+                 shared_partitions=False, ghost_status=False, halo=0,
+                 fan_out=0):
         """
         NOTE: get_vertex_rank is a function. This way we can use this class in
                 a flexible way.
+
+        graph: partition graph implementation, "dict" for Graph or "csr" for
+               the array backed CSRGraph
+        spread: spread mode of the fire, "vertex" burns one vertex per spread
+                step and "frontier" a whole frontier level (csr graph only)
+        exchange: how burn requests are exchanged in wild fires, "neighbor"
+                  uses a sparse neighborhood collective over the compute nodes
+                  that share cut edges, "sendrecv" a blocking sendrecv with
+                  every other compute node
+        pipelined: keep spreading while earlier heartbeats are in flight
+                   instead of waiting for the headnode after every heartbeat
+        max_outstanding: maximum number of heartbeats in flight when pipelined
+        output: "head" when the headnode writes all edges, "distributed" to
+                write the edges the headnode accepted to out_e
+        out_e: output file for the edge shard of this compute node
+        stitch_on: "compute" when the headnode hands out stitching to the
+                   compute nodes after the last sample
+        step_interval: target time between heartbeats in seconds
+        step_edges: target number of edges per heartbeat
+        min_step, max_step: bounds on the number of spread steps per round
+        groups: number of groups of n_comp_nodes compute nodes, every group
+                burns its own sample on a replica of the partitions. Ranks
+                in machine_with_vertex are partition numbers within a group.
+        shared_partitions: keep one copy of a partition per host, shared by
+                           the compute nodes that burn it (csr graph only)
+        ghost_status: keep track of the ghost vertices burned in the current
+                      sample, from updates the neighbors send along with
+                      their burn requests, and do not request those again
+                      (neighbor exchange only)
+        halo: depth of the halo of the partition shard, the fire burns
+              through the halo speculatively and claims the halo vertices it
+              burned at their owners (wild fires, csr graph and neighbor
+              exchange only)
+        fan_out: send heartbeats up a tree with fan_out children per node
+                 instead of to the headnode directly, compute nodes with
+                 children merge their heartbeats (lockstep and head output
+                 only). 0 sends all heartbeats to the headnode.
         """
+        if shared_partitions and graph != "csr":
+            raise ValueError("shared partitions need the csr graph")
+        if ghost_status and exchange != "neighbor":
+            raise ValueError("the ghost status needs the neighbor exchange")
+        if halo and (graph != "csr" or exchange != "neighbor" or
+                     not fires_wild):
+            raise ValueError("a halo needs wild fires, the csr graph and the "
+                             "neighbor exchange")
+        if fan_out and (pipelined or output != "head"):
+            raise ValueError("aggregating heartbeats needs lockstep "
+                             "heartbeats and head output")
         self.rank = rank
+        self.group = (rank - 1) // n_comp_nodes
+        # rank of this compute node within its group, the partition it burns
+        self.partition = rank - self.group * n_comp_nodes
         self.killed = False
         self.fires_wild = fires_wild
         self.num_compute_nodes = n_comp_nodes
-        self.graph_reader = GraphInterpreter()
-        self.partitioned_graph = Graph(self)
-        self.fire_step = 10
-        self.fire = Fire(self, self.partitioned_graph)
+        if graph == "csr":
+            self.partitioned_graph = CSRGraph(self)
+        else:
+            self.partitioned_graph = Graph(self)
+        self.step_controller = FireStepController(step_interval, step_edges,
+                                                  min_step, max_step)
+        self.fire_step = self.step_controller.step
+        self.round = 0
+        self.fire = Fire(self, self.partitioned_graph, spread_mode=spread)
         self.machine_with_vertex = machine_with_vertex
+        self.exchange = exchange
+        self.shared_partitions = shared_partitions
+        self.fire_comm = None
+        self.neighbor_ranks = np.empty(0, dtype=np.int64)
+        self.compute_comm = None
+        self.track_ghost_status = ghost_status
+        self.ghost_status = None
+        self.halo = halo
+        self.reset_halo()
+
+        # heartbeats go to the parent in the tree of the group, control
+        # messages come from it and are passed on to the children
+        offset = rank - self.partition
+        self.heartbeat_parent = 0
+        self.heartbeat_children = []
+        self.aggregator = None
+        if fan_out:
+            parent = tree_parent(self.partition, fan_out)
+            self.heartbeat_parent = offset + parent if parent > 0 else 0
+            self.heartbeat_children = [
+                (offset + child,
+                 len(tree_children(child, n_comp_nodes, fan_out)) > 0)
+                for child in tree_children(self.partition, n_comp_nodes,
+                                           fan_out)]
+        self.fan_out = fan_out
+
+        # sample the fire is burning, heartbeats are tagged with it so the
+        # headnode can drop edges of an earlier sample. Every group starts on
+        # the sample with its own number.
+        self.sample = self.group
+        self.pipelined = pipelined
+        self.max_outstanding = max(1, max_outstanding)
+        self.outstanding_heartbeats = deque()
+        self.kill_received = False
+
+        self.output = output
+        self.stitch_on = stitch_on
+        if output == "distributed":
+            self.writer = EdgeWriter(out_e)
+            self.last_heartbeat = np.empty((0, 2), dtype=np.int64)
 
     def __del__(self):
         for k, v in timer.items():
-            logging.info(f"timer {k} {v:.2f}")
+            logging.info(f"timer {k} {v:.6f}")
 
         for k, v in counter.items():
             logging.info(f"counter {k} {v}")
@@ -46,17 +175,317 @@ class ComputeNode:
     def get_machine_log(self):
         return "On Machine " + str(self.rank) + "."
 
+    def init_aggregator(self, vertex_ids):
+        """
+        Starts merging the heartbeats of the children, needs to be called
+        by the compute nodes with heartbeat_children.
+
+        vertex_ids: ids of the vertices in the original graph
+        """
+        n_ranks, partitions = 0, [self.partition]
+        while partitions:
+            n_ranks += len(partitions)
+            partitions = [child for partition in partitions
+                          for child in tree_children(
+                              partition, self.num_compute_nodes, self.fan_out)]
+        self.aggregator = HeartbeatAggregator(vertex_ids, n_ranks)
+
+    def init_fire_exchange(self, compute_comm):
+        """
+        Creates a distributed graph communicator on top of the communicator
+        of the compute nodes of the group, with an edge to every compute node that owns a
+        ghost vertex of this partition. Cut edges are stored on both sides, so
+        the neighborhoods are symmetric. Needs to be called by all compute
+        nodes after init_partition.
+
+        compute_comm: communicator of the compute nodes of the group, ranked
+                      as partition - 1
+        """
+        offset = self.rank - self.partition
+        self.compute_comm = track(
+            compute_comm, [offset + 1 + i for i in range(self.num_compute_nodes)])
+        if self.exchange != "neighbor":
+            return
+        self.neighbor_ranks = np.unique(
+            np.array(list(self.machine_with_vertex.values()), dtype=np.int64))
+        if self.halo:
+            # the ghosts beyond the halo are not ends of cut edges, so the
+            # neighborhoods are made symmetric explicitly
+            everyone = compute_comm.allgather(self.neighbor_ranks.tolist())
+            listed_by = [i + 1 for i, ranks in enumerate(everyone)
+                         if self.partition in ranks]
+            self.neighbor_ranks = np.union1d(
+                self.neighbor_ranks, np.array(listed_by, dtype=np.int64))
+        neighbors = (self.neighbor_ranks - 1).tolist()
+        self.fire_comm = track(
+            compute_comm.Create_dist_graph_adjacent(neighbors, neighbors,
+                                                    reorder=False),
+            neighbors=(self.neighbor_ranks + offset).tolist())
+        if self.track_ghost_status:
+            self.init_ghost_status()
+
+    def init_ghost_status(self):
+        """
+        Creates the bitmap of burned ghost vertices, and finds the boundary
+        of this partition: every local vertex that is a ghost on a neighbor,
+        with the slot of that neighbor in neighbor_ranks. Cut edges are
+        stored on both sides, so these are the local ends of the cut edges.
+        """
+        graph = self.partitioned_graph
+        if isinstance(graph, CSRGraph):
+            ghost_ids = graph.ldbc_ids[graph.n_local:]
+            rows = np.repeat(np.arange(graph.n_local),
+                             np.diff(graph.indptr[:graph.n_local + 1]))
+            cols = np.asarray(graph.indices[:graph.indptr[graph.n_local]],
+                              dtype=np.int64)
+            cut = cols >= graph.n_local
+            rows, ghosts = rows[cut], graph.ldbc_ids[cols[cut]]
+        else:
+            ghost_ids = np.fromiter(self.machine_with_vertex.keys(),
+                                    dtype=np.int64)
+            rows, ghosts = [], []
+            for vertex_id, neighbors in graph.v_id_to_neighbors.items():
+                for neighbor in neighbors:
+                    if not graph.vert_exists_here(neighbor):
+                        rows.append(graph.local_index(vertex_id))
+                        ghosts.append(neighbor)
+            rows = np.array(rows, dtype=np.int64)
+            ghosts = np.array(ghosts, dtype=np.int64)
+        self.ghost_status = GhostStatus(ghost_ids)
+
+        # one entry per boundary vertex and neighbor, sorted on a single key
+        n_slots = len(self.neighbor_ranks)
+        slots = np.searchsorted(self.neighbor_ranks,
+                                self.get_vertex_ranks(ghosts))
+        keys = np.unique(rows * n_slots + slots)
+        self.boundary_keys = keys
+        self.boundary_slots = keys % n_slots
+        self.boundary_vertices = keys // n_slots
+        self.boundary_ids = np.array(
+            graph.local_ids(self.boundary_vertices), dtype=np.int64)
+        self.boundary_announced = np.zeros(len(keys), dtype=bool)
+
+    def get_vertex_ranks(self, vertex_ids):
+        """Returns the ranks owning an array of remote vertices."""
+        if isinstance(self.machine_with_vertex, RankTable):
+            return self.machine_with_vertex.lookup(vertex_ids)
+        return np.array([self.machine_with_vertex[v] for v in vertex_ids.tolist()],
+                        dtype=np.int64)
+
+    def neighbor_slots(self, vertex_ids):
+        """Returns the slot in neighbor_ranks of the owner of every vertex."""
+        return np.searchsorted(self.neighbor_ranks,
+                               self.get_vertex_ranks(vertex_ids))
+
+    def exchange_with_neighbors(self, parts):
+        """
+        Sends every neighbor its vertices of every kind in parts, with one
+        sparse collective among the neighboring compute nodes only. The
+        counts per neighbor and kind are exchanged first, then the vertices
+        as int64 buffers, per neighbor ordered by kind.
+
+        parts: list of (vertex ids, slots of the neighbors to send them to),
+               one per kind
+        returns: list of (vertex ids, slots of the neighbors that sent them),
+                 one per kind
+        """
+        n_slots, n_kinds = len(self.neighbor_ranks), len(parts)
+        ids = np.concatenate([np.asarray(ids, dtype=np.int64)
+                              for ids, _ in parts])
+        slots = np.concatenate([np.asarray(slots, dtype=np.int64)
+                                for _, slots in parts])
+        kinds = np.repeat(np.arange(n_kinds), [len(ids) for ids, _ in parts])
+        send_data = ids[np.lexsort((kinds, slots))]
+        send_counts = np.bincount(slots * n_kinds + kinds,
+                                  minlength=n_kinds * n_slots)
+
+        recv_counts = np.empty(n_kinds * n_slots, dtype=np.int64)
+        self.fire_comm.Neighbor_alltoall([send_counts.astype(np.int64), MPI.INT64_T],
+                                         [recv_counts, MPI.INT64_T])
+        send_totals = send_counts.reshape(-1, n_kinds).sum(axis=1)
+        recv_totals = recv_counts.reshape(-1, n_kinds).sum(axis=1)
+        recv_data = np.empty(recv_totals.sum(), dtype=np.int64)
+        self.fire_comm.Neighbor_alltoallv(
+            [send_data, (send_totals.tolist(),
+                         (np.cumsum(send_totals) - send_totals).tolist()),
+             MPI.INT64_T],
+            [recv_data, (recv_totals.tolist(),
+                         (np.cumsum(recv_totals) - recv_totals).tolist()),
+             MPI.INT64_T])
+
+        recv_kinds = np.repeat(np.tile(np.arange(n_kinds), n_slots),
+                               recv_counts)
+        source_slots = np.repeat(np.arange(n_slots), recv_totals)
+        return [(recv_data[recv_kinds == kind], source_slots[recv_kinds == kind])
+                for kind in range(n_kinds)]
+
+    def exchange_fire_with_neighbors(self, new_edges=None):
+        """
+        Sends the remote vertices to burn to their owners and merges the
+        vertices received, see exchange_with_neighbors. With the ghost status
+        and the halo, the ghost updates and the halo claims and their
+        verdicts go along in the same exchange.
+
+        new_edges: edge set of this round, gets the speculative edges of
+                   the halo that are no longer held back
+        """
+        remote_vertices = np.array(self.fire.remote_vertices_to_burn,
+                                   dtype=np.int64)
+        if self.ghost_status is not None:
+            remote_vertices = np.unique(remote_vertices)
+            # ghost vertices known to be burned in this sample are not
+            # requested, as their owner would drop the request
+            known = self.ghost_status.burned_mask(remote_vertices)
+            counter["n_burn_requests_suppressed"] += int(known.sum())
+            remote_vertices = remote_vertices[~known]
+            # the owners burn the requested vertices, if they did not already
+            self.ghost_status.mark(remote_vertices)
+        parts = [(remote_vertices, self.neighbor_slots(remote_vertices))]
+        counter["n_bytes_in_send_burn_requests"] += remote_vertices.nbytes
+        if self.ghost_status is not None:
+            update_ids, update_slots = self.boundary_updates()
+            parts.append((update_ids, update_slots))
+            counter["n_bytes_in_ghost_updates"] += update_ids.nbytes
+        if self.halo:
+            parts.extend(self.halo_parts())
+
+        received = self.exchange_with_neighbors(parts)
+        if self.halo:
+            # claims win over requests for the same vertex in this exchange,
+            # the claimer already burned it
+            self.receive_halo(*received[-2:])
+        requests, request_slots = received[0]
+        self.fire.merge(requests.tolist())
+        if self.ghost_status is not None:
+            self.announce_requested(requests, request_slots)
+            update_ids, _ = received[1]
+            self.ghost_status.mark(update_ids)
+            self.mark_halo_burned(update_ids)
+        if self.halo and new_edges is not None:
+            self.release_speculative_edges(new_edges)
+
+    def reset_halo(self):
+        """Forgets the claims and held edges of the halo, for a new sample."""
+        # claims sent in the last exchange, without a verdict yet
+        self.halo_unresolved = np.empty(0, dtype=np.int64)
+        # claims rejected by their owners in this sample
+        self.halo_rejected = np.empty(0, dtype=np.int64)
+        # claims of the neighbors rejected here, sent in the next exchange
+        self.halo_rejections = (np.empty(0, dtype=np.int64),
+                                np.empty(0, dtype=np.int64))
+        # edges burned from halo vertices, held until their claim is accepted
+        self.held_src = np.empty(0, dtype=np.int64)
+        self.held_dst = np.empty(0, dtype=np.int64)
+
+    def halo_parts(self):
+        """
+        Returns the halo vertices burned since the last exchange, claimed at
+        their owners, and the rejections of the claims received in the last
+        exchange, as two kinds of exchange_with_neighbors.
+        """
+        claims = self.fire.take_halo_claims()
+        if self.ghost_status is not None:
+            # claims of vertices known to be burned would be rejected
+            known = self.ghost_status.burned_mask(claims)
+            self.halo_rejected = np.union1d(self.halo_rejected, claims[known])
+            claims = claims[~known]
+            self.ghost_status.mark(claims)
+        self.halo_unresolved = claims
+        counter["n_halo_claims"] += len(claims)
+        counter["n_bytes_in_halo_claims"] += claims.nbytes + \
+            self.halo_rejections[0].nbytes
+        rejections = self.halo_rejections
+        self.halo_rejections = (np.empty(0, dtype=np.int64),
+                                np.empty(0, dtype=np.int64))
+        return [(claims, self.neighbor_slots(claims)), rejections]
+
+    def receive_halo(self, claims, rejections):
+        """
+        Burns the vertices claimed by the neighbors, queues the rejected
+        claims for the next exchange, and records the rejections of the
+        claims of this compute node.
+
+        claims, rejections: (vertex ids, slots of the neighbors that sent
+                            them) as returned by exchange_with_neighbors
+        """
+        claimed, claim_slots = claims
+        rejected = self.fire.accept_claims(claimed.tolist())
+        counter["n_halo_claims_rejected"] += int(rejected.sum())
+        self.halo_rejections = (claimed[rejected], claim_slots[rejected])
+        if self.ghost_status is not None:
+            # the neighbors know the claimed vertices burn, either way
+            self.announce_requested(claimed, claim_slots)
+        self.halo_rejected = np.union1d(self.halo_rejected, rejections[0])
+
+    def release_speculative_edges(self, new_edges):
+        """
+        Adds the edges burned from halo vertices to new_edges once the claim
+        of their source was accepted. Edges of rejected claims are dropped,
+        and edges of claims without a verdict are held back.
+        """
+        src, dst = self.fire.take_speculative_edges()
+        src = np.concatenate((self.held_src, src))
+        dst = np.concatenate((self.held_dst, dst))
+        dropped = np.isin(src, self.halo_rejected)
+        held = ~dropped & np.isin(src, self.halo_unresolved)
+        released = ~dropped & ~held
+        if released.any():
+            new_edges.add_edges(src[released], dst[released])
+        counter["n_halo_edges_released"] += int(released.sum())
+        counter["n_halo_edges_dropped"] += int(dropped.sum())
+        self.held_src, self.held_dst = src[held], dst[held]
+
+    def mark_halo_burned(self, vertex_ids):
+        """Burns the halo vertices among vertex_ids in the partition graph."""
+        graph = self.partitioned_graph
+        if not getattr(graph, "n_halo", 0):
+            return
+        indices = graph.to_local(vertex_ids)
+        indices = indices[(indices >= graph.n_local) &
+                          (indices < graph.n_local + graph.n_halo)]
+        graph.status[indices] = VertexStatus.BURNED.value
+
+    def boundary_updates(self):
+        """
+        Returns the ids of the boundary vertices burned since they were last
+        announced and the slots of the neighbors to announce them to, and
+        marks them as announced. The unburned pool of the fire tells which
+        local vertices burned.
+        """
+        pool = self.fire.unburned
+        new = ~self.boundary_announced & \
+            (pool.positions[self.boundary_vertices] >= pool.size)
+        self.boundary_announced |= new
+        return self.boundary_ids[new], self.boundary_slots[new]
+
+    def announce_requested(self, vertex_ids, slots):
+        """
+        Marks boundary vertices requested by a neighbor as announced to it,
+        the neighbor knows they burn.
+        """
+        n_slots = len(self.neighbor_ranks)
+        indices = self.partitioned_graph.to_local(vertex_ids) \
+            if isinstance(self.partitioned_graph, CSRGraph) else \
+            np.array([self.partitioned_graph.local_index(v)
+                      for v in vertex_ids.tolist()], dtype=np.int64)
+        keys = indices * n_slots + slots
+        positions = np.searchsorted(self.boundary_keys, keys)
+        found = positions < len(self.boundary_keys)
+        found[found] = self.boundary_keys[positions[found]] == keys[found]
+        self.boundary_announced[positions[found]] = True
+
     def send_fire_to_remotes(self, machine_vertexes_to_receive):
         nodes_to_burn_locally = []
         logging.debug(self.get_machine_log() + " sending data")
 
+        offset = self.rank - self.partition
         for i in range(1, self.num_compute_nodes+1):
-            if i != self.rank:
+            if i != self.partition:
                 data = comm.sendrecv(machine_vertexes_to_receive[i],
-                    dest=i ,
+                    dest=i + offset,
                     sendtag=MPI_TAG.FROM_COMPUTE_TO_COMPUTE.value,
                     recvbuf=None,
-                    source=i,
+                    source=i + offset,
                     recvtag=MPI_TAG.FROM_COMPUTE_TO_COMPUTE.value,
                     status=None)
                 if len(data) > 0:
@@ -66,16 +495,98 @@ class ComputeNode:
 
     @timeit(timer=timer, counter=counter)
     def send_heartbeat(self, new_edges):
-        # this send is non-blocking
+        """
+        Sends the new edges to the headnode as a contiguous int64 buffer,
+        starting with the HEARTBEAT_FIELD header followed by (src, dest) pairs,
+        every edge in one direction only. The headnode finds the size of the
+        buffer with Probe.
+
+        When pipelined the heartbeat is sent with a synchronous Issend, so a
+        request only completes once the headnode started receiving it. At most
+        max_outstanding heartbeats are in flight, after that the oldest one is
+        waited for.
+        """
         logging.debug("sending heartbeat")
-        data = np.array(new_edges.list_rep())
+        edges = new_edges.as_array()
+        data = np.empty(HEARTBEAT_HEADER_SIZE + edges.size, dtype=np.int64)
+        data[HEARTBEAT_FIELD.SAMPLE.value] = self.sample
+        data[HEARTBEAT_FIELD.RELIGHT_COUNTER.value] = self.fire.relight_counter
+        data[HEARTBEAT_FIELD.RELIGHT_EXPONENT.value] = self.fire.relight_exponent
+        data[HEARTBEAT_FIELD.BACKLOG.value] = len(self.fire.burning_vertex_ids)
+        data[HEARTBEAT_FIELD.UNBURNED.value] = len(self.fire.unburned)
+        data[HEARTBEAT_HEADER_SIZE:] = edges.ravel()
         # record how many edges are sent
-        counter["n_edge_in_send_heartbeat"] += data.shape[0]
-        comm.send(data, dest=0, tag=MPI_TAG.HEARTBEAT.value)
-        logging.debug("heartbeat sent")
+        counter["n_edge_in_send_heartbeat"] += edges.shape[0]
+        counter["n_bytes_in_send_heartbeat"] += data.nbytes
+
+        if self.output == "distributed":
+            self.last_heartbeat = edges
+        if self.aggregator is not None:
+            data = self.aggregate_heartbeats(data[:HEARTBEAT_HEADER_SIZE],
+                                             edges)
+            comm.Send([data, MPI.INT64_T], dest=self.heartbeat_parent,
+                      tag=MPI_TAG.AGGREGATE.value)
+            logging.debug("aggregated heartbeat sent")
+            return
+        if not self.pipelined:
+            comm.Send([data, MPI.INT64_T], dest=self.heartbeat_parent,
+                      tag=MPI_TAG.HEARTBEAT.value)
+            logging.debug("heartbeat sent")
+            return
+
+        # the buffer is kept alive with its request until the send completes
+        request = comm.Issend([data, MPI.INT64_T], dest=0,
+                              tag=MPI_TAG.HEARTBEAT.value)
+        self.outstanding_heartbeats.append((request, data))
+        while self.outstanding_heartbeats and \
+                self.outstanding_heartbeats[0][0].Test():
+            self.outstanding_heartbeats.popleft()
+        start = time.perf_counter()
+        if len(self.outstanding_heartbeats) > self.max_outstanding:
+            counter["n_heartbeat_waits"] += 1
+            self.outstanding_heartbeats.popleft()[0].Wait()
+        self.step_controller.record_ack(time.perf_counter() - start)
+        logging.debug("heartbeat posted")
 
     @timeit(timer=timer, counter=counter)
-    def send_burn_requests(self):
+    def aggregate_heartbeats(self, header, edges):
+        """
+        Receives the heartbeat of every child and merges them with the own
+        heartbeat into one, see HeartbeatAggregator. Children with children
+        of their own send aggregated heartbeats, tagged AGGREGATE, the
+        others plain heartbeats. Returns the buffer to send to the parent:
+        the merged header with the AGGREGATE_FIELD fields, followed by the
+        packed keys of the new edges.
+
+        header: HEARTBEAT_FIELD header of the own heartbeat
+        edges: (n_edges, 2) array of the own edges
+        """
+        headers, pairs, keys = [header], [edges], []
+        status = MPI.Status()
+        for child, aggregates in self.heartbeat_children:
+            tag = MPI_TAG.AGGREGATE if aggregates else MPI_TAG.HEARTBEAT
+            comm.Probe(source=child, tag=tag.value, status=status)
+            data = np.empty(status.Get_count(MPI.INT64_T), dtype=np.int64)
+            comm.Recv([data, MPI.INT64_T], source=child, tag=tag.value)
+            headers.append(data[:HEARTBEAT_HEADER_SIZE])
+            if aggregates:
+                keys.append(data[HEARTBEAT_HEADER_SIZE +
+                                 AGGREGATE_HEADER_SIZE:])
+            else:
+                pairs.append(data[HEARTBEAT_HEADER_SIZE:].reshape(-1, 2))
+
+        header, keys, n_dropped = self.aggregator.merge(headers, pairs, keys)
+        counter["n_edges_aggregated"] += len(keys)
+        counter["n_duplicate_edges_dropped"] += n_dropped
+        return np.concatenate((header, keys))
+
+    @timeit(timer=timer, counter=counter)
+    def send_burn_requests(self, new_edges=None):
+        if self.fire_comm is not None:
+            self.exchange_fire_with_neighbors(new_edges)
+            self.fire.reset_remote_vertices_to_burn()
+            return
+
         remote_vertices = self.fire.remote_vertices_to_burn
         machine_vertexes_to_receive = {}
         for machine in range(0, self.num_compute_nodes+1):
@@ -84,45 +595,102 @@ class ComputeNode:
         for vert in remote_vertices:
             machine_owning_vertex = self.machine_with_vertex[vert]
             machine_vertexes_to_receive[machine_owning_vertex].append(vert)
+        # record the vertices sent as 8 byte ids, they are pickled on the wire
+        counter["n_bytes_in_send_burn_requests"] += 8 * len(remote_vertices)
 
         self.send_fire_to_remotes(machine_vertexes_to_receive)
         self.fire.reset_remote_vertices_to_burn()
 
-    def increase_fire_step(self):
-        self.fire_step = min(40, self.fire_step*2)
-        logging.debug(f"setting fire step to {self.fire_step}")
-
-    def lower_fire_step(self):
-        self.fire_step = max(10, self.fire_step/2)
-
     @timeit(timer=timer, counter=counter)
     def do_spread_steps(self, new_edges):
-        # do 10 spread steps,
+        # do fire_step spread steps, sized by the step controller,
         # new_edges are updated every spread step by the fire
-        fire_relight_exponent_old = self.fire.relight_exponent
+        start = time.perf_counter()
         for i in range(self.fire_step):
             self.fire.spread(new_edges)
-        
-        if self.fire.relight_exponent > fire_relight_exponent_old:
-            self.increase_fire_step()
-        else:
-            self.lower_fire_step()
+        self.step_controller.record_spread(self.fire_step,
+                                           time.perf_counter() - start,
+                                           len(new_edges))
+        step = self.step_controller.next_step()
+        if step != self.fire_step:
+            logging.debug(f"setting fire step to {step} in round {self.round}")
+        self.fire_step = step
+        self.round += 1
 
     @timeit(timer=timer, counter=counter)
-    def init_partition(self, path_to_edge_file):
-        for vert_1, vert_2 in self.graph_reader.read_graph_file(path_to_edge_file):
-            self.partitioned_graph.add_vertex_and_neighbor(vert_1, vert_2)
+    def init_partition(self, path_to_edge_file, partition_comm=None):
+        """
+        Loads the partition from a text edge file, or memory maps it from a
+        binary shard (.bin) written by split_partitions. A shard also contains
+        the rank of every ghost vertex, so no partition file is needed.
+
+        With shared partitions only rank 0 of partition_comm loads the
+        partition, with the ghost ranks of its partition file next to a text
+        edge file, and puts it in shared memory for the other ranks.
+
+        partition_comm: communicator of the compute nodes on this host that
+                        burn the same partition, needed for shared partitions
+        """
+        if self.shared_partitions:
+            if partition_comm.Get_rank() == 0:
+                self.load_partition_file(path_to_edge_file)
+            self.partitioned_graph.to_shared(partition_comm)
+            self.machine_with_vertex = RankTable(self.partitioned_graph)
+        elif not path_to_edge_file.endswith(".bin"):
+            self.partitioned_graph.load_edge_file(path_to_edge_file)
+        elif isinstance(self.partitioned_graph, CSRGraph):
+            shard = PartitionShard.load(path_to_edge_file)
+            self.partitioned_graph.load_shard(shard)
+            self.machine_with_vertex = RankTable(self.partitioned_graph)
+        else:
+            raise ValueError("binary partition shards need the csr graph")
+        self.fire.reset_fire()
+
+    def load_partition_file(self, path_to_edge_file):
+        """
+        Loads the partition and the rank of every ghost vertex into the csr
+        graph, from a shard or a text edge file and its partition file.
+        """
+        if path_to_edge_file.endswith(".bin"):
+            self.partitioned_graph.load_shard(
+                PartitionShard.load(path_to_edge_file))
+        else:
+            self.partitioned_graph.load_edge_file(path_to_edge_file)
+            self.partitioned_graph.load_ghost_ranks(
+                os.path.splitext(path_to_edge_file)[0] + ".p")
 
-    def reset_fire(self):
-        self.partitioned_graph.set_all_vertex_status(VertexStatus.NOT_BURNED)
+    def reset_fire(self, sample=None):
+        """
+        Starts burning the next sample, or the given sample when the headnode
+        sent its number along with the reset.
+        """
+        self.sample = self.sample + 1 if sample is None else sample
+        self.fire.reset_fire()
+        if self.ghost_status is not None:
+            self.ghost_status.reset()
+            self.boundary_announced[:] = False
+        if self.halo:
+            self.reset_halo()
+        if self.aggregator is not None:
+            self.aggregator.reset()
         self.fire.ignite_random_node()
 
     @timeit(timer=timer, counter=counter)
     def receive_from_headnode(self):
         # blocking receive from headnode.
         logging.debug("about to receive from headnode")
+        start = time.perf_counter()
+        if self.output == "distributed":
+            self.receive_accepted()
         status = MPI.Status()
-        comm.recv(source=0, tag=MPI.ANY_TAG, status=status)
+        parent = self.heartbeat_parent
+        sample = comm.recv(source=parent, tag=MPI.ANY_TAG, status=status)
+        while status.Get_tag() == MPI_TAG.IGNITE.value:
+            self.ignite(sample)
+            sample = comm.recv(source=parent, tag=MPI.ANY_TAG, status=status)
+        if self.heartbeat_children:
+            waitall([comm.isend(sample, dest=child, tag=status.Get_tag())
+                     for child, _ in self.heartbeat_children])
 
         if status.Get_tag() == MPI_TAG.CONTINUE.value:
             logging.debug("continuing")
@@ -131,30 +699,174 @@ class ComputeNode:
             self.fire.stop_burning()
             self.killed = True
         elif status.Get_tag() == MPI_TAG.RESET.value:
-            self.reset_fire()
+            self.reset_fire(sample)
+        self.step_controller.record_ack(time.perf_counter() - start)
         logging.debug("received from headnode")
 
+    def ignite(self, quota):
+        """
+        Lights quota extra fires on unburned local vertices, as handed out by
+        the headnode to ranks that still have unburned mass. A negative quota
+        is the number of relights this rank gave away, they are skipped in
+        its next relights.
+        """
+        if quota < 0:
+            self.fire.relight_debt -= quota
+            return
+        counter["n_ignitions_received"] += quota
+        self.fire.ignite_random_nodes(quota)
+
+    def receive_accepted(self):
+        """
+        Receives which edges of the last heartbeat the headnode accepted and
+        queues them for writing in both directions, self loops only once. The
+        buffer starts with the id offset of the sample the edges belong to.
+        """
+        status = MPI.Status()
+        comm.Probe(source=0, tag=MPI_TAG.ACCEPTED.value, status=status)
+        data = np.empty(status.Get_count(MPI.INT64_T), dtype=np.int64)
+        comm.Recv([data, MPI.INT64_T], source=0, tag=MPI_TAG.ACCEPTED.value)
+
+        edges = self.last_heartbeat[data[1:]] + data[0]
+        loop = edges[:, 0] == edges[:, 1]
+        self.writer.write_edges(np.concatenate((edges, edges[~loop, ::-1])))
+
+    @timeit(timer=timer, counter=counter)
+    def stitch(self):
+        """
+        Draws the share of the stitch edges the headnode handed out to this
+        compute node, as positions in the vertex arrays of the links, and
+        returns them to the headnode in bulk. See HeadNode.stitch_parallel.
+        """
+        header = np.empty(2, dtype=np.int64)
+        comm.Bcast([header, MPI.INT64_T], root=0)
+        n_links, seed = header.tolist()
+        if n_links == 0:
+            return
+        plan = np.empty((comm.Get_size() - 1, n_links, len(STITCH_FIELD)),
+                        dtype=np.int64)
+        comm.Bcast([plan, MPI.INT64_T], root=0)
+
+        rng = np.random.default_rng([seed, self.rank])
+        positions = [np.empty((0, 2), dtype=np.int64)]
+        for offset, count, n_edges, n_dest in plan[self.rank - 1].tolist():
+            if n_edges == 0:
+                continue
+            src = offset + rng.choice(count, n_edges, replace=n_edges > count)
+            dst = rng.choice(n_dest, n_edges, replace=n_edges > n_dest)
+            positions.append(np.stack((src, dst), axis=1))
+        positions = np.ascontiguousarray(np.concatenate(positions),
+                                         dtype=np.int64)
+        comm.Gatherv([positions, MPI.INT64_T], None, root=0)
+
+    def finish_output(self):
+        """
+        Waits until the edge shard is written and reports it to the headnode,
+        which lists it in the manifest.
+        """
+        self.writer.close()
+        comm.gather((self.writer.out_e, self.writer.n_edges), root=0)
+
+    @timeit(timer=timer, counter=counter)
+    def poll_headnode(self):
+        """
+        Handles the control messages of the headnode that arrived so far,
+        without blocking. Wild fires exchange burn requests, so all compute
+        nodes of the group agree on the newest sample and on being killed before acting on
+        it, otherwise burn requests would cross samples.
+        """
+        target_sample = self.sample
+        status = MPI.Status()
+        while comm.Iprobe(source=0, tag=MPI.ANY_TAG, status=status):
+            sample = comm.recv(source=0, tag=status.Get_tag())
+            if status.Get_tag() == MPI_TAG.KILL.value:
+                logging.debug(self.get_machine_log() + ".. received kill")
+                self.kill_received = True
+            elif status.Get_tag() == MPI_TAG.RESET.value:
+                target_sample = max(target_sample, sample)
+            elif status.Get_tag() == MPI_TAG.IGNITE.value:
+                self.ignite(sample)
+
+        state = np.array([target_sample, self.kill_received], dtype=np.int64)
+        if self.fires_wild and self.compute_comm is not None:
+            self.compute_comm.Allreduce(MPI.IN_PLACE, [state, MPI.INT64_T],
+                                        op=MPI.MAX)
+
+        if state[1]:
+            self.fire.stop_burning()
+            self.killed = True
+        elif state[0] > self.sample:
+            self.reset_fire(int(state[0]))
+
+    def finish_heartbeats(self):
+        """
+        Waits for the kill of the headnode and the heartbeats still in flight,
+        then tells the headnode this compute node is done.
+        """
+        while not self.kill_received:
+            status = MPI.Status()
+            comm.recv(source=0, tag=MPI.ANY_TAG, status=status)
+            self.kill_received = status.Get_tag() == MPI_TAG.KILL.value
+
+        waitall([request for request, _ in self.outstanding_heartbeats])
+        self.outstanding_heartbeats.clear()
+        comm.Send([np.empty(0, dtype=np.int64), MPI.INT64_T], dest=0,
+                  tag=MPI_TAG.DONE.value)
+
     @timeit(timer=timer, counter=counter)
     def do_tasks(self):
+        if self.pipelined:
+            self.do_tasks_pipelined()
+            return
+
         # only ignites, has not started spreading
         self.fire.ignite_random_node()
-        all_edges_sent = EdgeSet()
         while not self.killed:
-            new_edges = EdgeSet()
-            logging.debug(self.get_machine_log() + ".. num_burning vertex ids = " +
-                          str(len(self.fire.get_burning_vertex_ids())))
-            self.do_spread_steps(new_edges)
+            with profiler.span("iteration", sample=self.sample):
+                new_edges = EdgeSet()
+                logging.debug(self.get_machine_log() + ".. num_burning vertex ids = " +
+                              str(len(self.fire.get_burning_vertex_ids())))
+                self.do_spread_steps(new_edges)
 
-            if self.fires_wild:
-                self.send_burn_requests()
+                if self.fires_wild:
+                    self.send_burn_requests(new_edges)
 
-            logging.debug(self.get_machine_log() + ".. num edges sent = " +
-                          str(len(new_edges.list_rep())))
+                logging.debug(self.get_machine_log() + ".. num edges sent = " +
+                              str(len(new_edges)))
+
+                self.send_heartbeat(new_edges)
+                self.receive_from_headnode()
+
+        if self.stitch_on == "compute":
+            self.stitch()
+        if self.output == "distributed":
+            self.finish_output()
+        logging.debug("num edges sent total = " +
+                      str(counter["n_edge_in_send_heartbeat"]))
+
+    def do_tasks_pipelined(self):
+        """
+        Run loop without lockstep with the headnode: heartbeats are posted
+        without waiting for a reply and control messages are polled for.
+        """
+        self.fire.ignite_random_node()
+        while not self.killed:
+            with profiler.span("iteration", sample=self.sample):
+                new_edges = EdgeSet()
+                self.do_spread_steps(new_edges)
 
-            for edge in new_edges.edges:
-                all_edges_sent.add_edge(edge[0], edge[1])
+                if self.fires_wild:
+                    self.send_burn_requests(new_edges)
 
-            self.send_heartbeat(new_edges)
-            self.receive_from_headnode()
+                if len(new_edges) > 0:
+                    self.send_heartbeat(new_edges)
+                else:
+                    # nothing left to burn in this sample, wait for the reset
+                    time.sleep(SLEEP_TIMES.COMPUTE_NODE_LISTEN_SLEEP.value)
+                self.poll_headnode()
 
-        logging.debug("num edges sent total = " + str(len(all_edges_sent.list_rep())))
+        self.finish_heartbeats()
+        if self.stitch_on == "compute":
+            self.stitch()
+        logging.debug("num edges sent total = " +
+                      str(counter["n_edge_in_send_heartbeat"]))
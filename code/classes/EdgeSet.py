@@ -1,14 +1,56 @@
+import numpy as np
+
 
 class EdgeSet:
 
     def __init__(self):
+        """
+        Set of undirected edges. Every edge is stored once, as a (min, max)
+        pair, so it can be sent as a single int64 buffer.
+        """
         self.edges = set()
-        self.nodes = set()
+        self.chunks = []
+        # whether chunks is a single deduplicated chunk
+        self.unique = True
+
+    def __len__(self):
+        return len(self.as_array())
 
     def add_edge(self, vertex_from, vertex_to):
-        self.nodes.add(vertex_from)
-        self.nodes.add(vertex_to)
-        self.edges.update([(vertex_from, vertex_to), (vertex_to, vertex_from)])
+        self.unique = False
+        if vertex_from <= vertex_to:
+            self.edges.add((vertex_from, vertex_to))
+        else:
+            self.edges.add((vertex_to, vertex_from))
+
+    def add_edges(self, vertices_from, vertices_to):
+        """Adds the edges between two aligned sequences of vertices."""
+        vertices_from = np.asarray(vertices_from, dtype=np.int64)
+        vertices_to = np.asarray(vertices_to, dtype=np.int64)
+        self.unique = False
+        self.chunks.append(np.stack((np.minimum(vertices_from, vertices_to),
+                                     np.maximum(vertices_from, vertices_to)),
+                                    axis=1))
+
+    def as_array(self):
+        """Returns the unique edges as a C-contiguous (n_edges, 2) int64 array."""
+        if self.unique and self.chunks:
+            return self.chunks[0]
+        parts = self.chunks
+        if self.edges:
+            parts = parts + [np.array(list(self.edges), dtype=np.int64)]
+            self.edges = set()
+        if not parts:
+            return np.empty((0, 2), dtype=np.int64)
+
+        edges = np.concatenate(parts)
+        edges = edges[np.lexsort((edges[:, 1], edges[:, 0]))]
+        keep = np.ones(len(edges), dtype=bool)
+        keep[1:] = np.any(edges[1:] != edges[:-1], axis=1)
+        edges = np.ascontiguousarray(edges[keep])
+        self.chunks = [edges]
+        self.unique = True
+        return edges
 
     def list_rep(self):
-        return list(self.edges)
\ No newline at end of file
+        return self.as_array().tolist()
@@ -0,0 +1,94 @@
+import logging
+import queue
+import threading
+from TimeIt import timeit
+
+func_to_time = ["write_chunk"]
+timer = {func:0 for func in func_to_time}
+counter = {func:0 for func in func_to_time}
+
+
+class EdgeWriter:
+    def __init__(self, out_e, out_v=None, max_chunks=16):
+        """
+        Writes edges and vertices to the output files on a background thread.
+        Chunks are handed over through a bounded queue, so the caller only
+        blocks when the writer is max_chunks chunks behind. Every chunk is
+        formatted in one go and written as a single buffer.
+
+        out_e: output file for the edges, truncated on creation
+        out_v: output file for the vertices, truncated on creation, None when
+               only edges are written
+        max_chunks: maximum number of chunks waiting to be written
+        """
+        self.out_e = out_e
+        self.out_v = out_v
+        self.queue = queue.Queue(maxsize=max_chunks)
+        self.error = None
+        # number of lines queued for the edge file
+        self.n_edges = 0
+        for path in (self.out_e, self.out_v):
+            if path is not None:
+                with open(path, 'w') as f:
+                    pass
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __del__(self):
+        for k, v in timer.items():
+            logging.info(f"timer {k} {v:.6f}")
+
+        for k, v in counter.items():
+            logging.info(f"counter {k} {v}")
+
+    def _run(self):
+        files = {"edges": open(self.out_e, 'a')}
+        if self.out_v is not None:
+            files["vertices"] = open(self.out_v, 'a')
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                # after an error the queue is still drained, so the caller
+                # never blocks on a full queue
+                if self.error is not None:
+                    continue
+                try:
+                    self.write_chunk(files[item[0]], item[1])
+                except Exception as e:
+                    self.error = e
+        finally:
+            for f in files.values():
+                f.close()
+
+    @timeit(timer=timer, counter=counter)
+    def write_chunk(self, f, data):
+        """Writes the rows of a 1D or 2D integer array as lines."""
+        if data.ndim == 1:
+            line = "%d\n"
+        else:
+            line = " ".join(["%d"] * data.shape[1]) + "\n"
+        f.write(line * len(data) % tuple(data.ravel().tolist()))
+
+    def _put(self, name, data):
+        if self.error is not None:
+            raise self.error
+        if len(data) > 0:
+            self.queue.put((name, data))
+
+    def write_edges(self, edges):
+        """Queues an (n_edges, 2) array of edges for writing."""
+        self._put("edges", edges)
+        self.n_edges += len(edges)
+
+    def write_vertices(self, vertices):
+        """Queues an array of vertices for writing."""
+        self._put("vertices", vertices)
+
+    def close(self):
+        """Waits until everything queued is written."""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
@@ -18,6 +18,45 @@ class MPI_TAG(Enum):
     RESET = 4
     KILL = 5
     CONTINUE = 6
+    DONE = 7
+    ACCEPTED = 8
+    IGNITE = 9
+    AGGREGATE = 10
+
+
+class HEARTBEAT_FIELD(Enum):
+    # Heartbeats start with these int64 fields, followed by the edge pairs.
+    SAMPLE = 0
+    # State of the fire, used by the headnode for balancing ignitions.
+    RELIGHT_COUNTER = 1
+    RELIGHT_EXPONENT = 2
+    BACKLOG = 3
+    UNBURNED = 4
+
+
+HEARTBEAT_HEADER_SIZE = len(HEARTBEAT_FIELD)
+
+
+class AGGREGATE_FIELD(Enum):
+    # Aggregated heartbeats add these fields to the header, followed by
+    # packed edge keys instead of pairs.
+    RANKS = 0
+    # Vertices burned by the subtree in the sample so far.
+    VERTICES = 1
+
+
+AGGREGATE_HEADER_SIZE = len(AGGREGATE_FIELD)
+
+
+class STITCH_FIELD(Enum):
+    # Fields of the stitch plan of a compute node per link: the range of
+    # source vertices it draws from, the number of edges it draws and the
+    # number of destination vertices of the link.
+    OFFSET = 0
+    COUNT = 1
+    EDGES = 2
+    DESTINATIONS = 3
+
 
 class SLEEP_TIMES(Enum):
     COMPUTE_NODE_LISTEN_SLEEP = 0.05
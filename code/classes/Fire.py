@@ -1,10 +1,13 @@
+from collections import deque
 from typing import List
 import numpy as np
 import random
 
+from CSRGraph import CSRGraph
 from EdgeSet import EdgeSet
 from Enums import VertexStatus
 from Vertex import Vertex
+from VertexPool import VertexPool
 
 
 DO_LOG_FIRE_CLASS=True
@@ -16,19 +19,39 @@ def log(message):
 
 
 class Fire:
-    def __init__(self, compute_node, graph, fwd_burning_prob=0.7):
+    def __init__(self, compute_node, graph, fwd_burning_prob=0.7,
+                 spread_mode="vertex"):
         """
         fwd_burning_prob=0.7 is recommendation from leskovec06, so average burns
         2.33 neighbors
+
+        spread_mode: "vertex" burns a single vertex per spread step, "frontier"
+                     burns all burning vertices at once with NumPy and needs a
+                     CSRGraph
         """
+        if spread_mode == "frontier" and not isinstance(graph, CSRGraph):
+            raise ValueError("the frontier spread mode needs the csr graph")
         self.compute_node = compute_node
-        self.burning_vertex_ids = []
+        self.spread_mode = spread_mode
+        self.burning_vertex_ids = deque()
         self.received_stop_signal = False
         self.graph = graph
         self.fwd_burning_prob = fwd_burning_prob
         self.remote_vertices_to_burn = []
         self.remote_vertices_burned = set()
+        # halo vertices burned by this fire that are not claimed at their
+        # owner yet, and the edges burned from halo vertices, which are held
+        # until the owner accepted the claim
+        self.halo_claims = []
+        self.speculative_src = []
+        self.speculative_dst = []
         self.relight_counter = 0
+        # relights handed to other compute nodes by the headnode, see
+        # ComputeNode.ignite
+        self.relight_debt = 0
+        self.rng = np.random.default_rng()
+        # dense indices of the local vertices that are not burned yet
+        self.unburned = VertexPool(graph.num_local_vertices())
 
         self.relight_exponent = 4
         self.relight_backoff = 2**(self.relight_exponent + 1)
@@ -43,12 +66,36 @@ class Fire:
         neighbors_to_burn = random.sample(neighbors, n_neighbors_to_burn)
         return neighbors_to_burn
 
+    def set_vertex_status(self, vertex_id, status: VertexStatus):
+        """Sets the status in the graph and keeps the unburned pool in sync."""
+        self.graph.set_vertex_status(vertex_id, status)
+        if status != VertexStatus.NOT_BURNED:
+            index = self.graph.local_index(vertex_id)
+            if index >= 0:
+                self.unburned.discard(index)
+
+    def reset_fire(self):
+        """Marks all vertices as not burned and refills the unburned pool."""
+        self.graph.set_all_vertex_status(VertexStatus.NOT_BURNED)
+        # ghost vertices burned in the previous sample can be requested again
+        self.remote_vertices_burned.clear()
+        self.halo_claims = []
+        self.speculative_src = []
+        self.speculative_dst = []
+        self.relight_counter = 0
+        self.relight_debt = 0
+        if len(self.unburned.items) != self.graph.num_local_vertices():
+            self.unburned = VertexPool(self.graph.num_local_vertices())
+        else:
+            self.unburned.reset()
+
     def ignite_random_node(self):
-        nb_filter = lambda x: self.graph.v_id_to_status[x].status == VertexStatus.NOT_BURNED
-        not_burned_vertex_ids = filter(nb_filter, self.graph.v_id_to_status.keys())
-        not_burned_vertex_ids_lst = list(not_burned_vertex_ids)
-        if len(not_burned_vertex_ids_lst) > 0:
-            random_vertex_id = np.random.choice(not_burned_vertex_ids_lst, size=1)[0]
+        self.ignite_random_nodes(1)
+
+    def ignite_random_nodes(self, n):
+        """Ignites n distinct random unburned vertices, drawn in one call."""
+        indices = self.unburned.take_random(n, self.rng)
+        for random_vertex_id in self.graph.local_ids(indices):
             self.burning_vertex_ids.append(random_vertex_id)
             self.graph.set_vertex_status(random_vertex_id, VertexStatus.BURNED)
 
@@ -60,20 +107,28 @@ class Fire:
                 self.relight_backoff = 2**(self.relight_exponent+4)
         else:
             num_relights = 2**self.relight_exponent
-            for i in range(num_relights):
-                self.ignite_random_node()
-                # make sure to burn 16* how many nodes we lit before
-                # lowering the relight exponent
+            paid = min(num_relights, self.relight_debt)
+            self.relight_debt -= paid
+            self.ignite_random_nodes(num_relights - paid)
+            self.relight_counter += 1
+            # make sure to burn 16* how many nodes we lit before
+            # lowering the relight exponent
             self.relight_backoff = 2**(self.relight_exponent+4)
             self.relight_exponent += 1
 
     def spread(self, new_edges: EdgeSet):
+        if self.spread_mode == "frontier":
+            self.spread_frontier(new_edges)
+        else:
+            self.spread_vertex(new_edges)
+
+    def spread_vertex(self, new_edges: EdgeSet):
         # Every burn step adds new burning_vertex_ids to the
         # burning vertices list. This will maintain burning order until there
         # are no more vertices to burn on the assigned partition.
         self.fire_help()
         if len(self.burning_vertex_ids) > 0:
-            vertex_id = self.burning_vertex_ids.pop(0)
+            vertex_id = self.burning_vertex_ids.popleft()
             # log("burning vertex_id is " + str(vertex_id))
 
             neighbors = self.graph.get_neighbors_with_status(vertex_id, VertexStatus.NOT_BURNED)
@@ -81,23 +136,135 @@ class Fire:
             neighbors_to_burn = self.determine_burn_list(neighbors)
             # log("neighbors to burn are " + str(neighbors_to_burn))
 
+            # halo vertices burn speculatively, their edges are held back
+            has_halo = getattr(self.graph, "n_halo", 0) > 0
+            if has_halo and self.graph.is_halo(vertex_id):
+                add_edge = self.add_speculative_edge
+            else:
+                add_edge = new_edges.add_edge
+
             for new_burning_vertex in neighbors_to_burn:
                 # set neighbor vertex status in graph
-                self.graph.set_vertex_status(new_burning_vertex, VertexStatus.BURNING)
+                self.set_vertex_status(new_burning_vertex, VertexStatus.BURNING)
                 # always add the edge to the fire, even if the new_burning vertex is on another
                 # machine.
-                new_edges.add_edge(vertex_id, new_burning_vertex)
+                add_edge(vertex_id, new_burning_vertex)
                 self.burning_vertex_ids.append(new_burning_vertex)
-                if not self.graph.vert_exists_here(new_burning_vertex) and \
-                                    new_burning_vertex not in self.remote_vertices_burned:
+                if self.graph.vert_exists_here(new_burning_vertex):
+                    continue
+                if has_halo and self.graph.is_halo(new_burning_vertex):
+                    self.halo_claims.append(new_burning_vertex)
+                elif new_burning_vertex not in self.remote_vertices_burned:
                     # log("adding to remote_vertices_to_burn. " + str(new_burning_vertex))
                     self.remote_vertices_to_burn.append(new_burning_vertex)
 
             # there are cases where one vertex burns into two vertexes that are also
             # connected by an edge. That edge should also be included in heartbeats
             for neighbor in burned_neighbors:
-                new_edges.add_edge(vertex_id, neighbor)
-           
+                add_edge(vertex_id, neighbor)
+
+    def add_speculative_edge(self, vertex_from, vertex_to):
+        self.speculative_src.append(vertex_from)
+        self.speculative_dst.append(vertex_to)
+
+    def spread_frontier(self, new_edges: EdgeSet):
+        """
+        Burns every vertex that is currently burning in one vectorized step.
+        Per vertex, ceil(fwd_burning_prob * n) of its n not burned neighbors
+        are burned, like in spread_vertex. The subsets of the whole frontier are
+        drawn with a single random call by ranking random keys per vertex. A
+        local neighbor picked by several frontier vertices only burns from the
+        first one, as it is no longer unburned for the others.
+        """
+        self.fire_help()
+        if len(self.burning_vertex_ids) == 0:
+            return
+        graph = self.graph
+        # halo vertices burn like owned ones, but speculatively
+        n_rows = graph.n_local + graph.n_halo
+
+        # owned and halo frontier vertices in burning order, ghosts have no
+        # adjacency
+        frontier = graph.to_local(list(self.burning_vertex_ids))
+        self.burning_vertex_ids.clear()
+        frontier = frontier[(frontier >= 0) & (frontier < n_rows)]
+        _, first = np.unique(frontier, return_index=True)
+        frontier = frontier[np.sort(first)]
+
+        # same neighbor selection as get_neighbors_with_status, ghosts are
+        # always returned
+        group, neighbors = graph.gather_neighbors(frontier)
+        is_ghost = neighbors >= n_rows
+        neighbor_status = graph.status[neighbors]
+        candidate = is_ghost | (neighbor_status == VertexStatus.NOT_BURNED.value)
+        burned = is_ghost | (neighbor_status == VertexStatus.BURNED.value)
+
+        # pick the n_to_burn lowest random keys of every frontier vertex
+        cand_group, cand_neighbors = group[candidate], neighbors[candidate]
+        n_candidates = np.bincount(cand_group, minlength=len(frontier))
+        n_to_burn = np.ceil(self.fwd_burning_prob * n_candidates).astype(np.int64)
+        order = np.lexsort((self.rng.random(len(cand_group)), cand_group))
+        rank = np.arange(len(order)) - \
+            np.repeat(np.cumsum(n_candidates) - n_candidates, n_candidates)
+        chosen = np.sort(order[rank < n_to_burn[cand_group[order]]])
+        src, dst = frontier[cand_group[chosen]], cand_neighbors[chosen]
+
+        keep = dst >= n_rows
+        local_positions = np.flatnonzero(~keep)
+        _, first = np.unique(dst[local_positions], return_index=True)
+        keep[local_positions[first]] = True
+        src, dst = src[keep], dst[keep]
+
+        new_local = dst[dst < n_rows]
+        graph.status[new_local] = VertexStatus.BURNING.value
+        self.unburned.discard_many(new_local[new_local < graph.n_local])
+        self.burning_vertex_ids.extend(graph.ldbc_ids[new_local].tolist())
+        self.halo_claims.extend(
+            graph.ldbc_ids[new_local[new_local >= graph.n_local]].tolist())
+
+        for new_burning_vertex in graph.ldbc_ids[dst[dst >= n_rows]].tolist():
+            if new_burning_vertex not in self.remote_vertices_burned:
+                self.remote_vertices_to_burn.append(new_burning_vertex)
+
+        # edges to the burned neighbors are included like in spread_vertex
+        src = np.concatenate((src, frontier[group[burned]]))
+        dst = np.concatenate((dst, neighbors[burned]))
+        from_halo = src >= graph.n_local
+        if from_halo.any():
+            self.speculative_src.extend(graph.ldbc_ids[src[from_halo]].tolist())
+            self.speculative_dst.extend(graph.ldbc_ids[dst[from_halo]].tolist())
+            src, dst = src[~from_halo], dst[~from_halo]
+        new_edges.add_edges(graph.ldbc_ids[src], graph.ldbc_ids[dst])
+
+    def take_halo_claims(self):
+        """Returns the halo vertices to claim at their owners, once each."""
+        claims = np.unique(np.array(self.halo_claims, dtype=np.int64))
+        self.halo_claims = []
+        return claims
+
+    def take_speculative_edges(self):
+        """Returns the edges burned from halo vertices as (src, dst) arrays."""
+        src = np.array(self.speculative_src, dtype=np.int64)
+        dst = np.array(self.speculative_dst, dtype=np.int64)
+        self.speculative_src = []
+        self.speculative_dst = []
+        return src, dst
+
+    def accept_claims(self, claimed):
+        """
+        Burns the claimed vertices that are not burned yet, without spreading
+        from them, as the neighbor that claimed them already did. Returns for
+        every claim whether it is rejected, because the vertex burned here or
+        was claimed by another neighbor first.
+        """
+        rejected = np.zeros(len(claimed), dtype=bool)
+        for i, vert in enumerate(claimed):
+            if self.graph.get_vertex_status(vert) == VertexStatus.NOT_BURNED:
+                self.set_vertex_status(vert, VertexStatus.BURNED)
+            else:
+                rejected[i] = True
+        return rejected
+
     def reset_remote_vertices_to_burn(self):
         self.remote_vertices_burned.update(self.remote_vertices_to_burn)
         self.remote_vertices_to_burn = []
@@ -109,7 +276,7 @@ class Fire:
             if self.graph.get_vertex_status(vert) == VertexStatus.NOT_BURNED:
                 self.burning_vertex_ids.append(vert)
                 self.remote_vertices_burned.add(vert)
-                self.graph.set_vertex_status(vert, VertexStatus.BURNED)
+                self.set_vertex_status(vert, VertexStatus.BURNED)
                 num_verts_added += 1
         # log(self.compute_node.get_machine_log() + ". num burning verts added = " + str(num_verts_added))
         # log(self.compute_node.get_machine_log() + ". len(burning verts) = " + str(len(self.burning_vertex_ids)))
@@ -119,6 +286,6 @@ class Fire:
         return self.burning_vertex_ids
 
     def stop_burning(self):
-        self.burning_vertex_ids = []
+        self.burning_vertex_ids.clear()
 
 
@@ -0,0 +1,64 @@
+class FireStepController:
+    def __init__(self, target_interval=0.05, target_edges=20000, min_step=1,
+                 max_step=10000, initial_step=10, smoothing=0.5):
+        """
+        Chooses the number of spread steps of a compute node round from
+        measurements instead of fixed doubling and halving.
+
+        A round spreads for as long as the compute node would otherwise wait
+        for the headnode, at least target_interval seconds, so fast compute
+        nodes keep the pipeline full. The heartbeat of a round is capped at
+        about target_edges edges, so the headnode is not flooded and a sample
+        does not overshoot its cutoff by a large heartbeat. Measurements are
+        smoothed with an exponential moving average.
+
+        target_interval: target time between heartbeats in seconds
+        target_edges: target number of edges per heartbeat
+        min_step: minimum number of spread steps per round
+        max_step: maximum number of spread steps per round
+        initial_step: number of spread steps of the first round
+        smoothing: weight of a new measurement in the moving averages
+        """
+        self.target_interval = target_interval
+        self.target_edges = target_edges
+        self.min_step = max(1, min_step)
+        self.max_step = max(self.min_step, max_step)
+        self.step = min(max(initial_step, self.min_step), self.max_step)
+        self.smoothing = smoothing
+
+        self.seconds_per_step = None
+        self.edges_per_step = None
+        self.ack_latency = 0.0
+
+    def _average(self, old, new):
+        if old is None:
+            return new
+        return (1 - self.smoothing) * old + self.smoothing * new
+
+    def record_spread(self, n_steps, seconds, n_edges):
+        """Records the duration and number of new edges of a round."""
+        if n_steps <= 0:
+            return
+        self.seconds_per_step = self._average(self.seconds_per_step,
+                                              seconds / n_steps)
+        self.edges_per_step = self._average(self.edges_per_step,
+                                            n_edges / n_steps)
+
+    def record_ack(self, seconds):
+        """Records how long the compute node waited for the headnode."""
+        self.ack_latency = self._average(self.ack_latency, seconds)
+
+    def next_step(self):
+        """Returns the number of spread steps for the next round."""
+        interval = max(self.target_interval, self.ack_latency)
+        step = self.max_step
+        if self.seconds_per_step:
+            step = min(step, interval / self.seconds_per_step)
+        if self.edges_per_step:
+            step = min(step, self.target_edges / self.edges_per_step)
+
+        # grow at most twice as large per round, measurements of a few steps
+        # are noisy
+        self.step = int(min(max(step, self.min_step), 2 * self.step,
+                            self.max_step))
+        return self.step
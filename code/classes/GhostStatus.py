@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class GhostStatus:
+    def __init__(self, ghost_ids):
+        """
+        Bitmap of the ghost vertices of a partition that are known to be
+        burned in the current sample, one bit per ghost vertex of the
+        partition file.
+
+        ghost_ids: LDBC ids of the ghost vertices
+        """
+        self.ghost_ids = np.sort(np.asarray(ghost_ids, dtype=np.int64))
+        self.bits = np.zeros((len(self.ghost_ids) + 7) // 8, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.ghost_ids)
+
+    def _positions(self, vertex_ids):
+        """Returns the bit of every vertex and whether it is a ghost."""
+        vertex_ids = np.asarray(vertex_ids, dtype=np.int64)
+        positions = np.searchsorted(self.ghost_ids, vertex_ids)
+        found = positions < len(self.ghost_ids)
+        found[found] = self.ghost_ids[positions[found]] == vertex_ids[found]
+        return positions, found
+
+    def reset(self):
+        """Forgets all burned ghost vertices, for a new sample."""
+        self.bits[:] = 0
+
+    def mark(self, vertex_ids):
+        """Marks the ghost vertices among vertex_ids as burned."""
+        positions, found = self._positions(vertex_ids)
+        positions = positions[found]
+        np.bitwise_or.at(self.bits, positions >> 3,
+                         (1 << (positions & 7)).astype(np.uint8))
+
+    def burned_mask(self, vertex_ids):
+        """Returns for every vertex whether it is a ghost known to be burned."""
+        positions, found = self._positions(vertex_ids)
+        mask = np.zeros(len(positions), dtype=bool)
+        positions = positions[found]
+        mask[found] = (self.bits[positions >> 3] >> (positions & 7)) & 1 == 1
+        return mask
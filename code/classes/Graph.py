@@ -19,8 +19,26 @@ class Graph:
         # mapping Vertex -> [Vertex]
         self.v_id_to_status = {}
         self.v_id_to_neighbors = {}
+        # dense local index of every vertex, in order of insertion
+        self.v_id_to_index = {}
+        self.index_to_v_id = []
         self.compute_node = compute_node
 
+    def load_edge_file(self, path_to_edge_file):
+        for vert_1, vert_2 in GraphInterpreter().read_graph_file(path_to_edge_file):
+            self.add_vertex_and_neighbor(vert_1, vert_2)
+
+    def num_local_vertices(self):
+        return len(self.v_id_to_status)
+
+    def local_index(self, vertex_id: int) -> int:
+        """Returns the dense index of a local vertex, or -1."""
+        return self.v_id_to_index.get(vertex_id, -1)
+
+    def local_ids(self, indices) -> [int]:
+        """Returns the vertex ids of the given dense indices."""
+        return [self.index_to_v_id[i] for i in indices]
+
     def set_vertex_status(self, vertex_id: int, status: VertexStatus):
         if vertex_id in self.v_id_to_status:
             self.v_id_to_status[vertex_id].status = status
@@ -51,11 +69,17 @@ class Graph:
                 ret.append(vert_id)
         return ret
 
+    def get_vertex_ids_with_status(self, status: VertexStatus) -> [int]:
+        return [v_id for v_id, vertex in self.v_id_to_status.items()
+                if vertex.status == status]
+
     def add_vertex_and_neighbor(self, vertex_from: int, vertex_to: int):
         # first add vertex to status mapping
         vertex = Vertex(vertex_from, VertexStatus.NOT_BURNED)
         if vertex_from not in self.v_id_to_status:
             self.v_id_to_status[vertex_from] = vertex
+            self.v_id_to_index[vertex_from] = len(self.index_to_v_id)
+            self.index_to_v_id.append(vertex_from)
 
         # then add vertex to adjacency list
         if vertex_from in self.v_id_to_neighbors:
@@ -1,95 +1,317 @@
 import logging
+import numpy as np
 from TimeIt import timeit
+from EdgeWriter import EdgeWriter
 
 func_to_time = ["edges2file", "write2file"]
 timer = {func:0 for func in func_to_time}
 counter = {func:0 for func in func_to_time}
 
+# number of buffered edge keys after which they are deduplicated and the new
+# ones are streamed to the output
+COMPACT_SIZE = 2**20
+
+
+def dense_indices(vertex_ids, ids):
+    """
+    Returns the positions of ids in the sorted array vertex_ids, raises a
+    KeyError for ids that are not in it.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    pos = np.searchsorted(vertex_ids, ids)
+    found = pos < len(vertex_ids)
+    found[found] = vertex_ids[pos[found]] == ids[found]
+    if not found.all():
+        raise KeyError(f"vertices not in the original graph: "
+                       f"{np.unique(ids[~found])[:10].tolist()}")
+    return pos
+
+
 class HeadGraph:
-    def __init__(self, total_vertices, num_sample, out_e, out_v):
+    def __init__(self, total_vertices, num_sample, out_e, out_v,
+                 vertex_ids=None):
         """
         Graphs class used by the HeadNode, to keep track of resulting graph.
 
+        Vertices are stored as global indices, the dense index of the vertex
+        in the original graph plus sample * total_vertices. Every undirected
+        edge is packed into a single uint64 key, (min, max) of its global
+        indices, and keys are deduplicated in chunks with NumPy. Sample
+        membership is kept in a bitmap per sample. Output ids are the
+        original ids plus sample * total_vertices.
+
+        Edges are not kept until the end of a sample, whenever enough keys are
+        buffered the ones not seen before in the sample are streamed to an
+        EdgeWriter, which formats and writes them on a background thread. Only
+        the sorted keys of the samples that are not finished are kept for
+        deduplication, keys of different samples never collide so several
+        samples can be burned at the same time.
+
         total_vertices: number of vertices in the original graph
         num_sample: number of samples that it needs to track
         out_e: output file for the edges
         out_v: output file for the vertices
+        vertex_ids: ids of the vertices in the original graph, defaults to
+                    0 up to total_vertices
         """
-        self.base_id = 0
         self.total_vertices = total_vertices;
-        self.vertices = [set() for _ in range(num_sample)]
-        self.edges = set()
+        self.num_sample = num_sample
+        if vertex_ids is None:
+            vertex_ids = np.arange(total_vertices, dtype=np.int64)
+        self.vertex_ids = np.sort(np.asarray(vertex_ids, dtype=np.int64))
+
+        self.n_global = num_sample * total_vertices
+        if self.n_global ** 2 >= 2**64:
+            raise ValueError(f"{self.n_global} vertices do not fit in packed "
+                             f"edge keys")
+        # one bit per vertex and sample, least significant bit first
+        self.members = np.zeros((num_sample, (total_vertices + 7) // 8),
+                                dtype=np.uint8)
+        self.num_members = np.zeros(num_sample, dtype=np.int64)
+
+        # edge keys buffered since the last compaction
+        self.edge_chunks = []
+        self.n_buffered = 0
+        # keys of all edges of the unfinished samples written so far
+        self.seen_keys = KeySet()
+        self.cur_sample = 0
+        self.finished = np.zeros(num_sample, dtype=bool)
+
         self.out_e = out_e
         self.out_v = out_v
-        with open(self.out_e, 'w') as f:
-            pass
-        with open(self.out_v, 'w') as f:
-            pass
+        self.writer = EdgeWriter(out_e, out_v)
 
     def __del__(self):
         for k, v in timer.items():
-            logging.info(f"timer {k} {v:.2f}")
+            logging.info(f"timer {k} {v:.6f}")
 
         for k, v in counter.items():
             logging.info(f"counter {k} {v}")
 
     def get_num_sample_vertices(self, sample):
-        return len(self.vertices[sample])
+        return int(self.num_members[sample])
+
+    def get_sample_vertices(self, sample):
+        """Returns the global indices of the vertices of sample."""
+        bits = np.unpackbits(self.members[sample], bitorder="little")
+        return np.flatnonzero(bits[:self.total_vertices]) + \
+            sample * self.total_vertices
 
     def get_vertices(self):
-        return self.vertices
+        """Returns the global indices of the vertices of every sample."""
+        return [self.get_sample_vertices(sample)
+                for sample in range(self.num_sample)]
 
     def get_vertices_as_one(self):
-        """Returns the vertices as a single set."""
-        return set().union(*(self.vertices))
-
-    def add_edge(self, vertex_from, vertex_to, sample, base_id=None):
-        """
-        Adds the 2 given vertices into the graph in the correct sample, and adds
-        them as an 2 edges (both from to and to from) in the graph.
-
-        vertex_from: 1 of the vertices in the edge.
-        vertex_to: other vertices in the edge. order is abritrary since edge
-                   is added both ways
-        sample: sample vertices belong too
-        base_id: value to be added to the vertices so when upscaling no nodes
-                 are considered dublicates. if unchange defaults to the correct
-                 id for the current sample
-        """
-        if base_id == None:
-            base_id = self.base_id
-        src = vertex_from + base_id
-        dest = vertex_to + base_id
-        if sample != None:
-            self.vertices[sample].add(src)
-            self.vertices[sample].add(dest)
-        self.edges.add(f"{src} {dest}")
-        self.edges.add(f"{dest} {src}")
+        """Returns the global indices of all vertices as a single array."""
+        return np.concatenate(self.get_vertices())
+
+    def to_output_ids(self, indices):
+        """Translates global indices to the ids written to the output."""
+        samples, dense = np.divmod(indices, self.total_vertices)
+        return self.vertex_ids[dense] + samples * self.total_vertices
+
+    def _is_member(self, dense, sample):
+        """Returns for every dense index whether it is a member of sample."""
+        return (self.members[sample, dense >> 3] >> (dense & 7)) & 1 == 1
+
+    def _add_members(self, dense, sample):
+        """Marks dense indices as members of sample and updates its count."""
+        dense = np.unique(dense[~self._is_member(dense, sample)])
+        np.bitwise_or.at(self.members[sample], dense >> 3,
+                         (1 << (dense & 7)).astype(np.uint8))
+        self.num_members[sample] += len(dense)
+
+    def _keys(self, src, dst):
+        """Returns the packed keys of edges between global indices."""
+        return np.minimum(src, dst).astype(np.uint64) * \
+            np.uint64(self.n_global) + np.maximum(src, dst).astype(np.uint64)
+
+    def _add_keys(self, src, dst):
+        """Buffers the packed keys of edges between global indices."""
+        keys = self._keys(src, dst)
+        self.edge_chunks.append(keys)
+        self.n_buffered += len(keys)
+        if self.n_buffered >= COMPACT_SIZE:
+            self._compact()
+
+    def _compact(self):
+        """
+        Deduplicates the buffered edge keys and streams the ones that are new
+        to the current sample to the writer.
+        """
+        if not self.edge_chunks:
+            return
+        keys = np.unique(np.concatenate(self.edge_chunks))
+        self.edge_chunks = []
+        self.n_buffered = 0
+        self._write_edges(self.seen_keys.add_new(keys))
+
+    def _prefix_length(self, src, dst, sample, max_vertices):
+        """
+        Returns the number of leading edges after which sample has at least
+        max_vertices vertices, or all edges if it never gets there. Vertices
+        are counted edge by edge, source first.
+        """
+        dense = np.stack((src, dst), axis=1).ravel()
+        _, first = np.unique(dense, return_index=True)
+        is_new = np.zeros(len(dense), dtype=bool)
+        is_new[first] = ~self._is_member(dense[first], sample)
+        n_vertices = self.num_members[sample] + np.cumsum(is_new)[1::2]
+        reached = np.flatnonzero(n_vertices >= max_vertices)
+        return reached[0] + 1 if len(reached) > 0 else len(src)
+
+    def add_edges(self, vertices_from, vertices_to, sample, max_vertices=None):
+        """
+        Adds the edges between two aligned arrays of vertex ids of the
+        original graph to sample. With max_vertices only the shortest prefix
+        of the edges that brings the sample to max_vertices vertices is added.
+        Returns the number of edges added.
+        """
+        src = dense_indices(self.vertex_ids, vertices_from)
+        dst = dense_indices(self.vertex_ids, vertices_to)
+        return self.add_dense_edges(src, dst, sample, max_vertices)
+
+    def add_dense_edges(self, src, dst, sample, max_vertices=None):
+        """
+        Adds edges like add_edges, between two aligned arrays of dense
+        indices of vertices in the original graph.
+        """
+        if max_vertices is not None:
+            n_edges = self._prefix_length(src, dst, sample, max_vertices)
+            src = src[:n_edges]
+            dst = dst[:n_edges]
+        self._add_members(np.concatenate((src, dst)), sample)
+        offset = sample * self.total_vertices
+        self._add_keys(src + offset, dst + offset)
+        return len(src)
+
+    def accept_edges(self, vertices_from, vertices_to, sample,
+                     max_vertices=None):
+        """
+        Adds edges like add_edges, but leaves writing them to the sender.
+        Returns the sorted positions of the edges that are added and were not
+        seen before in the sample, only those should be written.
+        """
+        src = dense_indices(self.vertex_ids, vertices_from)
+        dst = dense_indices(self.vertex_ids, vertices_to)
+        if max_vertices is not None:
+            n_edges = self._prefix_length(src, dst, sample, max_vertices)
+            src = src[:n_edges]
+            dst = dst[:n_edges]
+        self._add_members(np.concatenate((src, dst)), sample)
+        offset = sample * self.total_vertices
+        keys = self._keys(src + offset, dst + offset)
+        _, first = np.unique(keys, return_index=True)
+        first = first[~self.seen_keys.contains(keys[first])]
+        self.seen_keys.add_new(keys[first])
+        return np.sort(first)
+
+    def add_stitch_edges(self, indices_from, indices_to):
+        """
+        Adds edges between two aligned arrays of global indices, as returned
+        by get_vertices, possibly of different samples.
+        """
+        self._add_keys(np.asarray(indices_from, dtype=np.int64),
+                       np.asarray(indices_to, dtype=np.int64))
 
     def next_sample(self):
+        """moves the graph to the next sample, finishing the current one."""
+        self.finish_sample(self.cur_sample)
+        self.cur_sample += 1
+
+    def finish_sample(self, sample):
         """
-        moves the graph to the next sample, needed for counting up the base id
-        and printing the edges to the file and clearing it to safe memory.
+        finishes a sample, streaming the remaining edges and the vertices of
+        the sample to the writer and dropping the seen edges of the sample to
+        safe memory. Other samples can still be burning.
         """
-        self.base_id += self.total_vertices
         self.edges2file()
-        self.edges = set()
+        self.writer.write_vertices(self.to_output_ids(
+            self.get_sample_vertices(sample)))
+        # keys of a sample start with its own global indices
+        first_key = sample * self.total_vertices * self.n_global
+        self.seen_keys.discard_range(first_key,
+                                     first_key + self.total_vertices * self.n_global)
+        self.finished[sample] = True
+
+    def _write_edges(self, keys):
+        """
+        Queues the edges of packed keys in both directions, self loops only
+        once.
+        """
+        src, dst = np.divmod(keys, np.uint64(self.n_global))
+        src = self.to_output_ids(src.astype(np.int64))
+        dst = self.to_output_ids(dst.astype(np.int64))
+        loop = src == dst
+        self.writer.write_edges(np.stack(
+            (np.concatenate((src, dst[~loop])),
+             np.concatenate((dst, src[~loop]))), axis=1))
 
     @timeit(timer=timer, counter=counter)
     def edges2file(self):
-        """prints the edges to the out_e."""
-        with open(self.out_e, 'a') as f:
-            for e in self.edges:
-                f.write(f"{e}\n")
+        """streams the buffered edges to out_e."""
+        self._compact()
 
     @timeit(timer=timer, counter=counter)
     def write2file(self):
-        """prints vertices and edges to their corresponding output files."""
-        with open(self.out_e, 'a') as f:
-            for e in self.edges:
-                f.write(f"{e}\n")
-
-        with open(self.out_v, 'a') as f:
-            for sample in self.vertices:
-                for v in sample:
-                    f.write(f"{v}\n")
+        """
+        streams the remaining edges and the vertices of the unfinished samples
+        to their output files and waits until everything is written.
+        """
+        self._compact()
+        for sample in np.flatnonzero(~self.finished):
+            self.writer.write_vertices(self.to_output_ids(
+                self.get_sample_vertices(sample)))
+        self.writer.close()
+
+
+class KeySet:
+    def __init__(self):
+        """
+        Set of uint64 keys, stored as sorted runs of decreasing size. A new
+        run is merged with the runs that are not larger, like a binary
+        counter, so adding n keys costs O(n log n) in total and a lookup does
+        one binary search per run.
+        """
+        self.runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def clear(self):
+        self.runs = []
+
+    def discard_range(self, low, high):
+        """Removes the keys in [low, high) from the set."""
+        bounds = np.array([low, high], dtype=np.uint64)
+        runs = []
+        for run in self.runs:
+            start, end = np.searchsorted(run, bounds)
+            if start < end:
+                run = np.concatenate((run[:start], run[end:]))
+            if len(run) > 0:
+                runs.append(run)
+        self.runs = runs
+
+    def contains(self, keys):
+        """Returns a boolean mask of the keys that are in the set."""
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self.runs:
+            pos = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+            found |= run[pos] == keys
+        return found
+
+    def add_new(self, keys):
+        """
+        Adds an array of unique keys and returns the ones that were not in
+        the set yet.
+        """
+        keys = keys[~self.contains(keys)]
+        run = np.sort(keys)
+        while self.runs and len(self.runs[-1]) <= len(run):
+            run = np.sort(np.concatenate((self.runs.pop(), run)),
+                          kind="mergesort")
+        if len(run) > 0:
+            self.runs.append(run)
+        return keys
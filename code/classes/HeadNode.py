@@ -1,25 +1,62 @@
 import numpy as np
+import json
 import logging
-import random
+import os
 import mpi4py
 mpi4py.rc.recv_mprobe = False
 from mpi4py import MPI
 from TimeIt import timeit
+from Profiler import profiler
+from TrackedComm import track, waitall
 
 from HeadGraph import HeadGraph
-from Enums import MPI_TAG, VertexStatus, SLEEP_TIMES
+from Stitch import draw_stitch_edges, stitch_plan, edges_from_positions
+from HeartbeatAggregator import tree_children, unpack_keys
+from Enums import MPI_TAG, HEARTBEAT_FIELD, \
+    HEARTBEAT_HEADER_SIZE, AGGREGATE_FIELD, AGGREGATE_HEADER_SIZE, \
+    STITCH_FIELD
 
-comm = MPI.COMM_WORLD
+comm = track(MPI.COMM_WORLD)
 
 # add function names here that needs timing
-func_to_time = ["run", "stitch"]
+func_to_time = ["run", "stitch", "stitch_parallel"]
 timer = {func:0 for func in func_to_time}
 counter = {func:0 for func in func_to_time}
+counter["n_stale_heartbeat"] = 0
+counter["n_ignitions_sent"] = 0
+
+
+def balance_ignitions(stats, last_relights, steal_quota):
+    """
+    Returns the number of fires every compute node in stats should light,
+    negative for fires it should give up, given their last HEARTBEAT_FIELD
+    headers and relight counters at the previous balancing round.
+    Compute nodes that relit since then, or have no burning vertices, are
+    idle and offer their next relights, capped at steal_quota, as spare
+    capacity. The capacity is handed out to all compute nodes in proportion
+    to their unburned vertices, so new fires start where unburned mass
+    remains. Each idle compute node gives up the part of its offer that went
+    to the others and skips it in its next relights.
+    """
+    unburned = stats[:, HEARTBEAT_FIELD.UNBURNED.value]
+    idle = (stats[:, HEARTBEAT_FIELD.RELIGHT_COUNTER.value] != last_relights) | \
+        (stats[:, HEARTBEAT_FIELD.BACKLOG.value] == 0)
+    exponents = np.minimum(stats[:, HEARTBEAT_FIELD.RELIGHT_EXPONENT.value], 62)
+    offers = np.where(idle, np.minimum(np.minimum(2**exponents, steal_quota),
+                                       unburned), 0)
+    if offers.sum() == 0:
+        return np.zeros(len(stats), dtype=np.int64)
+    shares = np.minimum(offers.sum() * unburned // unburned.sum(), unburned)
+    # the fires handed out are taken from the first offers
+    taken = np.clip(shares.sum() - (np.cumsum(offers) - offers), 0, offers)
+    return shares - taken
 
 
 class HeadNode:
     def __init__(self, rank, n_nodes, scale_factor, total_vertices, out_v,
-                 out_e, stitch=True, ring_stitch=True, connectivity=0.1):
+                 out_e, stitch=True, ring_stitch=True, connectivity=0.1,
+                 pipelined=False, vertex_ids=None, output="head",
+                 stitch_on="head", steal_quota=0, groups=1, fan_out=0):
         """
         Head node for the graph scaler that creates the resulting graph and
         keeps track of what works needs to be done.
@@ -33,13 +70,59 @@ class HeadNode:
         stitch: boolean whether or not it need to stitch
         ring_stitch: boolean whether to stitch in ring (True) or random (False)
         connectivity: percentages of vertices that gets edge when stitching.
+        pipelined: handle heartbeats in arrival order and only send control
+                   messages on a reset or kill, instead of replying to every
+                   compute node after each round of heartbeats
+        vertex_ids: ids of the vertices in the original graph
+        output: "head" to write all edges on the headnode, "distributed" to
+                only decide which edges of a heartbeat are accepted and let
+                every compute node write its accepted edges to its own shard
+                of out_e, listed in a manifest
+        stitch_on: "head" to stitch on the headnode, "compute" to hand out the
+                   stitch links to the compute nodes, which draw their share of
+                   the edges in parallel
+        steal_quota: maximum number of fires an idle compute node can hand
+                     over per round to compute nodes with unburned vertices,
+                     0 disables balancing
+        groups: number of groups the compute nodes are split into, every
+                group has its own replica of the partitions and burns a
+                different sample at the same time
+        fan_out: receive the heartbeats of every group through a tree with
+                 fan_out children per node, whose inner compute nodes merge
+                 the heartbeats of their subtree. The headnode only hears
+                 from, and answers, its fan_out children per group (lockstep
+                 and head output only, no balancing)
         """
+        if output == "distributed" and pipelined:
+            raise ValueError("distributed output needs lockstep heartbeats")
+        if fan_out and (pipelined or output != "head" or steal_quota > 0):
+            raise ValueError("aggregating heartbeats needs lockstep "
+                             "heartbeats, head output and no balancing")
+        if (n_nodes - 1) % groups != 0:
+            raise ValueError(f"{n_nodes - 1} compute nodes can not be split "
+                             f"into {groups} groups")
         self.rank = rank
         self.num_compute_nodes = n_nodes - 1
+        self.num_groups = groups
+        self.group_size = self.num_compute_nodes // groups
         self.total_vertices = total_vertices
         self.need_stitch = stitch
         self.connectivity = connectivity
         self.ring_stitch = ring_stitch
+        self.pipelined = pipelined
+        self.output = output
+        self.stitch_on = stitch_on
+        self.steal_quota = steal_quota
+        self.fan_out = fan_out
+        # last heartbeat header of every compute node, of its subtree when
+        # heartbeats are aggregated
+        self.rank_stats = np.zeros(
+            (n_nodes, HEARTBEAT_HEADER_SIZE + AGGREGATE_HEADER_SIZE),
+            dtype=np.int64)
+        # relight counters at the previous balancing round
+        self.balanced_relights = np.zeros(n_nodes, dtype=np.int64)
+        self.out_e = out_e
+        self.out_v = out_v
 
         # Calculates how many samples need to be created to get the scale factor
         if scale_factor <= 0.5:
@@ -59,12 +142,16 @@ class HeadNode:
         logging.debug("collecting " + str(self.cutoff_vertices) + " vertices")
         logging.debug("num samples is " + str(self.num_sample))
 
-        self.graph = HeadGraph(total_vertices, self.num_sample, out_e, out_v)
-        self.keep_burning = True
+        # with distributed output the headnode only writes the stitch edges
+        if output == "distributed":
+            out_e = f"{out_e}.{rank}"
+        self.graph = HeadGraph(total_vertices, self.num_sample, out_e, out_v,
+                               vertex_ids)
+        self.rng = np.random.default_rng()
 
     def __del__(self):
         for k, v in timer.items():
-            logging.info(f"timer {k} {v:.2f}")
+            logging.info(f"timer {k} {v:.6f}")
 
         for k, v in counter.items():
             logging.info(f"counter {k} {v}")
@@ -72,92 +159,414 @@ class HeadNode:
     @timeit(timer=timer, counter=counter)
     def run(self):
         """
-        Main run loop for the headnode, loops over samples and while burning a
-        sample handles receiving from compute nodes and send to all whether to
-        keep burning (CONTINUE), move to next sample (RESET), or shutdown if done (Kill)
-        """
-        for cur_sample in range(self.num_sample):
-            logging.debug(f"entered sampling cur_sample = {cur_sample}")
-            while self.keep_burning:
-                logging.info(f"sample {cur_sample}/{self.num_sample}, "
-                             f"prog: {self.graph.get_num_sample_vertices(cur_sample)/self.cutoff_vertices}")
-                tag = MPI_TAG.CONTINUE.value
-
-                for i in range(1, self.num_compute_nodes+1):
-                    logging.debug(f"one headnode. receiving from compute node {i}")
-                    try:
-                        data = comm.recv(source=i, tag=MPI_TAG.HEARTBEAT.value)
-                        logging.debug(data)
-
-                        if tag == MPI_TAG.CONTINUE.value:
-                            for [src, dest] in data:
-                                self.graph.add_edge(src, dest, cur_sample)
-                                if self.done_burning(cur_sample):
-                                    self.keep_burning = False
-                                    if cur_sample < self.num_sample - 1:
-                                        tag = MPI_TAG.RESET.value
-                                    else:
-                                        tag = MPI_TAG.KILL.value
-                                    break
-                    except Exception as e:
-                        logging.info(f"dropping data. exception reported")
-                        logging.info(f"{e}")
-                logging.debug("Sending tags " + str(tag) + " | RESET = 4 | KILL = 5 | CONTINUE = 6")
-
-                for i in range(1, self.num_compute_nodes+1):
-                    comm.send(None, dest=i, tag=tag)
+        Main run loop for the headnode, burns all samples on the groups of
+        compute nodes, then stitches them and writes the resulting graph.
+        """
+        self.burn_samples()
 
-            self.graph.next_sample()
-            self.keep_burning = True
+        if self.pipelined:
+            self.wait_for_compute_nodes()
 
         logging.debug("start stitch")
-        self.stitch()
+        if self.stitch_on == "compute":
+            self.stitch_parallel()
+        else:
+            self.stitch()
         logging.debug("end stitch")
         self.graph.write2file()
+        if self.output == "distributed":
+            self.write_manifest()
         logging.debug("done writing")
 
+    def burn_samples(self):
+        """
+        Handles heartbeats until all samples are burned. Every group of
+        compute nodes starts on the sample with the number of the group and
+        when its sample is done it gets the next sample that is not handed
+        out yet with a RESET, or a KILL when none are left. So groups burn
+        different samples at the same time, a single group burns them one
+        after another.
+
+        Heartbeats are received in arrival order. In lockstep a group is
+        answered with CONTINUE, RESET or KILL once all its compute nodes sent
+        a heartbeat. When pipelined a group only hears from the headnode when
+        its sample is done.
+        """
+        self.group_sample = [group if group < self.num_sample else None
+                             for group in range(self.num_groups)]
+        self.next_sample = self.num_groups
+        self.n_received = [0] * self.num_groups
+        rounds = [{} for _ in range(self.num_groups)]
+        n_active = self.num_groups
+        self.requests = []
+        if self.pipelined:
+            # groups without a sample are not waited for, in lockstep they
+            # are killed after their first round
+            for group in range(self.num_sample, self.num_groups):
+                self.requests.extend(self.send_control(group, MPI_TAG.KILL.value))
+                n_active -= 1
+
+        while n_active > 0:
+            with profiler.span("heartbeat"):
+                source, header, data = self.receive_heartbeat(MPI.ANY_SOURCE)
+                group = (source - 1) // self.group_size
+                if self.pipelined:
+                    tag = self.burn_heartbeat(group, source, header, data)
+                else:
+                    rounds[group][source] = (header, data)
+                    if len(rounds[group]) < len(self.control_ranks(group)):
+                        continue
+                    tag = self.burn_round(group, rounds[group])
+                    rounds[group] = {}
+                if tag is None:
+                    continue
+
+                logging.debug("Sending tags " + str(tag) + " | RESET = 4 | KILL = 5 | CONTINUE = 6")
+                control = self.send_control(group, tag)
+                if self.pipelined:
+                    self.requests.extend(control)
+                else:
+                    waitall(control)
+                if tag == MPI_TAG.KILL.value:
+                    n_active -= 1
+        waitall(self.requests)
+
+    def burn_round(self, group, heartbeats):
+        """
+        Adds a lockstep round of heartbeats of a group to its sample in rank
+        order and returns the tag to answer the group with. Heartbeats after
+        the one completing the sample are not added.
+
+        group: the group the heartbeats came from
+        heartbeats: (header, edges) of every compute node of the group
+        """
+        sample = self.group_sample[group]
+        tag = MPI_TAG.KILL.value
+        if sample is not None:
+            logging.info(f"sample {sample}/{self.num_sample}, "
+                         f"prog: {self.graph.get_num_sample_vertices(sample)/self.cutoff_vertices}")
+            tag = MPI_TAG.CONTINUE.value
+        accepted = {}
+
+        for i in sorted(heartbeats):
+            header, data = heartbeats[i]
+            logging.debug(data)
+            self.rank_stats[i, :len(header)] = header
+            if tag != MPI_TAG.CONTINUE.value:
+                continue
+            try:
+                accepted[i] = self.add_heartbeat(data, sample)
+                if self.done_burning(sample):
+                    tag = MPI_TAG.RESET.value
+            except Exception as e:
+                logging.info(f"dropping data. exception reported")
+                logging.info(f"{e}")
+
+        if self.output == "distributed":
+            self.send_accepted(accepted, sample or 0, self.group_ranks(group))
+        if tag == MPI_TAG.RESET.value:
+            tag = self.finish_group_sample(group)
+        elif tag == MPI_TAG.CONTINUE.value and self.steal_quota > 0:
+            waitall(self.send_ignitions(self.group_ranks(group)))
+        return tag
+
+    def burn_heartbeat(self, group, source, header, data):
+        """
+        Adds a pipelined heartbeat to the sample of its group as it arrives
+        and returns the tag to send to the group, None while the sample is not
+        done. Heartbeats of an earlier sample that were still in flight are
+        dropped.
+
+        group: the group the heartbeat came from
+        source: rank of the compute node that sent the heartbeat
+        header: HEARTBEAT_FIELD header of the heartbeat
+        data: (n_edges, 2) array of edges
+        """
+        sample = self.group_sample[group]
+        if header[HEARTBEAT_FIELD.SAMPLE.value] != sample:
+            logging.debug(f"dropping heartbeat of {source} for sample "
+                          f"{header[HEARTBEAT_FIELD.SAMPLE.value]}")
+            counter["n_stale_heartbeat"] += 1
+            return None
+
+        self.rank_stats[source, :len(header)] = header
+        try:
+            self.add_heartbeat(data, sample)
+        except Exception as e:
+            logging.info(f"dropping data. exception reported")
+            logging.info(f"{e}")
+        if self.done_burning(sample):
+            return self.finish_group_sample(group)
+
+        self.n_received[group] += 1
+        if self.n_received[group] % self.group_size == 0:
+            logging.info(f"sample {sample}/{self.num_sample}, "
+                         f"prog: {self.graph.get_num_sample_vertices(sample)/self.cutoff_vertices}")
+            if self.steal_quota > 0:
+                self.requests.extend(self.send_ignitions(self.group_ranks(group)))
+        return None
+
+    def finish_group_sample(self, group):
+        """
+        Finishes the sample of a group and hands out the next sample to it.
+        Returns RESET, or KILL when all samples are handed out.
+        """
+        sample = self.group_sample[group]
+        self.log_rank_stats(sample, self.control_ranks(group))
+        if self.fan_out:
+            self.log_aggregates(sample, self.control_ranks(group))
+        self.graph.finish_sample(sample)
+        self.n_received[group] = 0
+        if self.next_sample < self.num_sample:
+            self.group_sample[group] = self.next_sample
+            self.next_sample += 1
+            return MPI_TAG.RESET.value
+        self.group_sample[group] = None
+        return MPI_TAG.KILL.value
+
+    def send_control(self, group, tag):
+        """
+        Sends a control tag to every compute node of a group, or to the
+        roots of its trees that pass it on, carrying the sample the group
+        burns next. Returns the requests.
+        """
+        return [comm.isend(self.group_sample[group], dest=i, tag=tag)
+                for i in self.control_ranks(group)]
+
+    def control_ranks(self, group):
+        """
+        Returns the ranks of a group the headnode receives heartbeats from
+        and sends control messages to, the roots of the trees when
+        heartbeats are aggregated.
+        """
+        if not self.fan_out:
+            return self.group_ranks(group)
+        offset = group * self.group_size
+        return [offset + i for i in tree_children(0, self.group_size,
+                                                  self.fan_out)]
+
+    def group_ranks(self, group):
+        """Returns the ranks of the compute nodes of a group."""
+        return range(group * self.group_size + 1,
+                     (group + 1) * self.group_size + 1)
+
+    def add_heartbeat(self, data, cur_sample):
+        """
+        Adds the edges of a heartbeat to the current sample in bulk, up to the
+        exact edge at which the sample reaches the cutoff.
+
+        With distributed output the edges are only accepted, the positions
+        of the accepted edges are returned so the sender can write them.
+
+        data: (n_edges, 2) array of edges, or the packed edge keys of an
+              aggregated heartbeat
+        cur_sample: the current sample
+        """
+        accepted = None
+        if data.ndim == 1:
+            src, dst = unpack_keys(data, self.total_vertices)
+            self.graph.add_dense_edges(src, dst, cur_sample,
+                                       self.cutoff_vertices)
+        elif self.output == "distributed":
+            accepted = self.graph.accept_edges(data[:, 0], data[:, 1],
+                                               cur_sample, self.cutoff_vertices)
+        else:
+            self.graph.add_edges(data[:, 0], data[:, 1], cur_sample,
+                                 self.cutoff_vertices)
+        return accepted
+
+    def send_accepted(self, accepted, cur_sample, ranks):
+        """
+        Tells every compute node which edges of its last heartbeat it should
+        write, as an int64 buffer starting with the id offset of the sample
+        followed by the positions of the accepted edges.
+
+        accepted: accepted positions per compute node, nodes that are missing
+                  had their heartbeat dropped
+        cur_sample: the sample of the heartbeats
+        ranks: ranks of the compute nodes that sent the heartbeats
+        """
+        base_id = cur_sample * self.total_vertices
+        buffers = {i: np.concatenate(([base_id], accepted.get(i, []))).astype(np.int64)
+                   for i in ranks}
+        requests = [comm.Isend([data, MPI.INT64_T], dest=i,
+                               tag=MPI_TAG.ACCEPTED.value)
+                    for i, data in buffers.items()]
+        waitall(requests)
+
+    def write_manifest(self):
+        """
+        Collects the edge shards written by all nodes and lists them, with
+        their number of lines, in a JSON manifest next to the vertex file.
+        """
+        shards = comm.gather((self.graph.writer.out_e,
+                              self.graph.writer.n_edges), root=0)
+        manifest = {
+            "vertex_file": os.path.basename(self.out_v),
+            "edge_files": [{"path": os.path.basename(path), "lines": lines}
+                           for path, lines in shards]
+        }
+        path = os.path.splitext(self.out_e)[0] + ".manifest"
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=4)
+
+    def send_ignitions(self, ranks):
+        """
+        Sends the ignition quotas of a group with IGNITE, returns the
+        requests.
+        """
+        ranks = np.asarray(ranks)
+        stats = self.rank_stats[ranks]
+        quotas = balance_ignitions(stats, self.balanced_relights[ranks],
+                                   self.steal_quota)
+        self.balanced_relights[ranks] = \
+            stats[:, HEARTBEAT_FIELD.RELIGHT_COUNTER.value]
+        counter["n_ignitions_sent"] += int(quotas[quotas > 0].sum())
+        return [comm.isend(int(quota), dest=i, tag=MPI_TAG.IGNITE.value)
+                for i, quota in zip(ranks, quotas) if quota != 0]
+
+    def log_rank_stats(self, cur_sample, ranks):
+        """Logs the last reported fire state of the compute nodes of ranks."""
+        for i in ranks:
+            stats = self.rank_stats[i]
+            logging.info(
+                f"rank_stats sample={cur_sample} rank={i} "
+                f"relights={stats[HEARTBEAT_FIELD.RELIGHT_COUNTER.value]} "
+                f"relight_exponent={stats[HEARTBEAT_FIELD.RELIGHT_EXPONENT.value]} "
+                f"backlog={stats[HEARTBEAT_FIELD.BACKLOG.value]} "
+                f"unburned={stats[HEARTBEAT_FIELD.UNBURNED.value]}")
+
+    def log_aggregates(self, cur_sample, ranks):
+        """
+        Logs the vertices every tree burned in a sample, as counted by its
+        root. Trees overlap, so these add up to more than the sample.
+        """
+        for i in ranks:
+            stats = self.rank_stats[i, HEARTBEAT_HEADER_SIZE:]
+            if stats[AGGREGATE_FIELD.RANKS.value] > 0:
+                logging.info(
+                    f"aggregate sample={cur_sample} rank={i} "
+                    f"ranks={stats[AGGREGATE_FIELD.RANKS.value]} "
+                    f"vertices={stats[AGGREGATE_FIELD.VERTICES.value]}")
+
+    def wait_for_compute_nodes(self):
+        """
+        Discards the heartbeats still in flight after the kill, until every
+        compute node reported it is done.
+        """
+        n_done = 0
+        status = MPI.Status()
+        while n_done < self.num_compute_nodes:
+            comm.Probe(source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=status)
+            data = np.empty(status.Get_count(MPI.INT64_T), dtype=np.int64)
+            comm.Recv([data, MPI.INT64_T], source=status.Get_source(),
+                      tag=status.Get_tag())
+            if status.Get_tag() == MPI_TAG.DONE.value:
+                n_done += 1
+            else:
+                counter["n_stale_heartbeat"] += 1
+
+    def receive_heartbeat(self, source):
+        """
+        Receives a heartbeat and returns the rank it came from, its header
+        (see HEARTBEAT_FIELD) and its edges as an (n_edges, 2) int64 array. The
+        number of edges is found with Probe, so no size is sent along.
+
+        When heartbeats are aggregated the heartbeats of the roots of the
+        trees are tagged AGGREGATE, their header has the AGGREGATE_FIELD
+        fields as well and their edges are returned as packed keys.
+
+        source: rank of the compute node to receive from, or MPI.ANY_SOURCE
+        """
+        status = MPI.Status()
+        tag = MPI_TAG.HEARTBEAT.value if not self.fan_out else MPI.ANY_TAG
+        comm.Probe(source=source, tag=tag, status=status)
+        data = np.empty(status.Get_count(MPI.INT64_T), dtype=np.int64)
+        comm.Recv([data, MPI.INT64_T], source=status.Get_source(),
+                  tag=status.Get_tag())
+        if status.Get_tag() == MPI_TAG.AGGREGATE.value:
+            size = HEARTBEAT_HEADER_SIZE + AGGREGATE_HEADER_SIZE
+            return status.Get_source(), data[:size], data[size:]
+        return (status.Get_source(), data[:HEARTBEAT_HEADER_SIZE],
+                data[HEARTBEAT_HEADER_SIZE:].reshape(-1, 2))
+
     @timeit(timer=timer, counter=counter)
     def stitch(self):
-        """ Controls the stitching algorithms topologie. """
+        """
+        Controls the stitching algorithms topologie. Every sample is turned
+        into an array once and all edges of a link are drawn in bulk.
+        """
         if not self.need_stitch:
             return
+        for src_sample, dest_sample in self.stitch_links():
+            end = int(np.ceil(len(src_sample) * self.connectivity))
+            self.stitch_sample(src_sample, dest_sample, end)
+
+    def stitch_links(self):
+        """
+        Returns the (source, destination) vertex arrays of every link to
+        stitch. With ring stitching every sample links to the next one,
+        otherwise all vertices are linked among themselves.
+        """
+        if self.upscale and self.ring_stitch:
+            vertices = self.graph.get_vertices()
+            return [(vertices[i], vertices[(i+1) % self.num_sample])
+                    for i in range(self.num_sample)]
         if self.upscale:
-            if self.ring_stitch:
-                vertices = self.graph.get_vertices()
-                for i in range(self.num_sample):
-                    end = np.int(np.ceil(len(vertices[i])*self.connectivity))
-                    while end > 10000:
-                        self.stitch_sample(vertices[i], vertices[(i+1) % self.num_sample], 10000)
-                        end -= 10000
-                    self.stitch_sample(vertices[i], vertices[(i+1) % self.num_sample], end)
-            else:
-                sample = self.graph.get_vertices_as_one()
-                end = np.int(np.ceil(len(sample) * self.connectivity))
-                while end > 10000:
-                    self.stitch_sample(sample, sample, 10000)
-                    end -= 10000
-                self.stitch_sample(sample, sample, end)
+            sample = self.graph.get_vertices_as_one()
         else:
-            sample = self.graph.get_vertices()[0]
-            end = np.int(np.ceil(len(sample) * self.connectivity))
-            while end > 10000:
-                self.stitch_sample(sample, sample, 10000)
-                end -= 10000
-            self.stitch_sample(sample, sample, end)
+            sample = self.graph.get_sample_vertices(0)
+        return [(sample, sample)]
 
     def stitch_sample(self, src_sample, dest_sample, end):
         """
-        adds edges form the two samples to to stich the samples together
+        adds edges form the two samples to to stich the samples together.
+        Vertices are drawn without replacement when the sample is large
+        enough, self loops are dropped and duplicates are removed by the edge
+        store.
 
-        src_sample: sample to take first vertices from
-        dest_sample: sample to take second vertices from
+        src_sample: array of vertices to take first vertices from
+        dest_sample: array of vertices to take second vertices from
         end: number of edges to add
         """
-        source = random.sample(src_sample, end)
-        destination = random.sample(dest_sample, end)
-        for (src, dest) in zip(source, destination):
-            if src != dest:
-                self.graph.add_edge(src, dest, None, 0)
+        source, destination = draw_stitch_edges(self.rng, src_sample,
+                                                dest_sample, end)
+        self.graph.add_stitch_edges(source, destination)
+
+    @timeit(timer=timer, counter=counter)
+    def stitch_parallel(self):
+        """
+        Stitches on the compute nodes after the last sample. The source
+        vertices of every link are split into a range per compute node, which
+        draws its share of the edges from its range. Compute nodes only get
+        a table of (offset, count, edges, destinations) per link and a seed,
+        sent with a typed Bcast, and draw positions in the vertex arrays of
+        the links, which the headnode translates back to vertices. The drawn
+        edges are gathered in one Gatherv and deduplicated by the edge store.
+        """
+        header = np.zeros(2, dtype=np.int64)
+        if self.need_stitch:
+            links = self.stitch_links()
+            plan = stitch_plan(links, self.num_compute_nodes,
+                               self.connectivity)
+            header[:] = len(links), self.rng.integers(2**63)
+        comm.Bcast([header, MPI.INT64_T], root=0)
+        if header[0] == 0:
+            return
+        comm.Bcast([plan, MPI.INT64_T], root=0)
+
+        # positions come per compute node and link, in order, the headnode
+        # sends none
+        n_edges = plan[:, :, STITCH_FIELD.EDGES.value]
+        counts = np.concatenate(([0], 2 * n_edges.sum(axis=1)))
+        positions = np.empty(counts.sum(), dtype=np.int64)
+        comm.Gatherv([np.empty(0, dtype=np.int64), MPI.INT64_T],
+                     [positions, (counts.tolist(),
+                                  (np.cumsum(counts) - counts).tolist()),
+                      MPI.INT64_T], root=0)
+        source, destination = edges_from_positions(links, n_edges,
+                                                   positions.reshape(-1, 2))
+        self.graph.add_stitch_edges(source, destination)
 
     def done_burning(self, cur_sample):
         """
@@ -0,0 +1,100 @@
+import numpy as np
+
+from HeadGraph import KeySet, dense_indices
+from Enums import HEARTBEAT_FIELD, HEARTBEAT_HEADER_SIZE, AGGREGATE_FIELD, \
+    AGGREGATE_HEADER_SIZE
+
+
+def tree_parent(partition, fan_out):
+    """
+    Returns the partition a compute node sends its heartbeats to, 0 for the
+    headnode. Partitions are numbered from 1 in a tree of fan_out children
+    per node with the headnode as root.
+    """
+    return (partition - 1) // fan_out
+
+
+def tree_children(partition, n_partitions, fan_out):
+    """Returns the partitions sending their heartbeats to partition."""
+    return range(partition * fan_out + 1,
+                 min((partition + 1) * fan_out, n_partitions) + 1)
+
+
+def unpack_keys(keys, n_vertices):
+    """Returns the dense (src, dst) indices of packed edge keys."""
+    keys = keys.view(np.uint64)
+    return (keys // np.uint64(n_vertices)).astype(np.int64), \
+        (keys % np.uint64(n_vertices)).astype(np.int64)
+
+
+class HeartbeatAggregator:
+    def __init__(self, vertex_ids, n_ranks):
+        """
+        Merges the heartbeats of a subtree of compute nodes into one. Edges
+        are packed into a single key of the dense indices of their vertices,
+        (min, max) like the HeadGraph but without the sample offset, and
+        every edge is forwarded once per sample. The number of vertices the
+        subtree burned in the sample is kept as well.
+
+        vertex_ids: ids of the vertices in the original graph
+        n_ranks: number of compute nodes in the subtree
+        """
+        self.vertex_ids = np.sort(np.asarray(vertex_ids, dtype=np.int64))
+        self.n_vertices = len(self.vertex_ids)
+        if self.n_vertices ** 2 >= 2**63:
+            raise ValueError(f"{self.n_vertices} vertices do not fit in "
+                             f"packed edge keys")
+        self.n_ranks = n_ranks
+        self.seen_keys = KeySet()
+        self.members = np.zeros(self.n_vertices, dtype=bool)
+        self.n_members = 0
+
+    def reset(self):
+        """Forgets the edges and vertices of the sample, for a new sample."""
+        self.seen_keys.clear()
+        self.members[:] = False
+        self.n_members = 0
+
+    def pack(self, edges):
+        """Returns the packed keys of an (n_edges, 2) array of vertex ids."""
+        src = dense_indices(self.vertex_ids, edges[:, 0])
+        dst = dense_indices(self.vertex_ids, edges[:, 1])
+        return np.minimum(src, dst).astype(np.uint64) * \
+            np.uint64(self.n_vertices) + np.maximum(src, dst).astype(np.uint64)
+
+    def merge(self, headers, edges, keys):
+        """
+        Returns the header and the new keys of the merged heartbeat and the
+        number of duplicate edges dropped. Keys keep the order they arrived
+        in, so the headnode adds them in the same order.
+
+        headers: headers of the own heartbeat and of the children
+        edges: (n_edges, 2) edge arrays of heartbeats
+        keys: packed keys of aggregated heartbeats
+        """
+        keys = np.concatenate([self.pack(pairs) for pairs in edges] +
+                              [np.asarray(k).view(np.uint64) for k in keys])
+        n_received = len(keys)
+        _, first = np.unique(keys, return_index=True)
+        keys = self.seen_keys.add_new(keys[np.sort(first)])
+
+        src, dst = unpack_keys(keys, self.n_vertices)
+        dense = np.unique(np.concatenate((src, dst)))
+        self.n_members += int(np.count_nonzero(~self.members[dense]))
+        self.members[dense] = True
+
+        headers = np.asarray(headers, dtype=np.int64)
+        header = np.zeros(HEARTBEAT_HEADER_SIZE + AGGREGATE_HEADER_SIZE,
+                          dtype=np.int64)
+        header[HEARTBEAT_FIELD.SAMPLE.value] = \
+            headers[0, HEARTBEAT_FIELD.SAMPLE.value]
+        for field in (HEARTBEAT_FIELD.RELIGHT_COUNTER, HEARTBEAT_FIELD.BACKLOG,
+                      HEARTBEAT_FIELD.UNBURNED):
+            header[field.value] = headers[:, field.value].sum()
+        header[HEARTBEAT_FIELD.RELIGHT_EXPONENT.value] = \
+            headers[:, HEARTBEAT_FIELD.RELIGHT_EXPONENT.value].max()
+        header[HEARTBEAT_HEADER_SIZE + AGGREGATE_FIELD.RANKS.value] = \
+            self.n_ranks
+        header[HEARTBEAT_HEADER_SIZE + AGGREGATE_FIELD.VERTICES.value] = \
+            self.n_members
+        return header, keys.view(np.int64), n_received - len(keys)
@@ -0,0 +1,112 @@
+import struct
+import numpy as np
+
+# magic, version, index itemsize, rank, n_part, n_local, n_total, n_edges
+HEADER = struct.Struct("<8sIIiiqqq")
+# n_halo, follows the header since version 2
+HALO_HEADER = struct.Struct("<q")
+MAGIC = b"DSLPART\0"
+FORMAT_VERSION = 2
+ALIGNMENT = 8
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class PartitionShard:
+    def __init__(self, rank, n_part, n_local, ldbc_ids, sorter, indptr,
+                 indices, ghost_ranks, n_halo=0, version=FORMAT_VERSION):
+        """
+        Binary bundle of a single partition, as written by split_partitions.
+
+        The file starts with a fixed header followed by the CSR arrays of a
+        CSRGraph and the rank owning every ghost vertex. All arrays start at an
+        8 byte aligned offset, so they can be memory mapped without copying.
+
+        rank: rank of the compute node this partition belongs to
+        n_part: total number of partitions the graph was split in
+        n_local: number of vertices owned by the partition
+        ldbc_ids: LDBC id of every local index, owned vertices first
+        sorter: argsort of ldbc_ids, used for LDBC id to index lookups
+        indptr: CSR row pointers of the owned vertices, followed by the
+                halo vertices
+        indices: CSR column indices into ldbc_ids
+        ghost_ranks: rank owning each ghost index [n_local, len(ldbc_ids)),
+                     halo vertices included
+        n_halo: number of halo vertices, ghost vertices at indices
+                [n_local, n_local + n_halo) of which the adjacency is
+                replicated from their owners
+        version: format version of the file, version 1 files have no halo
+        """
+        self.rank = rank
+        self.n_part = n_part
+        self.n_local = n_local
+        self.ldbc_ids = ldbc_ids
+        self.sorter = sorter
+        self.indptr = indptr
+        self.indices = indices
+        self.ghost_ranks = ghost_ranks
+        self.n_halo = n_halo
+        self.version = version
+
+    def _layout(self):
+        """Returns (name, dtype, length, offset) for every array in the file."""
+        arrays = [("ldbc_ids", np.int64, len(self.ldbc_ids)),
+                  ("sorter", np.int64, len(self.sorter)),
+                  ("indptr", np.int64, len(self.indptr)),
+                  ("indices", self.indices.dtype, len(self.indices)),
+                  ("ghost_ranks", np.int32, len(self.ghost_ranks))]
+        layout = []
+        offset = HEADER.size
+        if self.version >= 2:
+            offset += HALO_HEADER.size
+        offset = _aligned(offset)
+        for name, dtype, length in arrays:
+            layout.append((name, dtype, length, offset))
+            offset = _aligned(offset + np.dtype(dtype).itemsize * length)
+        return layout
+
+    def write(self, path):
+        """Writes the shard to path."""
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION,
+                                self.indices.dtype.itemsize, self.rank,
+                                self.n_part, self.n_local, len(self.ldbc_ids),
+                                len(self.indices)))
+            f.write(HALO_HEADER.pack(self.n_halo))
+            for name, dtype, length, offset in self._layout():
+                f.seek(offset)
+                np.ascontiguousarray(getattr(self, name), dtype=dtype).tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        """Memory maps the shard at path read-only."""
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size + HALO_HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is not a partition shard")
+        (magic, version, index_size, rank, n_part, n_local, n_total,
+         n_edges) = HEADER.unpack(header[:HEADER.size])
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a partition shard")
+        if version not in (1, FORMAT_VERSION):
+            raise ValueError(f"{path} has shard version {version}, expected "
+                             f"{FORMAT_VERSION}")
+        n_halo = 0
+        if version >= 2:
+            n_halo, = HALO_HEADER.unpack(header[HEADER.size:])
+
+        index_type = np.int32 if index_size == 4 else np.int64
+        shard = cls(rank, n_part, n_local,
+                    np.empty(n_total, dtype=np.int64),
+                    np.empty(n_total, dtype=np.int64),
+                    np.empty(n_local + n_halo + 1, dtype=np.int64),
+                    np.empty(n_edges, dtype=index_type),
+                    np.empty(n_total - n_local, dtype=np.int32),
+                    n_halo, version)
+        for name, dtype, length, offset in shard._layout():
+            if length > 0:
+                setattr(shard, name, np.memmap(path, dtype=dtype, mode="r",
+                                               offset=offset, shape=(length,)))
+        return shard
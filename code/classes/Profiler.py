@@ -0,0 +1,244 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+# perf_counter_ns and time_ns are new in Python 3.7
+perf_counter_ns = getattr(time, "perf_counter_ns", None) or \
+    (lambda: int(time.perf_counter() * 1e9))
+time_ns = getattr(time, "time_ns", None) or (lambda: int(time.time() * 1e9))
+
+# every power of two of nanoseconds is split into 2**SUB_BITS buckets, which
+# bounds the error of a percentile to 1 / 2**(SUB_BITS + 1)
+SUB_BITS = 2
+N_BUCKETS = 64 << SUB_BITS
+PERCENTILES = (50, 90, 99)
+
+
+def bucket_index(ns):
+    """Returns the histogram bucket of a duration in nanoseconds."""
+    n_bits = ns.bit_length()
+    if n_bits <= SUB_BITS + 1:
+        return ns
+    shift = n_bits - SUB_BITS - 1
+    return ((shift + 1) << SUB_BITS) | ((ns >> shift) & ((1 << SUB_BITS) - 1))
+
+
+def bucket_bounds(index):
+    """Returns the durations [low, high) in nanoseconds of a bucket."""
+    if index < 2 << SUB_BITS:
+        return index, index + 1
+    shift = (index >> SUB_BITS) - 1
+    low = ((1 << SUB_BITS) | (index & ((1 << SUB_BITS) - 1))) << shift
+    return low, low + (1 << shift)
+
+
+class Histogram:
+    __slots__ = ["count", "total", "min", "max", "buckets"]
+
+    def __init__(self):
+        """Log-linear histogram of durations in nanoseconds."""
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.buckets = [0] * N_BUCKETS
+
+    def add(self, ns):
+        self.count += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+        self.buckets[bucket_index(ns)] += 1
+
+    def percentile(self, q):
+        """Estimates the q-th percentile in nanoseconds."""
+        if self.count == 0:
+            return 0
+        rank = max(1, int(round(q / 100 * self.count)))
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return min(max((low + high) / 2, self.min), self.max)
+        return self.max
+
+    def to_dict(self):
+        """Returns the statistics in seconds and the non-empty buckets."""
+        stats = {"count": self.count, "total": self.total / 1e9,
+                 "mean": self.total / max(self.count, 1) / 1e9,
+                 "min": (self.min or 0) / 1e9, "max": self.max / 1e9}
+        for q in PERCENTILES:
+            stats[f"p{q}"] = self.percentile(q) / 1e9
+        stats["buckets"] = {str(index): n
+                            for index, n in enumerate(self.buckets) if n}
+        return stats
+
+
+class _NullSpan:
+    """Span returned while profiling is disabled, does nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ["profiler", "name", "args", "start"]
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.profiler.spans, self.name, self.start,
+                             perf_counter_ns(), self.args)
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        """
+        Collects latency histograms of timed functions and spans, and writes
+        them with a Chrome trace of every call. Disabled until enable is
+        called, then timed functions only check the enabled flag and span
+        returns a shared span that does nothing.
+        """
+        self.enabled = False
+        self.trace = False
+        self.rank = None
+        self.functions = {}
+        self.spans = {}
+        self.events = []
+        self.registered = []
+        self.lock = threading.Lock()
+        self.flush_ns = 0
+        self.last_flush = 0
+        # offset from perf_counter_ns to the wall clock, so the traces of all
+        # ranks share a time axis
+        self.offset = 0
+        self.trace_path = None
+        self.profile_path = None
+
+    def register(self, timer, counter=None):
+        """Adds the timer and counter dicts of a module to the profile."""
+        if not any(timer is known for known, _ in self.registered):
+            self.registered.append((timer, counter))
+
+    def enable(self, path, rank, flush_interval=10.0, trace=True):
+        """
+        Starts profiling this process. The profile is written to
+        path/profile-{rank}.json and the trace to path/trace-{rank}.json
+        every flush_interval seconds and at exit, so a killed rank keeps
+        everything up to its last flush.
+
+        path: folder to write the profile and trace to
+        rank: rank of this process, used as the process id in the trace
+        flush_interval: seconds between writes of the profile and trace
+        trace: also record every call for the Chrome trace
+        """
+        self.rank = rank
+        self.trace = trace
+        self.flush_ns = int(flush_interval * 1e9)
+        self.profile_path = os.path.join(path, f"profile-{rank}.json")
+        self.offset = time_ns() - perf_counter_ns()
+        if trace:
+            # the JSON array format of the trace may end without a closing
+            # bracket, so events are only ever appended
+            self.trace_path = os.path.join(path, f"trace-{rank}.json")
+            with open(self.trace_path, "w") as f:
+                f.write("[\n")
+                f.write(json.dumps({"name": "process_name", "ph": "M",
+                                    "pid": rank, "args":
+                                    {"name": f"rank {rank}"}}) + ",\n")
+        self.last_flush = perf_counter_ns()
+        self.enabled = True
+        atexit.register(self.close)
+
+    def record(self, histograms, name, start, end, args=None):
+        """Adds a call from start to end in nanoseconds to histograms."""
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.add(end - start)
+        if self.trace:
+            self.events.append((name, start, end - start,
+                                threading.get_ident(), args))
+        if end - self.last_flush > self.flush_ns:
+            self.flush()
+
+    def record_call(self, name, start, end):
+        self.record(self.functions, name, start, end)
+
+    def span(self, name, **args):
+        """
+        Returns a context manager that records the time spent in its block
+        as a span, for example one iteration of a run loop.
+
+        name: name of the span in the profile and trace
+        args: values shown with the span in the trace
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def summary(self):
+        """Returns the timers, counters and histograms of this process."""
+        timers, counters = {}, {}
+        for timer, counter in self.registered:
+            for name, value in timer.items():
+                timers[name] = timers.get(name, 0) + value
+            for name, value in (counter or {}).items():
+                counters[name] = counters.get(name, 0) + value
+        return {"rank": self.rank, "timers": timers, "counters": counters,
+                "functions": {name: histogram.to_dict() for name, histogram
+                              in list(self.functions.items())},
+                "spans": {name: histogram.to_dict() for name, histogram
+                          in list(self.spans.items())}}
+
+    def flush(self):
+        """Appends the new trace events and rewrites the profile."""
+        with self.lock:
+            self.last_flush = perf_counter_ns()
+            events, self.events = self.events, []
+            if self.trace_path is not None and events:
+                lines = []
+                for name, start, duration, tid, args in events:
+                    event = {"name": name, "ph": "X", "pid": self.rank,
+                             "tid": tid, "ts": (start + self.offset) / 1e3,
+                             "dur": duration / 1e3}
+                    if args:
+                        event["args"] = args
+                    lines.append(json.dumps(event) + ",\n")
+                with open(self.trace_path, "a") as f:
+                    f.write("".join(lines))
+
+            # replace the profile at once, so it is never half written
+            tmp_path = f"{self.profile_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.summary(), f, indent=1)
+            os.replace(tmp_path, self.profile_path)
+
+    def close(self):
+        """Writes the profile a last time and stops profiling."""
+        if self.enabled:
+            self.flush()
+            self.enabled = False
+
+
+# profiler of this process
+profiler = Profiler()
@@ -0,0 +1,536 @@
+import pickle
+import sys
+import time
+import traceback
+import types
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+# Stand-in for the part of mpi4py.MPI the simulations use, for running all
+# ranks as processes on a single machine. Every rank has an inbox, a ring
+# buffer in shared memory that all other ranks write their messages to.
+# Buffers are copied into the ring as raw bytes, only lower case messages are
+# pickled. Messages larger than a quarter of the ring are written in chunks.
+# Sends complete as soon as the message is in the ring, a full ring blocks
+# the sender while it keeps draining its own inbox, so ranks sending to each
+# other can not deadlock.
+
+ANY_SOURCE = -2
+ANY_TAG = -1
+UNDEFINED = -32766
+COMM_TYPE_SHARED = 0
+IN_PLACE = object()
+INT64_T = np.dtype(np.int64)
+MAX = np.maximum
+MIN = np.minimum
+SUM = np.add
+
+# default size of the inbox of every rank in bytes
+RING_SIZE = 2**24
+
+# tag of the messages of collectives, user tags are never negative
+_COLLECTIVE_TAG = -100
+# record layout in the ring: length, kind, source, tag, context, payload size
+_HEADER = 6 * 8
+_PAD = 0
+_BUFFER = 1
+_PICKLE = 2
+# kind flag of a record that is followed by more chunks of the same message
+_MORE = 16
+
+_world = None
+
+
+class RingBuffer:
+    def __init__(self, name=None, size=RING_SIZE, lock=None, signal=None):
+        """
+        Multiple producer, single consumer byte ring in shared memory. The
+        first 64 bytes hold the total number of bytes written and read, the
+        records follow, every record is 8 byte aligned.
+
+        name: name of an existing ring to attach to, None creates one
+        size: capacity in bytes when creating
+        lock: lock shared by the writers
+        signal: semaphore released once for every message written
+        """
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=64 + size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.lock = lock
+        self.signal = signal
+        self.pos = np.ndarray(2, dtype=np.uint64, buffer=self.shm.buf[:16])
+        self.data = np.ndarray(self.shm.size - 64, dtype=np.uint8,
+                               buffer=self.shm.buf[64:])
+        self.capacity = len(self.data) - len(self.data) % 8
+        self.max_chunk = self.capacity // 4
+        self.partial = []
+
+    def close(self):
+        del self.pos, self.data
+        self.shm.close()
+
+    def write(self, source, tag, context, kind, payload, progress):
+        """
+        Writes a message, in chunks if it is large. While the ring is full
+        progress is called, so the writer keeps receiving.
+        """
+        payload = memoryview(payload).cast("B")
+        with self.lock:
+            offset = 0
+            while True:
+                chunk = payload[offset:offset + self.max_chunk]
+                offset += len(chunk)
+                more = _MORE if offset < len(payload) else 0
+                self._write_record((kind | more, source, tag, context,
+                                    len(chunk)), chunk, progress)
+                if not more:
+                    break
+        self.signal.release()
+
+    def _write_record(self, header, chunk, progress):
+        length = _HEADER + -(-len(chunk) // 8) * 8
+        while True:
+            written, read = int(self.pos[0]), int(self.pos[1])
+            at = written % self.capacity
+            # records never wrap, the rest of the ring is skipped instead
+            skip = self.capacity - at if self.capacity - at < length else 0
+            if self.capacity - (written - read) >= skip + length:
+                break
+            progress()
+            time.sleep(1e-5)
+
+        if skip >= _HEADER:
+            self.data[at:at + _HEADER].view(np.int64)[:] = \
+                (skip, _PAD, 0, 0, 0, 0)
+        at = (written + skip) % self.capacity
+        self.data[at:at + _HEADER].view(np.int64)[:] = (length,) + header
+        self.data[at + _HEADER:at + _HEADER + len(chunk)] = \
+            np.frombuffer(chunk, dtype=np.uint8)
+        self.pos[0] = written + skip + length
+
+    def read(self):
+        """
+        Returns the complete messages written since the last read as
+        (source, tag, context, kind, payload) tuples.
+        """
+        messages = []
+        written, read = int(self.pos[0]), int(self.pos[1])
+        while read < written:
+            at = read % self.capacity
+            if self.capacity - at < _HEADER:
+                read += self.capacity - at
+                continue
+            length, kind, source, tag, context, size = \
+                self.data[at:at + _HEADER].view(np.int64).tolist()
+            read += length
+            if kind == _PAD:
+                continue
+            self.partial.append(self.data[at + _HEADER:
+                                          at + _HEADER + size].tobytes())
+            if not kind & _MORE:
+                messages.append((source, tag, context, kind,
+                                 b"".join(self.partial)))
+                self.partial = []
+        self.pos[1] = read
+        return messages
+
+
+class _World:
+    def __init__(self, rank, inboxes):
+        """
+        Messaging state of this process: the inboxes of all ranks and the
+        messages received that did not match a receive yet.
+        """
+        self.rank = rank
+        self.inboxes = inboxes
+        self.pending = []
+        # largest context id of the communicators this process is in
+        self.last_context = 0
+
+    def send(self, dest, tag, context, kind, payload):
+        self.inboxes[dest].write(self.rank, tag, context, kind, payload,
+                                 self.progress)
+
+    def progress(self):
+        self.pending.extend(self.inboxes[self.rank].read())
+
+    def match(self, context, source, tag, block=True, remove=True):
+        """
+        Returns the first message of context from source with tag, sources
+        are world ranks. Returns None when not blocking and nothing matches.
+        """
+        checked = 0
+        while True:
+            for i in range(checked, len(self.pending)):
+                msg_source, msg_tag, msg_context = self.pending[i][:3]
+                if msg_context == context and \
+                        source in (ANY_SOURCE, msg_source) and \
+                        (tag == msg_tag or (tag == ANY_TAG and msg_tag >= 0)):
+                    return self.pending.pop(i) if remove else self.pending[i]
+            checked = len(self.pending)
+            self.progress()
+            if len(self.pending) > checked:
+                continue
+            if not block:
+                return None
+            self.inboxes[self.rank].signal.acquire(timeout=0.1)
+
+
+def _buffer(spec):
+    """Splits a buffer spec into (array, counts, displacements)."""
+    if isinstance(spec, (list, tuple)):
+        if len(spec) == 3:
+            counts, displs = spec[1]
+            return spec[0], counts, displs
+        return spec[0], None, None
+    return spec, None, None
+
+
+def _copy_into(array, payload, offset=0):
+    """Copies a raw payload into array, starting at element offset."""
+    flat = array.reshape(-1)
+    data = np.frombuffer(payload, dtype=array.dtype)
+    flat[offset:offset + len(data)] = data
+    return len(data)
+
+
+class Status:
+    def __init__(self):
+        self.source = ANY_SOURCE
+        self.tag = ANY_TAG
+        self.nbytes = 0
+
+    def Get_source(self):
+        return self.source
+
+    def Get_tag(self):
+        return self.tag
+
+    def Get_count(self, datatype=INT64_T):
+        return self.nbytes // np.dtype(datatype).itemsize
+
+
+class Request:
+    def __init__(self, result=None):
+        """Request of a send, which completes as soon as it is posted."""
+        self.result = result
+
+    def Wait(self, status=None):
+        return self.result
+
+    def Test(self, status=None):
+        return True
+
+    @staticmethod
+    def Waitall(requests, statuses=None):
+        for request in requests:
+            request.Wait()
+        return True
+
+
+class Comm:
+    def __init__(self, ranks, context):
+        """
+        Communicator over a list of world ranks, messages of different
+        communicators never match.
+
+        ranks: world rank of every rank of the communicator
+        context: id of the communicator, the same on all its ranks
+        """
+        self.ranks = list(ranks)
+        self.index = {world_rank: i for i, world_rank in enumerate(self.ranks)}
+        self.rank = self.index[_world.rank]
+        self.context = context
+
+    def Get_rank(self):
+        return self.rank
+
+    def Get_size(self):
+        return len(self.ranks)
+
+    def _send(self, dest, tag, kind, payload):
+        _world.send(self.ranks[dest], tag, self.context, kind, payload)
+
+    def _match(self, source, tag, status=None, block=True, remove=True):
+        world_source = source if source == ANY_SOURCE else self.ranks[source]
+        message = _world.match(self.context, world_source, tag, block, remove)
+        if message is not None and status is not None:
+            status.source = self.index[message[0]]
+            status.tag = message[1]
+            status.nbytes = len(message[4])
+        return message
+
+    # point to point with pickled objects
+    def send(self, obj, dest, tag=0):
+        self._send(dest, tag, _PICKLE, pickle.dumps(obj, protocol=-1))
+
+    def isend(self, obj, dest, tag=0):
+        self.send(obj, dest, tag)
+        return Request()
+
+    def recv(self, buf=None, source=ANY_SOURCE, tag=ANY_TAG, status=None):
+        return pickle.loads(self._match(source, tag, status)[4])
+
+    def sendrecv(self, sendobj, dest, sendtag=0, recvbuf=None,
+                 source=ANY_SOURCE, recvtag=ANY_TAG, status=None):
+        self.send(sendobj, dest, sendtag)
+        return self.recv(source=source, tag=recvtag, status=status)
+
+    # point to point with buffers
+    def Send(self, buf, dest, tag=0):
+        array = np.ascontiguousarray(_buffer(buf)[0])
+        self._send(dest, tag, _BUFFER, array)
+
+    def Isend(self, buf, dest, tag=0):
+        self.Send(buf, dest, tag)
+        return Request()
+
+    Issend = Isend
+
+    def Recv(self, buf, source=ANY_SOURCE, tag=ANY_TAG, status=None):
+        _copy_into(_buffer(buf)[0], self._match(source, tag, status)[4])
+
+    def Probe(self, source=ANY_SOURCE, tag=ANY_TAG, status=None):
+        self._match(source, tag, status, remove=False)
+        return True
+
+    def Iprobe(self, source=ANY_SOURCE, tag=ANY_TAG, status=None):
+        return self._match(source, tag, status, block=False,
+                           remove=False) is not None
+
+    # collectives, all built on messages with the collective tag
+    def bcast(self, obj, root=0):
+        if self.rank == root:
+            for i in range(self.Get_size()):
+                if i != root:
+                    self._send(i, _COLLECTIVE_TAG, _PICKLE,
+                               pickle.dumps(obj, protocol=-1))
+            return obj
+        return pickle.loads(self._match(root, _COLLECTIVE_TAG)[4])
+
+    def gather(self, sendobj, root=0):
+        if self.rank != root:
+            self._send(root, _COLLECTIVE_TAG, _PICKLE,
+                       pickle.dumps(sendobj, protocol=-1))
+            return None
+        return [sendobj if i == root else
+                pickle.loads(self._match(i, _COLLECTIVE_TAG)[4])
+                for i in range(self.Get_size())]
+
+    def allgather(self, sendobj):
+        return self.bcast(self.gather(sendobj, root=0), root=0)
+
+    def Barrier(self):
+        self.allgather(None)
+
+    barrier = Barrier
+
+    def Bcast(self, buf, root=0):
+        array = _buffer(buf)[0]
+        if self.rank == root:
+            for i in range(self.Get_size()):
+                if i != root:
+                    self._send(i, _COLLECTIVE_TAG, _BUFFER,
+                               np.ascontiguousarray(array))
+        else:
+            _copy_into(array, self._match(root, _COLLECTIVE_TAG)[4])
+
+    def Gatherv(self, sendbuf, recvbuf, root=0):
+        send = np.ascontiguousarray(_buffer(sendbuf)[0])
+        if self.rank != root:
+            self._send(root, _COLLECTIVE_TAG, _BUFFER, send)
+            return
+        array, _, displs = _buffer(recvbuf)
+        for i in range(self.Get_size()):
+            payload = send.tobytes() if i == root else \
+                self._match(i, _COLLECTIVE_TAG)[4]
+            _copy_into(array, payload, displs[i])
+
+    def Allreduce(self, sendbuf, recvbuf, op=SUM):
+        recv = _buffer(recvbuf)[0]
+        send = recv if sendbuf is IN_PLACE else _buffer(sendbuf)[0]
+        arrays = self.gather(np.array(send), root=0)
+        result = None
+        if self.rank == 0:
+            result = arrays[0]
+            for array in arrays[1:]:
+                result = op(result, array)
+        recv[...] = self.bcast(result, root=0)
+
+    @staticmethod
+    def _agree_context(last_contexts):
+        """
+        Returns the context id of a new communicator given the last context
+        of every rank of the parent. The id is larger than any context these
+        ranks are in, so no rank is ever in two communicators with the same
+        id. Communicators split off with different colors share the id, they
+        have no ranks in common.
+        """
+        _world.last_context = max(last_contexts) + 1
+        return _world.last_context
+
+    def Split(self, color=0, key=0):
+        members = self.allgather((color, key, self.rank, _world.last_context))
+        context = self._agree_context([m[3] for m in members])
+        if color == UNDEFINED:
+            return COMM_NULL
+        ranks = [self.ranks[m[2]] for m in sorted(members) if m[0] == color]
+        return Comm(ranks, context)
+
+    def Split_type(self, split_type, key=0, info=None):
+        # all ranks run on this machine
+        return self.Split(0, key)
+
+    def Create_dist_graph_adjacent(self, sources, destinations,
+                                   sourceweights=None, destweights=None,
+                                   info=None, reorder=False):
+        context = self._agree_context(self.allgather(_world.last_context))
+        return DistGraphComm(self.ranks, context, sources, destinations)
+
+
+class DistGraphComm(Comm):
+    def __init__(self, ranks, context, sources, destinations):
+        """Communicator with a fixed neighborhood for neighbor collectives."""
+        super().__init__(ranks, context)
+        self.sources = list(sources)
+        self.destinations = list(destinations)
+
+    def Neighbor_alltoall(self, sendbuf, recvbuf):
+        send = np.ascontiguousarray(_buffer(sendbuf)[0]).reshape(-1)
+        recv = _buffer(recvbuf)[0]
+        n = len(send) // max(1, len(self.destinations))
+        for i, dest in enumerate(self.destinations):
+            self._send(dest, _COLLECTIVE_TAG, _BUFFER, send[i*n:(i+1)*n])
+        for i, source in enumerate(self.sources):
+            _copy_into(recv, self._match(source, _COLLECTIVE_TAG)[4], i * n)
+
+    def Neighbor_alltoallv(self, sendbuf, recvbuf):
+        send, send_counts, send_displs = _buffer(sendbuf)
+        send = np.ascontiguousarray(send).reshape(-1)
+        recv, _, recv_displs = _buffer(recvbuf)
+        for dest, count, displ in zip(self.destinations, send_counts,
+                                      send_displs):
+            self._send(dest, _COLLECTIVE_TAG, _BUFFER,
+                       send[displ:displ + count])
+        for source, displ in zip(self.sources, recv_displs):
+            _copy_into(recv, self._match(source, _COLLECTIVE_TAG)[4], displ)
+
+
+class Win:
+    def __init__(self, segments, disp_unit):
+        """Shared memory window, one segment per rank of the communicator."""
+        self.segments = segments
+        self.disp_unit = disp_unit
+
+    @classmethod
+    def Allocate_shared(cls, size, disp_unit=1, info=None, comm=None):
+        """
+        Every rank with a non-zero size creates a segment, all ranks attach
+        to all segments. The segments are unlinked right away, they stay
+        mapped until the window is freed.
+        """
+        segment = None
+        if size > 0:
+            segment = shared_memory.SharedMemory(create=True, size=size)
+        names = comm.allgather(segment.name if segment else None)
+        segments = [segment if i == comm.Get_rank() else
+                    shared_memory.SharedMemory(name=name) if name else None
+                    for i, name in enumerate(names)]
+        comm.Barrier()
+        if segment is not None:
+            segment.unlink()
+        return cls(segments, disp_unit)
+
+    def Shared_query(self, rank):
+        segment = self.segments[rank]
+        return (segment.buf if segment else memoryview(bytearray()),
+                self.disp_unit)
+
+    def Free(self):
+        for segment in self.segments:
+            if segment is not None:
+                segment.close()
+
+
+COMM_NULL = None
+COMM_WORLD = None
+
+
+def Get_processor_name():
+    return multiprocessing.current_process().name
+
+
+def _install(rank, names, locks, signals):
+    """
+    Attaches to the inboxes of all ranks and makes `from mpi4py import MPI`
+    return this module, so simulations run unchanged.
+    """
+    global _world, COMM_WORLD
+    _world = _World(rank, [RingBuffer(name, lock=lock, signal=signal)
+                           for name, lock, signal in zip(names, locks,
+                                                         signals)])
+    COMM_WORLD = Comm(range(len(names)), 0)
+
+    package = types.ModuleType("mpi4py")
+    package.rc = types.SimpleNamespace(recv_mprobe=False)
+    package.MPI = sys.modules[__name__]
+    sys.modules["mpi4py"] = package
+    sys.modules["mpi4py.MPI"] = package.MPI
+
+
+def _worker(rank, names, locks, signals, target, args):
+    _install(rank, names, locks, signals)
+    try:
+        target(*args)
+    except BaseException:
+        traceback.print_exc()
+        sys.exit(1)
+    finally:
+        for inbox in _world.inboxes:
+            inbox.close()
+
+
+def launch(n_ranks, target, *args, ring_size=RING_SIZE):
+    """
+    Runs target(*args) on n_ranks processes that use this module as MPI,
+    like mpirun does. When a rank fails all others are stopped. Returns the
+    exit code.
+
+    n_ranks: number of ranks to start
+    target: function to run on every rank
+    ring_size: size of the inbox of every rank in bytes
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods
+                                          else "spawn")
+    inboxes = [RingBuffer(size=ring_size) for _ in range(n_ranks)]
+    names = [inbox.name for inbox in inboxes]
+    locks = [context.Lock() for _ in range(n_ranks)]
+    signals = [context.Semaphore(0) for _ in range(n_ranks)]
+    processes = [context.Process(target=_worker, name=f"rank-{rank}",
+                                 args=(rank, names, locks, signals, target,
+                                       args))
+                 for rank in range(n_ranks)]
+    try:
+        for process in processes:
+            process.start()
+        exit_code = 0
+        while any(process.is_alive() for process in processes):
+            failed = [process for process in processes
+                      if process.exitcode not in (None, 0)]
+            if failed:
+                exit_code = failed[0].exitcode
+                for process in processes:
+                    process.terminate()
+            time.sleep(0.05)
+        for process in processes:
+            process.join()
+            exit_code = exit_code or process.exitcode
+        return exit_code
+    finally:
+        for inbox in inboxes:
+            inbox.close()
+            inbox.shm.unlink()
@@ -0,0 +1,76 @@
+import numpy as np
+
+from Enums import STITCH_FIELD
+
+
+def draw_stitch_edges(rng, src_sample, dest_sample, n_edges):
+    """
+    Draws n_edges stitch edges between two arrays of vertices in bulk and
+    returns them as a (source, destination) pair of arrays. Vertices are drawn
+    without replacement when the sample is large enough, self loops are
+    dropped.
+
+    rng: numpy Generator to draw with
+    src_sample: array of vertices to take first vertices from
+    dest_sample: array of vertices to take second vertices from
+    n_edges: number of edges to draw
+    """
+    source = rng.choice(src_sample, n_edges, replace=n_edges > len(src_sample))
+    destination = rng.choice(dest_sample, n_edges,
+                             replace=n_edges > len(dest_sample))
+    different = source != destination
+    return source[different], destination[different]
+
+
+def stitch_plan(links, n_compute_nodes, connectivity):
+    """
+    Returns the (n_compute_nodes, n_links, STITCH_FIELD) table of the range
+    of source vertices of every compute node and link, and the number of
+    edges it draws from it. Edges are split like the sources, so a compute
+    node without sources draws no edges.
+
+    links: (source, destination) vertex arrays of the links to stitch
+    n_compute_nodes: number of compute nodes to split the links over
+    connectivity: stitch edges per source vertex
+    """
+    plan = np.zeros((n_compute_nodes, len(links), len(STITCH_FIELD)),
+                    dtype=np.int64)
+    for i, (src_sample, dest_sample) in enumerate(links):
+        bounds = np.linspace(0, len(src_sample),
+                             n_compute_nodes + 1).astype(np.int64)
+        edge_bounds = np.ceil(bounds * connectivity).astype(np.int64)
+        plan[:, i, STITCH_FIELD.OFFSET.value] = bounds[:-1]
+        plan[:, i, STITCH_FIELD.COUNT.value] = np.diff(bounds)
+        plan[:, i, STITCH_FIELD.EDGES.value] = np.diff(edge_bounds)
+        plan[:, i, STITCH_FIELD.DESTINATIONS.value] = len(dest_sample)
+    return plan
+
+
+def edges_from_positions(links, n_edges, positions):
+    """
+    Translates the positions drawn by the compute nodes back to vertices and
+    returns the stitch edges as a (source, destination) pair of arrays, self
+    loops are dropped.
+
+    links: (source, destination) vertex arrays of the links to stitch
+    n_edges: (n_compute_nodes, n_links) array of the edges every compute
+             node drew per link
+    positions: (n_edges, 2) array of positions in the vertex arrays of the
+               links, per compute node and link in order
+    """
+    link_of = np.repeat(np.tile(np.arange(len(links)), len(n_edges)),
+                        n_edges.ravel())
+    # translate all links at once, in the vertex arrays laid end to end
+    src_samples, dest_samples = zip(*links)
+    source = np.concatenate(src_samples)[
+        positions[:, 0] + _offsets(src_samples)[link_of]]
+    destination = np.concatenate(dest_samples)[
+        positions[:, 1] + _offsets(dest_samples)[link_of]]
+    different = source != destination
+    return source[different], destination[different]
+
+
+def _offsets(arrays):
+    """Returns where every array starts when they are concatenated."""
+    lengths = np.array([len(array) for array in arrays], dtype=np.int64)
+    return np.cumsum(lengths) - lengths
@@ -1,22 +1,28 @@
 import logging
-import time
 from functools import wraps
+from Profiler import profiler, perf_counter_ns
 
 def timeit(func=None, timer=None, counter=None):
     def actual_decorator(f):
+        name = f.__qualname__
+        if timer is not None:
+            profiler.register(timer, counter)
+
         @wraps(f)
         def wrapper(*args, **kwargs):
-            start = time.time()
+            start = perf_counter_ns()
             result = f(*args, **kwargs)
-            end = time.time()
+            end = perf_counter_ns()
             if timer:
-                timer[f"{f.__name__}"] += round(end - start, 2)
+                timer[f"{f.__name__}"] += (end - start) / 1e9
                 if counter:
                     counter[f"{f.__name__}"] += 1
             else:
-                logging.info(f"timer {func.__name__} {end - start:.2f}")
+                logging.info(f"timer {f.__name__} {(end - start) / 1e9:.6f}")
+            if profiler.enabled:
+                profiler.record_call(name, start, end)
             return result
         return wrapper
     if func:
         return actual_decorator(func)
-    return actual_decorator
\ No newline at end of file
+    return actual_decorator
@@ -0,0 +1,346 @@
+import json
+import os
+import pickle
+import time
+import numpy as np
+import mpi4py
+mpi4py.rc.recv_mprobe = False
+from mpi4py import MPI
+
+from Enums import MPI_TAG
+
+# peer of collectives and of waits on several requests at once
+ANY_PEER = -1
+
+
+def tag_name(tag):
+    """Returns the MPI_TAG name of a tag, collectives are named by call."""
+    try:
+        return MPI_TAG(tag).name
+    except ValueError:
+        return str(tag)
+
+
+def buffer_nbytes(spec):
+    """Returns the size of a buffer given as an array or [array, ...]."""
+    if isinstance(spec, (list, tuple)):
+        spec = spec[0]
+    return getattr(spec, "nbytes", 0)
+
+
+def pickled_nbytes(obj):
+    """Returns the size of an object as sent by the lowercase calls."""
+    return len(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+
+class CommTracker:
+    def __init__(self):
+        """
+        Counts the messages, bytes and blocked time of the tracked
+        communicators of this process, by direction, tag and peer.
+        """
+        self.enabled = False
+        # (direction, tag, world rank of the peer) ->
+        # [messages, bytes, blocked seconds]
+        self.stats = {}
+
+    def add(self, direction, tag, peer, nbytes=0, blocked=0.0, messages=1):
+        """
+        Records a message or a wait.
+
+        direction: "sent", "received" or "collective"
+        tag: name of the tag, or of the call for collectives
+        peer: world rank of the peer, or ANY_PEER
+        nbytes: bytes of the message
+        blocked: seconds the call blocked
+        messages: number of messages, 0 for waits
+        """
+        key = (direction, tag, peer)
+        entry = self.stats.get(key)
+        if entry is None:
+            entry = self.stats[key] = [0, 0, 0.0]
+        entry[0] += messages
+        entry[1] += nbytes
+        entry[2] += blocked
+
+    def summary(self):
+        """Returns the totals of this process by tag and by peer."""
+        by_tag, by_peer = {}, {}
+        for (direction, tag, peer), (messages, nbytes, blocked) in \
+                self.stats.items():
+            for totals, key in ((by_tag, tag), (by_peer, str(peer))):
+                total = totals.setdefault(key, {
+                    "sent_messages": 0, "sent_bytes": 0,
+                    "received_messages": 0, "received_bytes": 0,
+                    "collective_calls": 0, "collective_bytes": 0,
+                    "blocked": 0.0})
+                total[f"{direction}_messages" if direction != "collective"
+                      else "collective_calls"] += messages
+                total[f"{direction}_bytes"] += nbytes
+                total["blocked"] += blocked
+        return {"by_tag": by_tag, "by_peer": by_peer}
+
+    def write(self, path, comm):
+        """
+        Writes the totals of this process to path/comm-{rank}.json, and on
+        rank 0 the traffic matrices of the job to path/comm_matrix.json.
+        Needs to be called by all ranks of comm.
+
+        path: folder to write to
+        comm: untracked world communicator
+        """
+        rank, size = comm.Get_rank(), comm.Get_size()
+        summary = self.summary()
+        with open(os.path.join(path, f"comm-{rank}.json"), "w") as f:
+            json.dump({"rank": rank, **summary}, f, indent=1)
+
+        sent = [(peer, messages, nbytes) for (direction, _, peer),
+                (messages, nbytes, _) in self.stats.items()
+                if direction == "sent" and peer != ANY_PEER]
+        blocked = sum(entry[2] for entry in self.stats.values())
+        rows = comm.gather((sent, blocked, summary["by_tag"]), root=0)
+        if rank != 0:
+            return
+
+        # rows are senders, columns receivers
+        messages = np.zeros((size, size), dtype=np.int64)
+        nbytes = np.zeros((size, size), dtype=np.int64)
+        by_tag = {}
+        for src, (row, _, tags) in enumerate(rows):
+            for dest, n_messages, n_bytes in row:
+                messages[src, dest] += n_messages
+                nbytes[src, dest] += n_bytes
+            for tag, totals in tags.items():
+                job_totals = by_tag.setdefault(tag, dict.fromkeys(totals, 0))
+                for name, value in totals.items():
+                    job_totals[name] += value
+        with open(os.path.join(path, "comm_matrix.json"), "w") as f:
+            json.dump({"ranks": size, "messages": messages.tolist(),
+                       "bytes": nbytes.tolist(),
+                       "blocked": [row[1] for row in rows],
+                       "by_tag": by_tag}, f, indent=1)
+
+
+# tracker of this process
+tracker = CommTracker()
+
+
+class TrackedRequest:
+    def __init__(self, request, direction, tag, peer):
+        """Request of a tracked non-blocking call, records its waits."""
+        self.request = request
+        self.direction = direction
+        self.tag = tag
+        self.peer = peer
+
+    def Wait(self, status=None):
+        start = time.perf_counter()
+        result = self.request.Wait(status)
+        tracker.add(self.direction, self.tag, self.peer, messages=0,
+                    blocked=time.perf_counter() - start)
+        return result
+
+    def Test(self, status=None):
+        return self.request.Test(status)
+
+
+def waitall(requests):
+    """
+    Waits for all requests, tracked or not. The time blocked is shared
+    evenly by the tracked requests.
+    """
+    tracked = [request for request in requests
+               if isinstance(request, TrackedRequest)]
+    if not tracked:
+        MPI.Request.Waitall(requests)
+        return
+    start = time.perf_counter()
+    MPI.Request.Waitall([getattr(request, "request", request)
+                         for request in requests])
+    blocked = (time.perf_counter() - start) / len(tracked)
+    for request in tracked:
+        tracker.add(request.direction, request.tag, request.peer, messages=0,
+                    blocked=blocked)
+
+
+def track(comm, ranks=None, neighbors=None):
+    """
+    Returns the communicator wrapped in a TrackedComm while tracking is
+    enabled, and the communicator itself otherwise.
+
+    comm: communicator to track
+    ranks: world rank of every rank of comm, None for the world communicator
+    neighbors: world ranks of the neighbors of a distributed graph
+               communicator, in the order of its sources and destinations
+    """
+    if not tracker.enabled:
+        return comm
+    return TrackedComm(comm, ranks, neighbors)
+
+
+class TrackedComm:
+    def __init__(self, comm, ranks=None, neighbors=None):
+        """
+        Communicator that records the messages, bytes and blocked time of
+        the calls used by the nodes in the tracker, other calls are passed
+        on untracked. See track.
+        """
+        self.comm = comm
+        self.ranks = ranks
+        self.neighbors = neighbors
+
+    def __getattr__(self, name):
+        return getattr(self.comm, name)
+
+    def world(self, rank):
+        """Returns the world rank of a rank of this communicator."""
+        if rank < 0:
+            return ANY_PEER
+        return self.ranks[rank] if self.ranks is not None else rank
+
+    def Send(self, buf, dest, tag=0):
+        start = time.perf_counter()
+        self.comm.Send(buf, dest=dest, tag=tag)
+        tracker.add("sent", tag_name(tag), self.world(dest),
+                    buffer_nbytes(buf), time.perf_counter() - start)
+
+    def Isend(self, buf, dest, tag=0):
+        return self._post(self.comm.Isend(buf, dest=dest, tag=tag), dest,
+                          tag, buffer_nbytes(buf))
+
+    def Issend(self, buf, dest, tag=0):
+        return self._post(self.comm.Issend(buf, dest=dest, tag=tag), dest,
+                          tag, buffer_nbytes(buf))
+
+    def send(self, obj, dest, tag=0):
+        start = time.perf_counter()
+        self.comm.send(obj, dest=dest, tag=tag)
+        tracker.add("sent", tag_name(tag), self.world(dest),
+                    pickled_nbytes(obj), time.perf_counter() - start)
+
+    def isend(self, obj, dest, tag=0):
+        return self._post(self.comm.isend(obj, dest=dest, tag=tag), dest,
+                          tag, pickled_nbytes(obj))
+
+    def _post(self, request, dest, tag, nbytes):
+        tracker.add("sent", tag_name(tag), self.world(dest), nbytes)
+        return TrackedRequest(request, "sent", tag_name(tag),
+                              self.world(dest))
+
+    def Recv(self, buf, source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=None):
+        status = status if status is not None else MPI.Status()
+        start = time.perf_counter()
+        self.comm.Recv(buf, source=source, tag=tag, status=status)
+        tracker.add("received", tag_name(status.Get_tag()),
+                    self.world(status.Get_source()), buffer_nbytes(buf),
+                    time.perf_counter() - start)
+
+    def recv(self, buf=None, source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG,
+             status=None):
+        status = status if status is not None else MPI.Status()
+        start = time.perf_counter()
+        obj = self.comm.recv(buf, source=source, tag=tag, status=status)
+        tracker.add("received", tag_name(status.Get_tag()),
+                    self.world(status.Get_source()), pickled_nbytes(obj),
+                    time.perf_counter() - start)
+        return obj
+
+    def Probe(self, source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=None):
+        status = status if status is not None else MPI.Status()
+        start = time.perf_counter()
+        self.comm.Probe(source=source, tag=tag, status=status)
+        tracker.add("received", tag_name(status.Get_tag()),
+                    self.world(status.Get_source()), messages=0,
+                    blocked=time.perf_counter() - start)
+
+    def sendrecv(self, sendobj, dest, sendtag=0, recvbuf=None,
+                 source=MPI.ANY_SOURCE, recvtag=MPI.ANY_TAG, status=None):
+        status = status if status is not None else MPI.Status()
+        start = time.perf_counter()
+        obj = self.comm.sendrecv(sendobj, dest=dest, sendtag=sendtag,
+                                 recvbuf=recvbuf, source=source,
+                                 recvtag=recvtag, status=status)
+        # the call blocks until the message of the peer arrives
+        tracker.add("sent", tag_name(sendtag), self.world(dest),
+                    pickled_nbytes(sendobj))
+        tracker.add("received", tag_name(status.Get_tag()),
+                    self.world(status.Get_source()), pickled_nbytes(obj),
+                    time.perf_counter() - start)
+        return obj
+
+    def _collective(self, name, nbytes, start):
+        tracker.add("collective", name, ANY_PEER, nbytes,
+                    time.perf_counter() - start)
+
+    def bcast(self, obj, root=0):
+        # pickled once on the root and sent as bytes, so the size is known
+        # without pickling the object again just to count it
+        start = time.perf_counter()
+        is_root = self.comm.Get_rank() == root
+        size = np.zeros(1, dtype=np.int64)
+        if is_root:
+            data = np.frombuffer(bytearray(
+                pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)), dtype=np.uint8)
+            size[0] = len(data)
+        self.comm.Bcast(size, root=root)
+        if not is_root:
+            data = np.empty(size[0], dtype=np.uint8)
+        self.comm.Bcast(data, root=root)
+        if not is_root:
+            obj = pickle.loads(data)
+        self._collective("bcast", int(size[0]), start)
+        return obj
+
+    def Bcast(self, buf, root=0):
+        start = time.perf_counter()
+        self.comm.Bcast(buf, root=root)
+        self._collective("Bcast", buffer_nbytes(buf), start)
+
+    def gather(self, sendobj, root=0):
+        start = time.perf_counter()
+        result = self.comm.gather(sendobj, root=root)
+        self._collective("gather", pickled_nbytes(sendobj), start)
+        return result
+
+    def Gatherv(self, sendbuf, recvbuf, root=0):
+        start = time.perf_counter()
+        self.comm.Gatherv(sendbuf, recvbuf, root=root)
+        self._collective("Gatherv", buffer_nbytes(sendbuf), start)
+
+    def Allreduce(self, sendbuf, recvbuf, op=MPI.SUM):
+        start = time.perf_counter()
+        self.comm.Allreduce(sendbuf, recvbuf, op=op)
+        self._collective("Allreduce", buffer_nbytes(recvbuf), start)
+
+    def Barrier(self):
+        start = time.perf_counter()
+        self.comm.Barrier()
+        self._collective("Barrier", 0, start)
+
+    def _neighbor_nbytes(self, spec):
+        """Returns the bytes per neighbor of a neighbor collective buffer."""
+        data = spec[0]
+        if len(spec) == 3:
+            return [count * data.itemsize for count in spec[1][0]]
+        return [data.nbytes // max(len(self.neighbors), 1)] * \
+            len(self.neighbors)
+
+    def _neighbor_collective(self, name, sendbuf, recvbuf, start):
+        self._collective(name, 0, start)
+        for peer, sent, received in zip(self.neighbors,
+                                        self._neighbor_nbytes(sendbuf),
+                                        self._neighbor_nbytes(recvbuf)):
+            tracker.add("sent", name, peer, sent)
+            tracker.add("received", name, peer, received)
+
+    def Neighbor_alltoall(self, sendbuf, recvbuf):
+        start = time.perf_counter()
+        self.comm.Neighbor_alltoall(sendbuf, recvbuf)
+        self._neighbor_collective("Neighbor_alltoall", sendbuf, recvbuf,
+                                  start)
+
+    def Neighbor_alltoallv(self, sendbuf, recvbuf):
+        start = time.perf_counter()
+        self.comm.Neighbor_alltoallv(sendbuf, recvbuf)
+        self._neighbor_collective("Neighbor_alltoallv", sendbuf, recvbuf,
+                                  start)
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class VertexPool:
+    def __init__(self, size):
+        """
+        Indexed pool of local vertex indices [0, size) that supports O(1)
+        random picks, removals and membership tests.
+
+        items holds a permutation of all indices, of which the first `size`
+        are in the pool. positions maps every index to its place in items, so
+        a removal swaps the index with the last one in the pool and an empty
+        pool is refilled by resetting the size.
+        """
+        self.items = np.arange(size, dtype=np.int64)
+        self.positions = np.arange(size, dtype=np.int64)
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, index):
+        return self.positions[index] < self.size
+
+    def reset(self):
+        """Puts all indices back in the pool."""
+        self.size = len(self.items)
+
+    def discard(self, index):
+        """Removes index from the pool if it is in there."""
+        pos = self.positions[index]
+        if pos >= self.size:
+            return
+        last = self.size - 1
+        last_index = self.items[last]
+        self.items[pos] = last_index
+        self.positions[last_index] = pos
+        self.items[last] = index
+        self.positions[index] = last
+        self.size = last
+
+    def discard_many(self, indices):
+        """Removes an array of indices from the pool in bulk."""
+        indices = np.unique(np.asarray(indices, dtype=np.int64))
+        indices = indices[self.positions[indices] < self.size]
+        if len(indices) == 0:
+            return
+        new_size = self.size - len(indices)
+
+        # indices in the tail that stay in the pool fill the holes left by
+        # removed indices in front of the new size
+        holes = self.positions[indices]
+        holes = holes[holes < new_size]
+        tail = self.items[new_size:self.size]
+        movers = tail[~np.isin(tail, indices, assume_unique=True)]
+        self.items[holes] = movers
+        self.positions[movers] = holes
+
+        self.items[new_size:self.size] = indices
+        self.positions[indices] = np.arange(new_size, self.size)
+        self.size = new_size
+
+    def take_random(self, n, rng):
+        """
+        Removes and returns n distinct random indices, or all remaining ones
+        when the pool holds fewer. All picks are drawn with a single call.
+        """
+        if n >= self.size:
+            picked = self.items[:self.size].copy()
+            self.size = 0
+            return picked
+        picked = self.items[rng.choice(self.size, size=n, replace=False)]
+        self.discard_many(picked)
+        return picked
@@ -1,20 +1,34 @@
-# Load packages.
-import mpi4py
-mpi4py.rc.recv_mprobe = False
-from mpi4py import MPI
+# Load packages. mpi4py is only loaded once the backend is known, as the shm
+# backend provides its own MPI module.
 import importlib.util
 import argparse
+import logging
+import resource
 import sys
 import os
 
-# Setup globals for each process.
-comm = MPI.COMM_WORLD
-size = comm.Get_size()
-rank = comm.Get_rank()
+# Optional arguments that are passed on to the HeadNode and ComputeNodes.
+HEAD_OPTIONS = ["pipelined", "output", "stitch_on", "steal_quota", "groups",
+                "fan_out"]
+COMPUTE_OPTIONS = ["graph", "spread", "exchange", "pipelined",
+                   "max_outstanding", "output", "stitch_on", "step_interval",
+                   "step_edges", "min_step", "max_step", "groups",
+                   "shared_partitions", "ghost_status", "halo", "fan_out"]
 
 
-def parse_args():
-    """Parses given arguments when calling a simulation."""
+def parse_backend():
+    """Finds the requested backend without parsing the other arguments."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--backend", choices=["mpi", "shm"], default="mpi")
+    return parser.parse_known_args()[0].backend
+
+
+def parse_args(size=None):
+    """
+    Parses given arguments when calling a simulation.
+
+    size: number of MPI processes, None when the shm backend starts them
+    """
     parser = argparse.\
         ArgumentParser(description="Process input for execution of simulation.")
     parser.add_argument("simpath", type=str,
@@ -36,9 +50,121 @@ def parse_args():
                         help="Path to the runtime folder with datasets")
     parser.add_argument("tmp_res", type=str,
                         help="Path to the runtime results folder")
+    parser.add_argument("--graph", choices=["dict", "csr"], default="dict",
+                        help="Partition graph implementation used by the "
+                             "compute nodes")
+    parser.add_argument("--spread", choices=["vertex", "frontier"],
+                        default="vertex",
+                        help="Burn a single vertex or a whole frontier level "
+                             "per spread step, frontier needs --graph csr")
+    parser.add_argument("--exchange", choices=["neighbor", "sendrecv"],
+                        default="neighbor",
+                        help="Exchange burn requests of wild fires with a "
+                             "sparse neighborhood collective or a sendrecv "
+                             "with every compute node")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Let compute nodes keep burning while their "
+                             "heartbeats are in flight, the headnode handles "
+                             "heartbeats in arrival order")
+    parser.add_argument("--max-outstanding", type=int, default=4,
+                        help="Maximum number of heartbeats in flight per "
+                             "compute node with --pipelined")
+    parser.add_argument("--output", choices=["head", "distributed"],
+                        default="head",
+                        help="Write all edges on the headnode, or let every "
+                             "compute node write the edges the headnode "
+                             "accepted to its own shard, listed in "
+                             "scaled_graph.manifest")
+    parser.add_argument("--stitch-on", choices=["head", "compute"],
+                        default="head",
+                        help="Stitch the samples on the headnode, or let the "
+                             "compute nodes draw the stitch edges in parallel")
+    parser.add_argument("--step-interval", type=float, default=0.05,
+                        help="Target time in seconds between the heartbeats "
+                             "of a compute node")
+    parser.add_argument("--step-edges", type=int, default=20000,
+                        help="Target number of edges per heartbeat")
+    parser.add_argument("--min-step", type=int, default=1,
+                        help="Minimum number of spread steps per round")
+    parser.add_argument("--max-step", type=int, default=10000,
+                        help="Maximum number of spread steps per round")
+    parser.add_argument("--steal-quota", type=int, default=0,
+                        help="Maximum number of fires an idle compute node "
+                             "hands over per round to compute nodes with "
+                             "unburned vertices, 0 disables work stealing")
+    parser.add_argument("--groups", type=int, default=1,
+                        help="Split the compute nodes into groups that each "
+                             "burn a different sample at the same time on "
+                             "their own replica of the partitions, the "
+                             "dataset needs to be partitioned for the compute "
+                             "nodes per group")
+    parser.add_argument("--fan-out", type=int, default=0,
+                        help="Send heartbeats up a tree with this many "
+                             "children per node, whose inner compute nodes "
+                             "merge the heartbeats of their subtree, so the "
+                             "headnode only handles fan-out heartbeats per "
+                             "group and round, 0 sends all heartbeats to the "
+                             "headnode")
+
+    parser.add_argument("--shared-partitions", action="store_true",
+                        help="Keep a single copy of every partition per "
+                             "host in MPI shared memory, shared by the "
+                             "compute nodes burning it, needs --graph csr")
+    parser.add_argument("--ghost-status", action="store_true",
+                        help="Keep a bitmap of the ghost vertices burned in "
+                             "the current sample, updated by the neighbors "
+                             "along with their burn requests, and do not "
+                             "request burned ghosts again, needs --exchange "
+                             "neighbor")
+    parser.add_argument("--halo", type=int, default=0,
+                        help="Load the partition shards with a halo of this "
+                             "depth (nodeN.haloK.bin), so wild fires burn "
+                             "through the boundary before asking the owners, "
+                             "needs --graph csr and --exchange neighbor")
+    parser.add_argument("--backend", choices=["mpi", "shm"], default="mpi",
+                        help="Run under mpirun, or start all ranks as local "
+                             "processes that exchange messages through "
+                             "shared memory (Python 3.8+)")
+    parser.add_argument("--ranks", type=int, default=None,
+                        help="Number of ranks to start with --backend shm, "
+                             "the head node plus the compute nodes")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write latency histograms of the timed "
+                             "functions and run loop iterations to "
+                             "profile-{rank}.json and a Chrome trace to "
+                             "trace-{rank}.json in the results folder")
+    parser.add_argument("--profile-interval", type=float, default=10.0,
+                        help="Seconds between writes of the profile and "
+                             "trace with --profile")
+    parser.add_argument("--track-comm", action="store_true",
+                        help="Count the messages, bytes and blocked time of "
+                             "every MPI call by tag and peer, written to "
+                             "comm-{rank}.json and comm_matrix.json in the "
+                             "results folder")
 
     # Parse args and return variables if no error occurs.
-    return parser.parse_args()
+    args = parser.parse_args()
+    if size is None:
+        if args.ranks is None or args.ranks < 2:
+            parser.error("--backend shm needs --ranks of at least 2")
+        size = args.ranks
+    if args.spread == "frontier" and args.graph != "csr":
+        parser.error("--spread frontier needs --graph csr")
+    if args.shared_partitions and args.graph != "csr":
+        parser.error("--shared-partitions needs --graph csr")
+    if args.ghost_status and args.exchange != "neighbor":
+        parser.error("--ghost-status needs --exchange neighbor")
+    if args.halo and (args.graph != "csr" or args.exchange != "neighbor"):
+        parser.error("--halo needs --graph csr and --exchange neighbor")
+    if args.output == "distributed" and args.pipelined:
+        parser.error("--output distributed does not support --pipelined")
+    if args.fan_out and (args.pipelined or args.output != "head" or
+                         args.steal_quota > 0):
+        parser.error("--fan-out needs lockstep heartbeats, --output head and "
+                     "no --steal-quota")
+    if args.groups < 1 or (size - 1) % args.groups != 0:
+        parser.error(f"--groups must divide the {size - 1} compute nodes")
+    return args
 
 
 def load_dir_structure():
@@ -50,12 +176,22 @@ def load_dir_structure():
     sys.path.append(os.path.join(root, "simulations"))
 
 
-if __name__ == '__main__':
-    args = None
+def run(args=None):
+    """
+    Runs the simulation on this process. Without args they are parsed on
+    rank 0 and broadcast.
+    """
+    import mpi4py
+    mpi4py.rc.recv_mprobe = False
+    from mpi4py import MPI
+
+    # Setup globals for each process.
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
 
-    if rank == 0:
+    if rank == 0 and args is None:
         # Parse arguments and error of called wrongly.
-        args = parse_args()
+        args = parse_args(comm.Get_size())
 
     # Wait for argument parsing to finish and broadcast results.
     args = comm.bcast(args, root=0)
@@ -63,6 +199,17 @@ if __name__ == '__main__':
     # Load directory structure for short imports.
     load_dir_structure()
 
+    # Profile the timed functions and run loops of this rank.
+    if args.profile:
+        from Profiler import profiler
+        profiler.enable(args.tmp_res, rank, args.profile_interval)
+
+    # Track the communication of the nodes, before their classes are loaded
+    # with the simulation and wrap the world communicator.
+    if args.track_comm:
+        from TrackedComm import tracker
+        tracker.enabled = True
+
     # Parse simulation path and find module.
     simfile = os.path.basename(args.simpath)
     spec = importlib.util.spec_from_file_location(simfile, args.simpath)
@@ -73,6 +220,32 @@ if __name__ == '__main__':
 
     # Sync all processes, and run the simulation.
     comm.Barrier()
+    head_options = {opt: getattr(args, opt) for opt in HEAD_OPTIONS}
+    compute_options = {opt: getattr(args, opt) for opt in COMPUTE_OPTIONS}
     sim_module.run_sim(args.scale_factor, args.dataset, args.do_stitch,
                        args.ring_stitch, args.connectivity, args.tmp_play,
-                       args.tmp_data, args.tmp_res)
+                       args.tmp_data, args.tmp_res, head_options,
+                       compute_options)
+
+    # Log the peak memory of this process, in the counter format of the
+    # node logs.
+    logging.info(f"counter peak_rss_kb "
+                 f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}")
+
+    # Write the communication of all ranks and the traffic matrix of the job.
+    if args.track_comm:
+        tracker.write(args.tmp_res, comm)
+
+    # Ranks started by the shm backend exit without running atexit handlers.
+    if args.profile:
+        profiler.close()
+
+
+if __name__ == '__main__':
+    if parse_backend() == "shm":
+        # Start all ranks as local processes, without mpirun.
+        args = parse_args()
+        load_dir_structure()
+        from SharedMemoryMPI import launch
+        sys.exit(launch(args.ranks, run, args))
+    run()
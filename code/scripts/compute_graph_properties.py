@@ -11,15 +11,15 @@ import os
 from time import time
 
 
-def valid_extension(path, extension):
-    """ Checks whether a given path argument ends on the provided extension. """
+def valid_extension(path, *extensions):
+    """ Checks whether a given path argument ends on one of the extensions. """
     if not isinstance(path, str):
         raise argparse.ArgumentTypeError("Given file path is not a string")
 
     base, ext = os.path.splitext(path)
-    if ext.lower() != extension:
+    if ext.lower() not in extensions:
         raise argparse.ArgumentTypeError(f"Extension of given file is not "
-                                         f"{extension}")
+                                         f"{' or '.join(extensions)}")
     return path
 
 
@@ -30,20 +30,35 @@ def parse_args():
                                    "resulting graph.")
     parser.add_argument("v_path", type=lambda a: valid_extension(a, ".v"),
                         help="Path to the vertex file")
-    parser.add_argument("e_path", type=lambda a: valid_extension(a, ".e"),
-                        help="Path to the edge file")
+    parser.add_argument("e_path",
+                        type=lambda a: valid_extension(a, ".e", ".manifest"),
+                        help="Path to the edge file, or to the manifest of "
+                             "edge shards written with distributed output")
     return parser.parse_args()
 
 
+def edge_files(edge_file):
+    """ Returns the edge files, read from the manifest if one is given. """
+    if not edge_file.endswith(".manifest"):
+        return [edge_file]
+
+    with open(edge_file, "r") as f:
+        manifest = json.load(f)
+    root = os.path.dirname(edge_file)
+    return [os.path.join(root, shard["path"])
+            for shard in manifest["edge_files"]]
+
+
 def load_graph(vertex_file, edge_file):
     """ Parses vertex and edge files into a graph. """
     G = nx.Graph()
 
     # Parse edges.
-    with open(edge_file, "r") as edges:
-        for e in edges.readlines():
-            v1, v2 = e.strip().split()
-            G.add_edge(v1, v2)
+    for path in edge_files(edge_file):
+        with open(path, "r") as edges:
+            for e in edges.readlines():
+                v1, v2 = e.strip().split()
+                G.add_edge(v1, v2)
     return G
 
 
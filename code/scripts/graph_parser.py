@@ -4,6 +4,7 @@ Discription:
 """
 
 import re
+import numpy as np
 from functools import singledispatch
 from pathlib import Path
 
@@ -52,6 +53,22 @@ class GraphParser:
             for vert_id, rank_id in enumerate(fp): 
                 yield vert_id, int(rank_id)
 
+    def edge_array(self):
+        """Returns all edges as an (n_edges, 2) array of LDBC ids."""
+        with open(f"{self.path_to_graph}.e", 'r') as fp:
+            n_columns = len(fp.readline().split())
+        edges = np.fromfile(f"{self.path_to_graph}.e", dtype=np.int64, sep=" ")
+        return edges.reshape(-1, n_columns)[:, :2]
+
+    def vert_array(self):
+        """Returns the LDBC id of every metis id."""
+        return np.fromfile(f"{self.path_to_graph}.v", dtype=np.int64, sep=" ")
+
+    def part_array(self, n_part):
+        """Returns the partition of every metis id."""
+        return np.fromfile(f"{self.path_to_graph}.m.{n_part}p", dtype=np.int64,
+                           sep=" ")
+
     def get_rank_by_metis_vert(self, n_part):
         rank_by_metis_vert = dict()
         for metis_vert_id, rank_id in self.lines_in_part_file(n_part): 
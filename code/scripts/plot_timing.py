@@ -1,3 +1,4 @@
+import json
 import matplotlib.pyplot as plt
 import os
 import pandas as pd
@@ -74,17 +75,28 @@ class TimingVisiualizer:
         p = Path(f"{self.path_to_jobs}")
         for log_file in p.glob(f"{job_name}/results/node-*.log"):
             node_type = "header" if log_file.name == "node-0.log" else "worker"
-            
-            skiprows = [i for i, line in enumerate(open(log_file)) if line.startswith("timer")][0] \
-                        if node_type == "header" else 0
             node_id = log_file.name.rstrip(".log")
 
-            df = pd.read_csv(log_file, sep=" ", header=None, index_col=None, skiprows=skiprows)
-            df.columns=["type", "component", "val"]
+            # jobs run with --profile have the timers in a profile per node,
+            # which lists the timers of all classes loaded on the node
+            profile_file = log_file.with_name(
+                log_file.name.replace("node-", "profile-").replace(".log", ".json"))
+            if profile_file.exists():
+                with open(profile_file) as f:
+                    timers = {component: val for component, val
+                              in json.load(f)["timers"].items() if val}
+                df = pd.DataFrame({node_id: list(timers.values())},
+                                  index=pd.Index(list(timers), name="component"))
+            else:
+                skiprows = [i for i, line in enumerate(open(log_file)) if line.startswith("timer")][0] \
+                            if node_type == "header" else 0
+
+                df = pd.read_csv(log_file, sep=" ", header=None, index_col=None, skiprows=skiprows)
+                df.columns=["type", "component", "val"]
 
-            df = df[df.type == "timer"][["component", "val"]]
-            df.columns = ["component", node_id]
-            df.set_index("component", inplace=True)
+                df = df[df.type == "timer"][["component", "val"]]
+                df.columns = ["component", node_id]
+                df.set_index("component", inplace=True)
 
             dfs[node_type] = pd.concat([dfs[node_type], df], axis=1)
 
@@ -100,11 +112,11 @@ class TimingVisiualizer:
             dfs = self.load_log(job)
             n_nodes = int(parse_job_name(job)["n_nodes"]) - 1
 
-            df = dfs["worker"][["component", "time"]].groupby("component").mean().drop("do_tasks").reset_index()
+            df = dfs["worker"][["component", "time"]].groupby("component").mean().drop("do_tasks", errors="ignore").reset_index()
             df["n_nodes"] = n_nodes
             data["worker"].append(df)
 
-            df = dfs["header"][["component", "time"]].groupby("component").mean().drop(["run", "run_sim"]).reset_index()
+            df = dfs["header"][["component", "time"]].groupby("component").mean().drop(["run", "run_sim"], errors="ignore").reset_index()
             df["n_nodes"] = n_nodes
             data["header"].append(df)
 
@@ -9,14 +9,31 @@ Details:
     In this way, each edge will appear twice but expressed in different vertex order.
     For partition file, it just contains the partition info of the vertices that 
         are not on the node but are neighbours of the vertices on this node.
+    With --format binary, both are written as one memory mappable shard per node
+        (nodeN.bin), holding the CSR arrays of the node and the rank of every
+        neighbour that is not on the node.
+    With --halo K, binary shards with a K-hop halo are written as well
+        (nodeN.haloK.bin): read-only copies of the adjacency of the
+        vertices up to K hops from the node, so fires can burn through the
+        boundary before asking the owners. The memory this costs and the
+        burn requests it saves are reported in haloK.json.
 """
 
 # import gzip
+import json
+import os
+import sys
 from argparse import ArgumentParser
 from contextlib import ExitStack
 
+import numpy as np
+
 from graph_parser import GraphParser
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             "..", "classes"))
+from CSRGraph import CSRGraph
+
 WORKER_NODES_RANK_OFFSET = 1
 
 
@@ -24,6 +41,13 @@ def parse_args():
     parser = ArgumentParser()
     parser.add_argument("name")
     parser.add_argument("n_part")
+    parser.add_argument("--format", choices=["text", "binary", "both"],
+                        default="text",
+                        help="write text edge/partition files, binary shards "
+                             "or both")
+    parser.add_argument("--halo", type=int, default=0,
+                        help="depth of the halo of the binary shards, 0 for "
+                             "no halo")
     args = parser.parse_args()
     return args
 
@@ -66,7 +90,149 @@ def split_partitions(graph_parser, n_part):
                 fp.write(line)
 
 
+def build_adjacency(all_src):
+    """
+    Returns the adjacency of the graph as CSR arrays over the positions of
+    its edges: the sorted vertices, the row offsets and the edge positions
+    grouped by source vertex. Built once so every hop of the halos only
+    touches the edges of its frontier.
+
+    all_src: sources of the edges of the graph, in both directions
+    """
+    order = np.argsort(all_src, kind="stable")
+    vertices, counts = np.unique(all_src[order], return_counts=True)
+    indptr = np.zeros(len(vertices) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return vertices, indptr, order
+
+
+def adjacent_edges(adjacency, vertex_ids):
+    """Returns the positions of the edges leaving the given vertices."""
+    vertices, indptr, order = adjacency
+    rows = np.searchsorted(vertices, vertex_ids)
+    found = rows < len(vertices)
+    found[found] = vertices[rows[found]] == vertex_ids[found]
+    rows = rows[found]
+    starts, counts = indptr[rows], indptr[rows + 1] - indptr[rows]
+    # position of every edge within the concatenation of the rows
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return order[offsets + np.arange(counts.sum())]
+
+
+def find_halo(adjacency, all_dst, owned_ids, ghosts, depth):
+    """
+    Returns the vertices up to depth hops from a partition that it does not
+    own, starting from its ghosts.
+
+    adjacency: adjacency of the graph, see build_adjacency
+    all_dst: destinations of the edges of the graph, in both directions
+    owned_ids: vertices owned by the partition
+    ghosts: ghost vertices of the partition, one hop away
+    """
+    halo = np.empty(0, dtype=np.int64)
+    frontier = ghosts
+    for hop in range(depth):
+        halo = np.union1d(halo, frontier)
+        if hop + 1 == depth:
+            break
+        reached = np.unique(all_dst[adjacent_edges(adjacency, frontier)])
+        frontier = np.setdiff1d(np.setdiff1d(reached, halo), owned_ids)
+    return halo
+
+
+def split_partitions_binary(graph_parser, n_part, halo=0):
+    edges = graph_parser.edge_array()
+    ldbc_by_metis = graph_parser.vert_array()
+    rank_by_metis = graph_parser.part_array(n_part)
+
+    # translate LDBC ids to ranks with a sorted lookup instead of dicts
+    metis_order = np.argsort(ldbc_by_metis, kind="stable")
+    sorted_ldbc = ldbc_by_metis[metis_order]
+
+    def rank_of(ldbc_ids):
+        return rank_by_metis[metis_order[np.searchsorted(sorted_ldbc, ldbc_ids)]]
+
+    ranks_1, ranks_2 = rank_of(edges[:, 0]), rank_of(edges[:, 1])
+    path_to_partitions = f"{graph_parser.path_to_graph}-{n_part}-partitions"
+
+    # every edge in both directions, for the halo
+    all_src = np.concatenate((edges[:, 0], edges[:, 1]))
+    all_dst = np.concatenate((edges[:, 1], edges[:, 0]))
+    adjacency = build_adjacency(all_src) if halo > 0 else None
+    report = []
+
+    for i in range(n_part):
+        # every edge is stored on the nodes of both its vertices
+        on_1, on_2 = ranks_1 == i, ranks_2 == i
+        src = np.concatenate((edges[on_1, 0], edges[on_2, 1]))
+        dst = np.concatenate((edges[on_1, 1], edges[on_2, 0]))
+        node = i + WORKER_NODES_RANK_OFFSET
+
+        graph = CSRGraph(None)
+        graph.build(src, dst)
+        ghost_ranks = rank_of(graph.ldbc_ids[graph.n_local:]) + \
+            WORKER_NODES_RANK_OFFSET
+        shard = graph.to_shard(node, n_part, ghost_ranks)
+        shard.write(f"{path_to_partitions}/node{node}.bin")
+        if halo == 0:
+            continue
+
+        halo_vertices = find_halo(adjacency, all_dst,
+                                  graph.ldbc_ids[:graph.n_local],
+                                  graph.ldbc_ids[graph.n_local:], halo)
+        in_halo = adjacent_edges(adjacency, halo_vertices)
+        halo_graph = CSRGraph(None)
+        halo_graph.build(src, dst, all_src[in_halo], all_dst[in_halo])
+        ghost_ranks = rank_of(halo_graph.ldbc_ids[halo_graph.n_local:]) + \
+            WORKER_NODES_RANK_OFFSET
+        halo_shard = halo_graph.to_shard(node, n_part, ghost_ranks)
+        halo_shard.write(f"{path_to_partitions}/node{node}.halo{halo}.bin")
+
+        # burn requests leave the partition over the cut edges without a
+        # halo, and only over the edges leaving the halo with one. Every
+        # halo vertex that burns costs a claim instead.
+        n_rows = halo_graph.n_local + halo_graph.n_halo
+        report.append({
+            "node": node,
+            "owned_vertices": graph.n_local,
+            "halo_vertices": halo_graph.n_halo,
+            "halo_edges": len(in_halo),
+            "shard_bytes": os.path.getsize(
+                f"{path_to_partitions}/node{node}.bin"),
+            "halo_shard_bytes": os.path.getsize(
+                f"{path_to_partitions}/node{node}.halo{halo}.bin"),
+            "cut_edges": int(np.sum(graph.indices >= graph.n_local)),
+            "edges_leaving_halo": int(np.sum(halo_graph.indices >= n_rows)),
+        })
+
+    if halo > 0:
+        write_halo_report(report, f"{path_to_partitions}/halo{halo}.json")
+
+
+def write_halo_report(report, path):
+    """Prints the memory cost and message savings of the halo per node."""
+    print(f"{'node':>5} {'owned':>10} {'halo':>10} {'halo edges':>12} "
+          f"{'shard MiB':>10} {'with halo':>10} {'cut edges':>10} "
+          f"{'leaving':>10}")
+    for node in report:
+        print(f"{node['node']:>5} {node['owned_vertices']:>10} "
+              f"{node['halo_vertices']:>10} {node['halo_edges']:>12} "
+              f"{node['shard_bytes'] / 2**20:>10.2f} "
+              f"{node['halo_shard_bytes'] / 2**20:>10.2f} "
+              f"{node['cut_edges']:>10} {node['edges_leaving_halo']:>10}")
+    totals = {key: sum(node[key] for node in report)
+              for key in report[0] if key != "node"}
+    print(f"memory x{totals['halo_shard_bytes'] / totals['shard_bytes']:.2f}, "
+          f"burn request edges x"
+          f"{totals['edges_leaving_halo'] / max(totals['cut_edges'], 1):.2f}")
+    with open(path, "w") as f:
+        json.dump({"nodes": report, "totals": totals}, f, indent=1)
+
+
 if __name__ == "__main__":
     args = parse_args()
     graph_parser = GraphParser(args.name)
-    split_partitions(graph_parser, int(args.n_part))
+    if args.format in ("text", "both"):
+        split_partitions(graph_parser, int(args.n_part))
+    if args.format in ("binary", "both"):
+        split_partitions_binary(graph_parser, int(args.n_part), args.halo)
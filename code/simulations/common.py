@@ -0,0 +1,137 @@
+# Setup shared by the simulations, so the wild and halted fires load their
+# partitions the same way.
+import os
+import numpy as np
+
+from TimeIt import timeit
+import mpi4py
+mpi4py.rc.recv_mprobe = False
+from mpi4py import MPI
+
+from ComputeNode import ComputeNode
+
+
+@timeit
+def read_partition_file(path_to_partition_file):
+    vert_rank_mapping = dict()
+    with open(path_to_partition_file, "r") as fp:
+        for line in fp:
+            vert, machine = list(map(int, line.strip().split(" ")))
+            vert_rank_mapping[vert] = machine
+
+    return vert_rank_mapping
+
+
+def partition_layout(comm, compute_options):
+    """
+    Returns the number of partitions, and the group and partition of this
+    rank, MPI.UNDEFINED on the headnode. Every group of compute nodes burns
+    its own sample on a replica of the partitions.
+
+    comm: world communicator
+    compute_options: keyword arguments for the ComputeNodes
+    """
+    rank = comm.Get_rank()
+    groups = compute_options.get("groups", 1)
+    n_partitions = (comm.Get_size() - 1) // groups
+    if rank == 0:
+        return n_partitions, MPI.UNDEFINED, MPI.UNDEFINED
+    return n_partitions, (rank - 1) // n_partitions, \
+        (rank - 1) % n_partitions + 1
+
+
+def split_partition_comm(comm, partition, compute_options):
+    """
+    Returns the communicator of the compute nodes on this host that burn the
+    same partition and keep a single copy of it in shared memory, None
+    without shared partitions. Called by all ranks.
+    """
+    if not compute_options.get("shared_partitions"):
+        return None
+    host_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=comm.Get_rank())
+    return host_comm.Split(partition, comm.Get_rank())
+
+
+def shard_path(tmp_data, dataset, n_partitions, partition, halo=0):
+    """Returns the path of the binary shard of a partition."""
+    path_to_partitions = f"{tmp_data}/{dataset}/{dataset}-{n_partitions}-partitions"
+    if halo:
+        return f"{path_to_partitions}/node{partition}.halo{halo}.bin"
+    return f"{path_to_partitions}/node{partition}.bin"
+
+
+def check_halo_shards(comm, n_partitions, partition, dataset, tmp_data,
+                      compute_options):
+    """
+    Raises FileNotFoundError on all ranks when a compute node misses the
+    halo shard of its partition, as the fires would silently spread without
+    the halo. Called by all ranks before the headnode starts, so none of
+    them waits for the others.
+    """
+    halo = compute_options.get("halo", 0)
+    if not halo:
+        return
+    missing = None
+    if comm.Get_rank() > 0:
+        path = shard_path(tmp_data, dataset, n_partitions, partition, halo)
+        missing = None if os.path.isfile(path) else path
+    missing = sorted({path for path in comm.allgather(missing) if path})
+    if missing:
+        raise FileNotFoundError(
+            f"{', '.join(missing)} not found, create the halo shards with "
+            f"split_partitions.py {dataset} {n_partitions} --format binary "
+            f"--halo {halo}")
+
+
+def start_compute_node(rank, wildfire, n_partitions, partition, dataset,
+                       tmp_data, tmp_res, compute_options,
+                       partition_comm=None):
+    """
+    Returns a ComputeNode with its partition loaded.
+
+    rank: rank of the process
+    wildfire: whether fires spread to other partitions
+    n_partitions: number of partitions of the dataset in use
+    partition: partition this compute node burns
+    dataset: name of the dataset
+    tmp_data: directory of the datasets
+    tmp_res: directory of the results
+    compute_options: keyword arguments for the ComputeNode
+    partition_comm: communicator of the shared partition, see
+                    split_partition_comm
+    """
+    # Fetch the set of edges according to the rank of the process within
+    # its group and the number of partitions in use.
+    path_to_partitions = f"{tmp_data}/{dataset}/{dataset}-{n_partitions}-partitions"
+    path_to_partition_file = f"{path_to_partitions}/node{partition}.p"
+    path_to_edge_file = f"{path_to_partitions}/node{partition}.e"
+    path_to_shard_file = shard_path(tmp_data, dataset, n_partitions,
+                                    partition, compute_options.get("halo", 0))
+    out_e = f"{tmp_res}/scaled_graph.e.{rank}"
+
+    # Start a ComputeNode. Binary shards are memory mapped by the csr graph
+    # and already contain the vertex to rank mapping.
+    if compute_options.get("shared_partitions"):
+        compute_node = ComputeNode(rank, wildfire, n_partitions, None,
+                                   out_e=out_e, **compute_options)
+        if os.path.isfile(path_to_shard_file):
+            compute_node.init_partition(path_to_shard_file, partition_comm)
+        else:
+            compute_node.init_partition(path_to_edge_file, partition_comm)
+    elif compute_options.get("graph") == "csr" and \
+            os.path.isfile(path_to_shard_file):
+        compute_node = ComputeNode(rank, wildfire, n_partitions, None,
+                                   out_e=out_e, **compute_options)
+        compute_node.init_partition(path_to_shard_file)
+    else:
+        vert_rank_mapping = read_partition_file(path_to_partition_file)
+        compute_node = ComputeNode(rank, wildfire, n_partitions,
+                                   vert_rank_mapping, out_e=out_e,
+                                   **compute_options)
+        compute_node.init_partition(path_to_edge_file)
+
+    if compute_node.heartbeat_children:
+        # inner nodes of the heartbeat tree pack edges like the headnode
+        compute_node.init_aggregator(np.fromfile(
+            f"{tmp_data}/{dataset}/{dataset}.v", dtype=np.int64, sep=" "))
+    return compute_node
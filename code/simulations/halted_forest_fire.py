@@ -1,16 +1,17 @@
 # Load packages.
 import logging
 import sys
+import numpy as np
 
 from TimeIt import timeit
-from itertools import takewhile, repeat
 import mpi4py
 mpi4py.rc.recv_mprobe = False
 from mpi4py import MPI
 
 # Load classes and functions from own files.
-from ComputeNode import ComputeNode
 from HeadNode import HeadNode
+from common import partition_layout, split_partition_comm, \
+    start_compute_node
 
 # Setup globals for each process.
 comm = MPI.COMM_WORLD
@@ -18,61 +19,56 @@ size = comm.Get_size()
 rank = comm.Get_rank()
 
 
-def rawincount(filename):
-    """
-    Function to count the number of lines in a file efficiently.
-    Found on this stack-overflow: https://stackoverflow.com/a/27518377
-    """
-    f = open(filename, "rb")
-    bufgen = takewhile(lambda x: x, (f.raw.read(1024 * 1024)
-                                     for _ in repeat(None)))
-    return sum(buf.count(b"\n") for buf in bufgen)
-
-@timeit
-def read_partition_file(path_to_partition_file):
-    vert_rank_mapping = dict()
-    with open(path_to_partition_file, "r") as fp:
-        for line in fp:
-            vert, machine = list(map(int, line.strip().split(" ")))
-            vert_rank_mapping[vert] = machine
-
-    return vert_rank_mapping
-
-
 @timeit
 def run_sim(scale_factor, dataset, do_stitch, ring_stitch, connectivity,
-            tmp_play, tmp_data, tmp_res):
+            tmp_play, tmp_data, tmp_res, head_options=None,
+            compute_options=None):
     """
     Entrypoint for starting a halted forest fire simulation.
     Starts up a single HeadNode and multiple compute nodes.
+
+    head_options: optional keyword arguments for the HeadNode
+    compute_options: optional keyword arguments for the ComputeNodes
     """
-    # Setup logging and print to stdout.
-    logging.basicConfig(filename=f'{tmp_res}/node-{rank}.log', filemode="w+",
+    head_options = head_options or {}
+    compute_options = dict(compute_options or {})
+
+    # Setup logging and print to stdout. The log is truncated once and opened
+    # in append mode, as timers logged at interpreter exit reopen the file.
+    open(f'{tmp_res}/node-{rank}.log', "w").close()
+    logging.basicConfig(filename=f'{tmp_res}/node-{rank}.log', filemode="a",
                         format='%(message)s', level=logging.INFO)
     logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
 
+    # halted fires do not send burn requests, so a halo saves nothing
+    if compute_options.pop("halo", 0):
+        logging.warning("halted fires ignore --halo")
+
+    # Every group of compute nodes burns its own sample on a replica of the
+    # partitions.
+    n_partitions, _, partition = partition_layout(comm, compute_options)
+    partition_comm = split_partition_comm(comm, partition, compute_options)
+
     if rank == 0:
-        # Fetch the total number of vertices in the dataset.
-        num_vertices = rawincount(f"{tmp_data}/{dataset}/{dataset}.v")
+        # Fetch the vertices of the dataset.
+        vertex_ids = np.fromfile(f"{tmp_data}/{dataset}/{dataset}.v",
+                                 dtype=np.int64, sep=" ")
+        num_vertices = len(vertex_ids)
 
         # Start a HeadNode.
         logging.debug(f"Starting HeadNode on {rank}..")
         out_v = f"{tmp_res}/scaled_graph.v"
         out_e = f"{tmp_res}/scaled_graph.e"
         hn = HeadNode(rank, size, float(scale_factor), num_vertices, out_v,
-                      out_e, do_stitch, ring_stitch, connectivity)
+                      out_e, do_stitch, ring_stitch, connectivity,
+                      vertex_ids=vertex_ids, **head_options)
         hn.run()
         logging.debug(f"Done on headnode")
     else:
-        # Fetch the set of edges according to the rank of the process and the
-        # number of partitions in use.
-        path_to_partition_file = f"{tmp_data}/{dataset}/{dataset}-{size - 1}-partitions/node{rank}.p"
-        path_to_edge_file = f"{tmp_data}/{dataset}/{dataset}-{size - 1}-partitions/node{rank}.e"
-        vert_rank_mapping = read_partition_file(path_to_partition_file)
-
-        # Start a ComputeNode.
         logging.debug(f"Starting ComputeNode on {rank}..")
-        compute_node = ComputeNode(rank, False, size - 1, vert_rank_mapping)
-        compute_node.init_partition(path_to_edge_file)
+        compute_node = start_compute_node(rank, False, n_partitions,
+                                          partition, dataset, tmp_data,
+                                          tmp_res, compute_options,
+                                          partition_comm)
         compute_node.do_tasks()
         logging.debug(f"Compute node {rank} done")
@@ -1,5 +1,7 @@
-# Check if the dataset is partitioned correctly for the requested job.
-COMP_NODES=$(( SLURM_NTASKS - 1 ))
+# Check if the dataset is partitioned correctly for the requested job, every
+# group of compute nodes burns on its own replica of the partitions.
+N_GROUPS=$(echo "${SIM_ARGS}" | sed -n 's/.*--groups[ =]\([0-9]\+\).*/\1/p')
+COMP_NODES=$(( (SLURM_NTASKS - 1) / ${N_GROUPS:-1} ))
 if [ ! -d "${PWD}/data/${DATASET}/${DATASET}-${COMP_NODES}-partitions" ]; then
     echo "Dataset '${DATASET}' is not partitioned for ${COMP_NODES} Compute Nodes."
     exit 1
@@ -33,7 +35,8 @@ cp -r "${PWD}/jobs/${JOBNAME}/results/." -t "${TMP_RES}/."
 # Run simulation.
 srun -n "${SLURM_NTASKS}" --mpi=pmi2 python3 "code/run_simulation.py" \
     "${SIMPATH}${SIMFILE}" "${SCALE}" "${DATASET}" "${DO_STITCH}" \
-    "${RING_STITCH}" "${CONN}" "${TMP_PLAY}" "${TMP_DATA}" "${TMP_RES}"
+    "${RING_STITCH}" "${CONN}" "${TMP_PLAY}" "${TMP_DATA}" "${TMP_RES}" \
+    ${SIM_ARGS}
 
 # Compute properties of the resulting graph and copy those to HOME partition.
 #cp "${TMP_RES}/scaled_graph.v" -t "jobs/${JOBNAME}/results/."
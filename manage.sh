@@ -137,7 +137,8 @@ case "$1" in
     echo "Splitting ${2} with ${3} partitions across new node folders.."
     module load python/3.6.0
     mkdir -p "data/${2}/${2}-${3}-partitions"
-    srun python3 code/scripts/split_partitions.py "${2}" "${3}"
+    srun python3 code/scripts/split_partitions.py "${2}" "${3}" \
+        --format "${4:-text}" --halo "${5:-0}"
     module unload python/3.6.0
     ;;
 # Create new job.
@@ -238,6 +239,7 @@ SCALE=\"${4}\"
 DO_STITCH=\"${DO_STITCH}\"
 RING_STITCH=\"${RING_STITCH}\"
 CONN=\"${CONN}\"
+SIM_ARGS=\"${*:11}\"
 " >>"jobs/${2}/${2}.sh"
     cat jobs/job_body.sh >>"jobs/${2}/${2}.sh"
     ;;
@@ -295,9 +297,12 @@ CONN=\"${CONN}\"
         DO_STITCH=$(sed -n 13p "jobs/${2}/${2}.sh" | cut -c 12- | sed 's/.$//')
         RING_STITCH=$(sed -n 14p "jobs/${2}/${2}.sh" | cut -c 14- | sed 's/.$//')
         CONN=$(sed -n 15p "jobs/${2}/${2}.sh" | cut -c 7- | sed 's/.$//')
+        SIM_ARGS=$(sed -n 's/^SIM_ARGS="\(.*\)"$/\1/p' "jobs/${2}/${2}.sh")
 
-        # Check if the dataset is partitioned correctly for the requested job.
-        COMP_NODES=$((NUMTASKS - 1))
+        # Check if the dataset is partitioned correctly for the requested job,
+        # every group of compute nodes burns on its own replica.
+        N_GROUPS=$(echo "${SIM_ARGS}" | sed -n 's/.*--groups[ =]\([0-9]\+\).*/\1/p')
+        COMP_NODES=$(( (NUMTASKS - 1) / ${N_GROUPS:-1} ))
         if [ ! -d "${PWD}/data/${DATASET}/${DATASET}-${COMP_NODES}-partitions" ]; then
             echo "Dataset '${DATASET}' is not partitioned for ${COMP_NODES} Compute Nodes."
             exit 1
@@ -306,12 +311,19 @@ CONN=\"${CONN}\"
         # Create folder for dataset if it does not exist for catching faults.
         mkdir -p "${TMP_DATA}/${DATASET}"
 
-        # Run python locally.
+        # Run python locally, the shm backend starts the ranks itself.
         echo "Starting local job ${2}.."
-        mpirun -n "${NUMTASKS}" --use-hwthread-cpus python3 \
-            "code/run_simulation.py" "${SIMPATH}${SIMFILE}" "${SCALE}" \
-            "${DATASET}" "${DO_STITCH}" "${RING_STITCH}" "${CONN}" \
-            "${TMP_PLAY}" "${TMP_DATA}" "${TMP_RES}"
+        if [[ " ${SIM_ARGS} " == *" --backend shm "* ]]; then
+            python3 "code/run_simulation.py" "${SIMPATH}${SIMFILE}" \
+                "${SCALE}" "${DATASET}" "${DO_STITCH}" "${RING_STITCH}" \
+                "${CONN}" "${TMP_PLAY}" "${TMP_DATA}" "${TMP_RES}" \
+                ${SIM_ARGS} --ranks "${NUMTASKS}"
+        else
+            mpirun -n "${NUMTASKS}" --use-hwthread-cpus python3 \
+                "code/run_simulation.py" "${SIMPATH}${SIMFILE}" "${SCALE}" \
+                "${DATASET}" "${DO_STITCH}" "${RING_STITCH}" "${CONN}" \
+                "${TMP_PLAY}" "${TMP_DATA}" "${TMP_RES}" ${SIM_ARGS}
+        fi
 
         # Copy results to jobs directory.
         cp -rf "${TMP_RES}/." "jobs/${2}/results"
@@ -350,6 +362,12 @@ CONN=\"${CONN}\"
         E_FILE="/var/scratch/$USER/${2}/results/scaled_graph.e"
     fi
 
+    # Jobs with distributed output list their edge shards in a manifest.
+    MANIFEST="${E_FILE%.e}.manifest"
+    if [ -f "${MANIFEST}" ]; then
+        E_FILE="${MANIFEST}"
+    fi
+
     # Check if the vertex file is in results.
     if [ ! -f "${V_FILE}" ]; then
         echo "Vertex file is missing in results of '${2}'."
@@ -0,0 +1,6 @@
+# The classes import each other by module name, like the simulations do.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                "..", "code", "classes"))
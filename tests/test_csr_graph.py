@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from CSRGraph import CSRGraph
+from Enums import VertexStatus
+
+
+@pytest.fixture
+def graph():
+    """Owns 10 and 20, ghosts 30 on rank 2 and 40 on rank 3."""
+    built = CSRGraph(None)
+    built.build([10, 10, 20], [20, 30, 40])
+    graph = CSRGraph(None)
+    graph.load_shard(built.to_shard(1, 3, np.array([2, 3], dtype=np.int32)))
+    return graph
+
+
+def test_get_vertex_ranks_of_ghosts(graph):
+    assert graph.get_vertex_ranks(np.array([40, 30, 40])).tolist() == \
+        [3, 2, 3]
+    assert graph.get_vertex_ranks(np.array([], dtype=np.int64)).tolist() == []
+
+
+@pytest.mark.parametrize("vertex_ids", [[30, 10], [20], [30, 50], [5]])
+def test_get_vertex_ranks_rejects_owned_and_unknown_ids(graph, vertex_ids):
+    with pytest.raises(KeyError):
+        graph.get_vertex_ranks(np.array(vertex_ids))
+
+
+@pytest.mark.parametrize("stride", [1, 1000])
+def test_neighbors_with_status_on_short_and_long_rows(stride):
+    # stride 1000 leaves the ids too sparse for the direct lookup table
+    rng = np.random.default_rng(7)
+    src = np.concatenate((np.zeros(300, dtype=np.int64),
+                          rng.integers(0, 50, size=400))) * stride
+    dst = rng.integers(0, 400, size=700) * stride
+    graph = CSRGraph(None)
+    graph.build(src, dst)
+    burned = rng.choice(graph.ldbc_ids[:graph.n_local], size=20)
+    for vertex_id in burned:
+        graph.set_vertex_status(int(vertex_id), VertexStatus.BURNED)
+
+    owned = set(src.tolist())
+    for vertex_id in set(src.tolist()) | {-stride, 401 * stride}:
+        expected = {int(nbr) for s, nbr in zip(src, dst) if s == vertex_id and
+                    (nbr not in owned or nbr not in burned)}
+        assert set(graph.get_neighbors_with_status(
+            vertex_id, VertexStatus.NOT_BURNED)) == expected
+
+
+def test_lookups_see_edges_added_one_at_a_time():
+    graph = CSRGraph(None)
+    graph.build([10, 10, 20], [20, 30, 40])
+    assert graph.get_neighbors(30) == []
+    graph.add_vertex_and_neighbor(30, 10)
+    graph.add_vertex_and_neighbor(60, 30)
+    assert graph.vert_exists_here(60)
+    assert sorted(graph.get_neighbors(30)) == [10]
+    assert graph.get_neighbors(60) == [30]
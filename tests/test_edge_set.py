@@ -0,0 +1,25 @@
+import numpy as np
+
+from EdgeSet import EdgeSet
+
+
+def test_edges_are_stored_once_in_either_direction():
+    edges = EdgeSet()
+    edges.add_edge(3, 1)
+    edges.add_edge(1, 3)
+    edges.add_edges([5, 1, 2], [2, 3, 5])
+    edges.add_edge(4, 4)
+    array = edges.as_array()
+    assert array.tolist() == [[1, 3], [2, 5], [4, 4]]
+    assert array.dtype == np.int64 and array.flags["C_CONTIGUOUS"]
+    assert len(edges) == 3
+
+
+def test_edges_can_be_added_after_converting():
+    edges = EdgeSet()
+    assert edges.as_array().shape == (0, 2)
+    edges.add_edges(np.array([7, 8]), np.array([6, 9]))
+    assert edges.as_array().tolist() == [[6, 7], [8, 9]]
+    edges.add_edge(9, 8)
+    edges.add_edge(0, 1)
+    assert edges.list_rep() == [[0, 1], [6, 7], [8, 9]]
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from EdgeWriter import EdgeWriter
+
+
+def test_writes_chunks_in_order(tmp_path):
+    writer = EdgeWriter(str(tmp_path / "out.e"), str(tmp_path / "out.v"),
+                        max_chunks=1)
+    for i in range(5):
+        writer.write_edges(np.array([[i, i + 1], [i + 1, i]]))
+        writer.write_vertices(np.array([i]))
+    writer.write_edges(np.empty((0, 2), dtype=np.int64))
+    writer.close()
+    assert (tmp_path / "out.e").read_text().splitlines() == \
+        [f"{a} {b}" for i in range(5) for a, b in ((i, i + 1), (i + 1, i))]
+    assert (tmp_path / "out.v").read_text() == "0\n1\n2\n3\n4\n"
+
+
+def test_truncates_existing_files(tmp_path):
+    (tmp_path / "out.e").write_text("1 2\n")
+    (tmp_path / "out.v").write_text("1\n")
+    EdgeWriter(str(tmp_path / "out.e"), str(tmp_path / "out.v")).close()
+    assert (tmp_path / "out.e").read_text() == ""
+    assert (tmp_path / "out.v").read_text() == ""
+
+
+def test_write_errors_are_raised_to_the_caller(tmp_path):
+    writer = EdgeWriter(str(tmp_path / "out.e"), str(tmp_path / "out.v"))
+    writer.write_edges(np.array([["a", "b"]]))
+    with pytest.raises(TypeError):
+        writer.close()
+
+
+def test_counts_queued_edges_of_an_edge_shard(tmp_path):
+    writer = EdgeWriter(str(tmp_path / "out.e.1"))
+    writer.write_edges(np.array([[1, 2], [2, 1], [3, 3]]))
+    writer.write_edges(np.array([[4, 5]]))
+    writer.close()
+    assert writer.n_edges == 4
+    assert (tmp_path / "out.e.1").read_text() == "1 2\n2 1\n3 3\n4 5\n"
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from CSRGraph import CSRGraph
+from EdgeSet import EdgeSet
+from Enums import VertexStatus
+from Fire import Fire
+
+GHOST = 100
+
+
+def frontier_fire(src, dst, fwd_burning_prob=1.0):
+    graph = CSRGraph(None)
+    graph.build(src, dst)
+    return Fire(None, graph, fwd_burning_prob, spread_mode="frontier")
+
+
+def edge_set(new_edges):
+    return {tuple(edge) for edge in new_edges.as_array().tolist()}
+
+
+def test_frontier_burns_unburned_neighbors_and_asks_for_ghosts():
+    fire = frontier_fire([1, 1, 1, 1, 2, 3, 4], [2, 3, 4, GHOST, 5, 6, 1])
+    fire.graph.set_vertex_status(4, VertexStatus.BURNED)
+    fire.burning_vertex_ids.append(1)
+    new_edges = EdgeSet()
+    fire.spread_frontier(new_edges)
+
+    assert sorted(fire.burning_vertex_ids) == [2, 3]
+    assert fire.graph.get_vertex_status(2) == VertexStatus.BURNING
+    assert fire.remote_vertices_to_burn == [GHOST]
+    # the edge to the burned neighbor is part of the sample as well
+    assert edge_set(new_edges) == {(1, 2), (1, 3), (1, 4), (1, GHOST)}
+
+
+def test_neighbor_of_several_frontier_vertices_burns_once():
+    fire = frontier_fire([1, 2, 3], [3, 3, 1])
+    fire.burning_vertex_ids.extend([2, 1])
+    new_edges = EdgeSet()
+    fire.spread_frontier(new_edges)
+    assert list(fire.burning_vertex_ids) == [3]
+    assert edge_set(new_edges) == {(2, 3)}
+
+
+@pytest.mark.parametrize("fwd_burning_prob, n_burned", [(0.5, 5), (0.7, 7),
+                                                        (0.01, 1)])
+def test_frontier_burns_a_share_of_the_neighbors(fwd_burning_prob, n_burned):
+    # a star around vertex 0
+    center, leaves = np.zeros(9, dtype=np.int64), np.arange(1, 10)
+    fire = frontier_fire(np.concatenate((center, leaves)),
+                         np.concatenate((leaves, center)), fwd_burning_prob)
+    fire.burning_vertex_ids.append(0)
+    new_edges = EdgeSet()
+    fire.spread_frontier(new_edges)
+    assert len(fire.burning_vertex_ids) == n_burned
+    assert edge_set(new_edges) == {(0, v) for v in fire.burning_vertex_ids}
+
+
+def test_relights_given_away_are_skipped():
+    fire = frontier_fire(np.arange(100), np.arange(1, 101) % 100)
+    fire.relight_debt = 10
+    fire.fire_help()
+    # 2**4 relights of which 10 were handed to other compute nodes
+    assert len(fire.burning_vertex_ids) == 6
+    assert fire.relight_debt == 0
+    assert fire.relight_counter == 1
+
+    fire.burning_vertex_ids.clear()
+    fire.relight_debt = 40
+    fire.fire_help()
+    assert len(fire.burning_vertex_ids) == 0
+    assert fire.relight_debt == 8
+    fire.reset_fire()
+    assert fire.relight_debt == 0
@@ -0,0 +1,44 @@
+import pytest
+
+from FireStepController import FireStepController
+
+
+def test_first_rounds_double_until_measured():
+    controller = FireStepController(initial_step=10)
+    assert controller.step == 10
+    assert controller.next_step() == 20
+    assert controller.next_step() == 40
+
+
+def test_step_fills_the_target_interval():
+    controller = FireStepController(target_interval=0.1, target_edges=10**9,
+                                    initial_step=100)
+    controller.record_spread(100, 0.1, 0)
+    # 1 ms per step
+    assert controller.next_step() == 100
+    # waiting for the headnode, 0.25 s on average, stretches the round,
+    # growing at most twice as large per round
+    controller.record_ack(0.5)
+    assert controller.next_step() == 200
+    assert controller.next_step() == 250
+
+
+def test_step_caps_edges_per_heartbeat():
+    controller = FireStepController(target_interval=10, target_edges=1000,
+                                    initial_step=50)
+    controller.record_spread(50, 0.001, 5000)
+    assert controller.next_step() == 10
+
+
+@pytest.mark.parametrize("seconds, step", [(100.0, 3), (1e-9, 64)])
+def test_step_stays_within_bounds(seconds, step):
+    controller = FireStepController(min_step=3, max_step=64, initial_step=32)
+    controller.record_spread(32, seconds, 0)
+    assert controller.next_step() == step
+
+
+def test_empty_rounds_are_not_recorded():
+    controller = FireStepController()
+    controller.record_spread(0, 1.0, 10)
+    assert controller.seconds_per_step is None
+    assert controller.edges_per_step is None
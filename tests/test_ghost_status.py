@@ -0,0 +1,45 @@
+import numpy as np
+
+from GhostStatus import GhostStatus
+
+
+def test_marks_only_ghost_vertices():
+    status = GhostStatus([40, 3, 17, 9, 25, 31, 12, 8, 50, 2])
+    assert len(status) == 10
+    status.mark([3, 50, 4, 100, 1, 50])
+    probe = np.array([2, 3, 4, 50, 100, 1, 17])
+    assert status.burned_mask(probe).tolist() == \
+        [False, True, False, True, False, False, False]
+    status.mark(np.array([17, 2]))
+    assert status.burned_mask(probe).tolist() == \
+        [True, True, False, True, False, False, True]
+
+
+def test_reset_forgets_burned_vertices():
+    ghosts = np.arange(0, 100, 7)
+    status = GhostStatus(ghosts)
+    status.mark(ghosts)
+    assert status.burned_mask(ghosts).all()
+    status.reset()
+    assert not status.burned_mask(ghosts).any()
+
+
+def test_matches_a_set_across_byte_boundaries():
+    rng = np.random.default_rng(5)
+    ghosts = np.unique(rng.integers(0, 1000, size=77))
+    status = GhostStatus(ghosts)
+    burned = set()
+    for _ in range(5):
+        batch = rng.integers(0, 1000, size=30)
+        status.mark(batch)
+        burned |= set(batch.tolist()) & set(ghosts.tolist())
+        probe = np.arange(1000)
+        assert np.flatnonzero(status.burned_mask(probe)).tolist() == \
+            sorted(burned)
+
+
+def test_empty_status():
+    status = GhostStatus([])
+    status.mark([1, 2])
+    assert status.burned_mask([1, 2]).tolist() == [False, False]
+    assert status.burned_mask([]).tolist() == []
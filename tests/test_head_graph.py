@@ -0,0 +1,157 @@
+import numpy as np
+import pytest
+
+from HeadGraph import HeadGraph, KeySet
+
+# ids of the vertices in the original graph, not 0 up to n on purpose
+VERTEX_IDS = np.arange(40, dtype=np.int64) * 3 + 7
+
+
+def make_graph(tmp_path, name, num_sample=2):
+    return HeadGraph(len(VERTEX_IDS), num_sample, str(tmp_path / f"{name}.e"),
+                     str(tmp_path / f"{name}.v"), vertex_ids=VERTEX_IDS)
+
+
+def read_lines(path):
+    with open(path) as f:
+        return sorted(f.read().splitlines())
+
+
+def test_edges_are_written_once_per_sample(tmp_path):
+    graph = make_graph(tmp_path, "graph")
+    # a repeated edge, its reverse and a self loop
+    src = VERTEX_IDS[[0, 1, 0, 1, 4]]
+    dst = VERTEX_IDS[[1, 2, 1, 0, 4]]
+    graph.add_edges(src, dst, 0)
+    graph.next_sample()
+    graph.add_edges(src[:1], dst[:1], 1)
+    graph.write2file()
+
+    n = len(VERTEX_IDS)
+    a, b, c, d = VERTEX_IDS[[0, 1, 2, 4]]
+    assert graph.get_num_sample_vertices(0) == 4
+    assert graph.get_sample_vertices(1).tolist() == [n, n + 1]
+    # output ids are offset by the sample, self loops are written once
+    assert read_lines(tmp_path / "graph.e") == sorted(
+        f"{x} {y}" for x, y in [(a, b), (b, a), (b, c), (c, b), (d, d),
+                                (a + n, b + n), (b + n, a + n)])
+    assert read_lines(tmp_path / "graph.v") == sorted(
+        str(v) for v in [a, b, c, d, a + n, b + n])
+
+
+def test_unknown_vertex_ids_raise(tmp_path):
+    graph = make_graph(tmp_path, "graph")
+    with pytest.raises(KeyError):
+        graph.add_edges(VERTEX_IDS[:1], np.array([8]), 0)
+    assert graph.get_num_sample_vertices(0) == 0
+
+
+def random_edges(rng, n_edges):
+    edges = rng.choice(VERTEX_IDS, size=(n_edges, 2))
+    # repeated edges, both directions and self loops all count once
+    edges[5] = edges[2]
+    edges[6] = edges[3, ::-1]
+    edges[7, 1] = edges[7, 0]
+    return edges
+
+
+def add_until(graph, edges, sample, max_vertices):
+    """Adds edges one at a time until the sample has max_vertices vertices."""
+    n_added = 0
+    for src, dst in edges:
+        graph.add_edges(np.array([src]), np.array([dst]), sample)
+        n_added += 1
+        if graph.get_num_sample_vertices(sample) >= max_vertices:
+            break
+    return n_added
+
+
+@pytest.mark.parametrize("max_vertices", [1, 2, 9, 25, 40, 1000])
+def test_cutoff_matches_adding_one_edge_at_a_time(tmp_path, max_vertices):
+    rng = np.random.default_rng(max_vertices)
+    before = random_edges(rng, 12)
+    edges = random_edges(rng, 60)
+    bulk = make_graph(tmp_path, "bulk")
+    single = make_graph(tmp_path, "single")
+
+    # the sample already has vertices from an earlier heartbeat
+    bulk.add_edges(before[:, 0], before[:, 1], 1)
+    add_until(single, before, 1, np.inf)
+    n_bulk = bulk.add_edges(edges[:, 0], edges[:, 1], 1, max_vertices)
+    n_single = add_until(single, edges, 1, max_vertices)
+
+    assert n_bulk == n_single
+    assert bulk.get_num_sample_vertices(1) == \
+        single.get_num_sample_vertices(1)
+    assert np.array_equal(bulk.get_sample_vertices(1),
+                          single.get_sample_vertices(1))
+    bulk.write2file()
+    single.write2file()
+    for ext in ("e", "v"):
+        assert read_lines(tmp_path / f"bulk.{ext}") == \
+            read_lines(tmp_path / f"single.{ext}")
+
+
+def test_prefix_length_counts_source_first(tmp_path):
+    graph = make_graph(tmp_path, "graph", num_sample=1)
+    src = np.array([0, 0, 1, 2])
+    dst = np.array([0, 1, 3, 4])
+    # vertices 0, 0 1, 1 3, 2 4 bring the sample to 1, 2, 3 and 5
+    assert [graph._prefix_length(src, dst, 0, n) for n in range(1, 7)] == \
+        [1, 2, 3, 4, 4, 4]
+    graph.add_edges(VERTEX_IDS[src[:2]], VERTEX_IDS[dst[:2]], 0)
+    assert graph._prefix_length(src, dst, 0, 3) == 3
+    assert graph._prefix_length(src, dst, 0, 2) == 1
+    graph.write2file()
+
+
+def test_key_set_add_new_returns_unseen_keys():
+    rng = np.random.default_rng(4)
+    key_set = KeySet()
+    seen = set()
+    for size in (1, 1, 7, 3, 50, 2, 0, 20):
+        keys = np.unique(rng.integers(0, 200, size=size).astype(np.uint64))
+        new = key_set.add_new(keys)
+        assert sorted(new.tolist()) == sorted(set(keys.tolist()) - seen)
+        seen |= set(keys.tolist())
+        assert len(key_set) == len(seen)
+        # runs stay sorted and shrink like the digits of a binary counter
+        assert all(np.all(run[:-1] < run[1:]) for run in key_set.runs)
+        assert all(len(a) > len(b) for a, b in zip(key_set.runs,
+                                                   key_set.runs[1:]))
+    probe = np.arange(220, dtype=np.uint64)
+    assert np.array_equal(key_set.contains(probe),
+                          np.isin(probe, list(seen)))
+
+
+def test_key_set_discard_range():
+    key_set = KeySet()
+    for keys in ([5, 1, 9], [2, 3, 14, 20, 7], [11]):
+        key_set.add_new(np.array(keys, dtype=np.uint64))
+    key_set.discard_range(3, 11)
+    probe = np.arange(25, dtype=np.uint64)
+    assert np.flatnonzero(key_set.contains(probe)).tolist() == \
+        [1, 2, 11, 14, 20]
+    key_set.discard_range(0, 25)
+    assert len(key_set) == 0 and key_set.runs == []
+
+
+def test_samples_finish_out_of_order(tmp_path):
+    graph = make_graph(tmp_path, "graph", num_sample=3)
+    src, dst = VERTEX_IDS[[0, 1, 2]], VERTEX_IDS[[1, 2, 3]]
+    for sample in range(3):
+        graph.add_edges(src, dst, sample)
+    graph.finish_sample(1)
+    assert graph.finished.tolist() == [False, True, False]
+    # edges the unfinished samples already have are not written again
+    graph.add_edges(dst, src, 0)
+    graph.add_edges(src[:1], dst[:1], 2)
+    graph.write2file()
+
+    n = len(VERTEX_IDS)
+    # every edge is written in both directions
+    assert read_lines(tmp_path / "graph.e") == sorted(
+        f"{a + s * n} {b + s * n}" for s in range(3)
+        for a, b in zip(np.concatenate((src, dst)), np.concatenate((dst, src))))
+    assert read_lines(tmp_path / "graph.v") == sorted(
+        str(v + s * n) for s in range(3) for v in VERTEX_IDS[:4])
@@ -0,0 +1,83 @@
+import numpy as np
+
+from Enums import HEARTBEAT_FIELD, HEARTBEAT_HEADER_SIZE
+from HeadNode import HeadNode, balance_ignitions
+
+
+def burned_head_node(tmp_path, ring_stitch):
+    """Head node of a 4x upscale of 10 vertices, 5 burned per sample."""
+    head = HeadNode(0, 2, 1.0, 10, str(tmp_path / "out.v"),
+                    str(tmp_path / "out.e"), ring_stitch=ring_stitch)
+    for sample in range(head.num_sample):
+        vertices = np.arange(sample, sample + 5)
+        head.graph.add_edges(vertices[:-1], vertices[1:], sample)
+    return head
+
+
+def test_ring_links_every_sample_to_the_next(tmp_path):
+    head = burned_head_node(tmp_path, ring_stitch=True)
+    links = head.stitch_links()
+    assert len(links) == head.num_sample == 4
+    for i, (src_sample, dest_sample) in enumerate(links):
+        assert src_sample.tolist() == list(range(11 * i, 11 * i + 5))
+        assert np.array_equal(dest_sample, links[(i + 1) % 4][0])
+
+    head.stitch_sample(*links[0], 3)
+    head.graph.write2file()
+    edges = [tuple(map(int, line.split()))
+             for line in (tmp_path / "out.e").read_text().splitlines()]
+    stitched = [(a, b) for a, b in edges if a < 10 <= b]
+    assert len(stitched) == 3
+    assert all(a in range(5) and b in range(11, 16) for a, b in stitched)
+
+
+def test_random_stitching_links_all_vertices(tmp_path):
+    head = burned_head_node(tmp_path, ring_stitch=False)
+    links = head.stitch_links()
+    assert len(links) == 1
+    src_sample, dest_sample = links[0]
+    assert src_sample is dest_sample
+    assert sorted(src_sample.tolist()) == \
+        [11 * i + j for i in range(4) for j in range(5)]
+    head.graph.write2file()
+
+
+def rank_stats(*ranks):
+    """One (relight_counter, relight_exponent, backlog, unburned) per rank."""
+    stats = np.zeros((len(ranks), HEARTBEAT_HEADER_SIZE), dtype=np.int64)
+    for i, (relights, exponent, backlog, unburned) in enumerate(ranks):
+        stats[i, HEARTBEAT_FIELD.RELIGHT_COUNTER.value] = relights
+        stats[i, HEARTBEAT_FIELD.RELIGHT_EXPONENT.value] = exponent
+        stats[i, HEARTBEAT_FIELD.BACKLOG.value] = backlog
+        stats[i, HEARTBEAT_FIELD.UNBURNED.value] = unburned
+    return stats
+
+
+def test_moves_relights_to_unburned_mass():
+    # rank 0 relit since the last round, rank 3 has no burning vertices
+    stats = rank_stats((3, 4, 7, 100), (1, 5, 10, 300), (0, 6, 3, 100),
+                       (0, 3, 0, 2))
+    quotas = balance_ignitions(stats, np.array([2, 1, 0, 0]), steal_quota=32)
+    # 18 offered fires are split by unburned vertices, the 16 handed out are
+    # taken from rank 0 first, which keeps its own share
+    assert quotas.tolist() == [-13, 10, 3, 0]
+    assert quotas.sum() == 0
+
+
+def test_idle_rank_holding_the_mass_keeps_its_relights():
+    stats = rank_stats((5, 4, 1, 1000), (0, 4, 1, 10))
+    quotas = balance_ignitions(stats, np.array([4, 0]), steal_quota=16)
+    assert quotas.tolist() == [0, 0]
+
+
+def test_offers_are_capped_by_steal_quota():
+    stats = rank_stats((0, 10, 0, 1000), (0, 4, 1, 1000))
+    quotas = balance_ignitions(stats, np.zeros(2), steal_quota=8)
+    assert quotas.tolist() == [-4, 4]
+
+
+def test_nothing_moves_without_idle_ranks_or_unburned_mass():
+    busy = rank_stats((1, 4, 2, 50), (3, 4, 1, 50))
+    assert not balance_ignitions(busy, np.array([1, 3]), 16).any()
+    burned = rank_stats((1, 4, 0, 0), (0, 4, 1, 0))
+    assert not balance_ignitions(burned, np.zeros(2), 16).any()
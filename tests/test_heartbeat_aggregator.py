@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from Enums import HEARTBEAT_FIELD, HEARTBEAT_HEADER_SIZE, AGGREGATE_FIELD
+from HeartbeatAggregator import HeartbeatAggregator, tree_parent, \
+    tree_children, unpack_keys
+
+VERTEX_IDS = np.array([70, 3, 12, 45, 8, 99, 31], dtype=np.int64)
+
+
+@pytest.mark.parametrize("n_partitions", [1, 2, 5, 16])
+@pytest.mark.parametrize("fan_out", [1, 2, 3, 8])
+def test_tree_reaches_every_partition_once(n_partitions, fan_out):
+    children = {p: list(tree_children(p, n_partitions, fan_out))
+                for p in range(n_partitions + 1)}
+    assert sorted(sum(children.values(), [])) == \
+        list(range(1, n_partitions + 1))
+    for partition in range(1, n_partitions + 1):
+        parent = tree_parent(partition, fan_out)
+        assert parent < partition
+        assert partition in children[parent]
+        assert len(children[parent]) <= fan_out
+
+
+def test_unpack_keys_inverts_pack():
+    aggregator = HeartbeatAggregator(VERTEX_IDS, 1)
+    edges = np.array([[70, 3], [3, 70], [99, 8], [31, 31], [12, 45]])
+    src, dst = unpack_keys(aggregator.pack(edges).view(np.int64),
+                           aggregator.n_vertices)
+    sorted_ids = np.sort(VERTEX_IDS)
+    assert np.array_equal(sorted_ids[src], edges.min(axis=1))
+    assert np.array_equal(sorted_ids[dst], edges.max(axis=1))
+
+
+def test_pack_rejects_unknown_vertices():
+    aggregator = HeartbeatAggregator(VERTEX_IDS, 1)
+    with pytest.raises(KeyError):
+        aggregator.pack(np.array([[70, 4]]))
+
+
+def heartbeat_header(sample, relight_counter, relight_exponent, backlog,
+                     unburned):
+    header = np.zeros(HEARTBEAT_HEADER_SIZE, dtype=np.int64)
+    header[HEARTBEAT_FIELD.SAMPLE.value] = sample
+    header[HEARTBEAT_FIELD.RELIGHT_COUNTER.value] = relight_counter
+    header[HEARTBEAT_FIELD.RELIGHT_EXPONENT.value] = relight_exponent
+    header[HEARTBEAT_FIELD.BACKLOG.value] = backlog
+    header[HEARTBEAT_FIELD.UNBURNED.value] = unburned
+    return header
+
+
+def test_merge_drops_duplicate_edges_across_heartbeats():
+    aggregator = HeartbeatAggregator(VERTEX_IDS, 3)
+    own = np.array([[70, 3], [12, 45]])
+    child = np.array([[3, 70], [8, 99]])
+    grandchild = aggregator.pack(np.array([[99, 8], [31, 12]]))
+    headers = [heartbeat_header(2, 1, 0, 4, 10),
+               heartbeat_header(2, 2, 3, 0, 20),
+               heartbeat_header(2, 0, 1, 5, 30)]
+
+    header, keys, n_dropped = aggregator.merge(headers, [own, child],
+                                               [grandchild.view(np.int64)])
+    assert n_dropped == 2
+    # keys keep the order they arrived in
+    assert np.array_equal(keys, aggregator.pack(np.array(
+        [[70, 3], [12, 45], [8, 99], [31, 12]])).view(np.int64))
+    assert header[:HEARTBEAT_HEADER_SIZE].tolist() == [2, 3, 3, 9, 60]
+    assert header[HEARTBEAT_HEADER_SIZE + AGGREGATE_FIELD.RANKS.value] == 3
+    assert header[HEARTBEAT_HEADER_SIZE +
+                  AGGREGATE_FIELD.VERTICES.value] == 7
+
+    # edges forwarded earlier in the sample are not forwarded again
+    header, keys, n_dropped = aggregator.merge(
+        headers[:1], [np.array([[45, 12], [8, 70]])], [])
+    assert n_dropped == 1
+    assert np.array_equal(keys, aggregator.pack(np.array([[8, 70]])).view(
+        np.int64))
+    assert header[HEARTBEAT_HEADER_SIZE +
+                  AGGREGATE_FIELD.VERTICES.value] == 7
+
+    aggregator.reset()
+    _, keys, n_dropped = aggregator.merge(headers[:1], [own], [])
+    assert n_dropped == 0 and len(keys) == 2
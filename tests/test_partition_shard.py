@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from PartitionShard import PartitionShard, HEADER, MAGIC, FORMAT_VERSION
+
+
+def make_shard(n_halo=1, index_type=np.int32):
+    """Two owned vertices, n_halo halo vertices and the rest ghosts."""
+    ldbc_ids = np.array([40, 10, 30, 20, 50], dtype=np.int64)
+    n_rows = 2 + n_halo
+    indptr = np.array([0, 2, 3, 5][:n_rows + 1], dtype=np.int64)
+    indices = np.array([1, 3, 0, 4, 0][:indptr[-1]], dtype=index_type)
+    return PartitionShard(3, 4, 2, ldbc_ids,
+                          np.argsort(ldbc_ids, kind="stable"), indptr,
+                          indices, np.array([1, 2, 4], dtype=np.int32),
+                          n_halo=n_halo)
+
+
+def write_v1(shard, path):
+    """Writes a shard the way version 1 did, without the halo header."""
+    v1 = PartitionShard(shard.rank, shard.n_part, shard.n_local,
+                        shard.ldbc_ids, shard.sorter, shard.indptr,
+                        shard.indices, shard.ghost_ranks, version=1)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 1, shard.indices.dtype.itemsize,
+                            shard.rank, shard.n_part, shard.n_local,
+                            len(shard.ldbc_ids), len(shard.indices)))
+        for name, dtype, length, offset in v1._layout():
+            f.seek(offset)
+            np.ascontiguousarray(getattr(v1, name), dtype=dtype).tofile(f)
+
+
+def assert_same(loaded, shard):
+    for name in ("rank", "n_part", "n_local", "n_halo"):
+        assert getattr(loaded, name) == getattr(shard, name)
+    for name in ("ldbc_ids", "sorter", "indptr", "indices", "ghost_ranks"):
+        expected = getattr(shard, name)
+        assert getattr(loaded, name).dtype == expected.dtype
+        assert np.array_equal(getattr(loaded, name), expected)
+
+
+@pytest.mark.parametrize("n_halo", [0, 1])
+@pytest.mark.parametrize("index_type", [np.int32, np.int64])
+def test_round_trip(tmp_path, n_halo, index_type):
+    shard = make_shard(n_halo, index_type)
+    shard.write(tmp_path / "node3.bin")
+    loaded = PartitionShard.load(tmp_path / "node3.bin")
+    assert loaded.version == FORMAT_VERSION
+    assert_same(loaded, shard)
+
+
+def test_loads_version_1_without_halo(tmp_path):
+    shard = make_shard(n_halo=0)
+    write_v1(shard, tmp_path / "node3.bin")
+    loaded = PartitionShard.load(tmp_path / "node3.bin")
+    assert loaded.version == 1
+    assert_same(loaded, shard)
+
+
+def test_rejects_other_files(tmp_path):
+    with open(tmp_path / "short.bin", "wb") as f:
+        f.write(b"DSLPART")
+    with pytest.raises(ValueError, match="not a partition shard"):
+        PartitionShard.load(tmp_path / "short.bin")
+
+    shard = make_shard()
+    shard.write(tmp_path / "node3.bin")
+    data = bytearray((tmp_path / "node3.bin").read_bytes())
+    data[8:12] = np.array([FORMAT_VERSION + 1], dtype="<u4").tobytes()
+    (tmp_path / "future.bin").write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="shard version"):
+        PartitionShard.load(tmp_path / "future.bin")
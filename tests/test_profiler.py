@@ -0,0 +1,41 @@
+import pytest
+
+from Profiler import Histogram, bucket_index, bucket_bounds, N_BUCKETS, \
+    SUB_BITS
+
+
+@pytest.mark.parametrize("ns", [0, 1, 7, 8, 9, 1000, 123456789, 2**40 + 5,
+                                2**63 - 1])
+def test_bucket_bounds_contain_their_durations(ns):
+    index = bucket_index(ns)
+    assert 0 <= index < N_BUCKETS
+    low, high = bucket_bounds(index)
+    assert low <= ns < high
+    # the relative width of a bucket is bounded by the sub buckets
+    assert (high - low) <= max(1, low / 2**SUB_BITS)
+
+
+def test_buckets_are_ordered_and_adjacent():
+    bounds = [bucket_bounds(index) for index in range(bucket_index(10**6))]
+    assert all(high == next_low for (_, high), (next_low, _)
+               in zip(bounds, bounds[1:]))
+
+
+def test_percentiles_are_within_the_bucket_error():
+    histogram = Histogram()
+    for ns in range(1, 1001):
+        histogram.add(ns * 1000)
+    assert histogram.count == 1000
+    assert histogram.min == 1000 and histogram.max == 10**6
+    for q in (50, 90, 99):
+        exact = q * 10**4
+        assert abs(histogram.percentile(q) - exact) <= \
+            exact / 2**(SUB_BITS + 1)
+    stats = histogram.to_dict()
+    assert stats["mean"] == pytest.approx(500.5e-6)
+    assert sum(stats["buckets"].values()) == 1000
+
+
+def test_empty_histogram():
+    stats = Histogram().to_dict()
+    assert stats["count"] == 0 and stats["p99"] == 0 and stats["min"] == 0
@@ -0,0 +1,115 @@
+import threading
+import numpy as np
+import pytest
+
+import SharedMemoryMPI
+from SharedMemoryMPI import RingBuffer, _BUFFER, _PICKLE
+
+
+@pytest.fixture
+def ring():
+    ring = RingBuffer(size=1024, lock=threading.Lock(),
+                      signal=threading.Semaphore(0))
+    yield ring
+    ring.close()
+    ring.shm.unlink()
+
+
+def payload(size, seed):
+    return np.random.default_rng(seed).integers(
+        0, 256, size=size, dtype=np.uint8).tobytes()
+
+
+def test_small_message_round_trip(ring):
+    ring.write(3, 7, 11, _BUFFER, payload(13, 0), progress=None)
+    ring.write(4, 8, 12, _PICKLE, b"", progress=None)
+    assert ring.read() == [(3, 7, 11, _BUFFER, payload(13, 0)),
+                           (4, 8, 12, _PICKLE, b"")]
+    assert ring.read() == []
+
+
+def test_large_message_is_written_in_chunks(ring):
+    data = payload(ring.max_chunk * 3 + 5, 1)
+    ring.write(1, 2, 3, _BUFFER, data, progress=None)
+    n_chunks = -(-len(data) // ring.max_chunk)
+    assert int(ring.pos[0]) == n_chunks * SharedMemoryMPI._HEADER + \
+        -(-len(data) // 8) * 8
+    assert ring.read() == [(1, 2, 3, _BUFFER, data)]
+
+
+def test_message_larger_than_the_ring_waits_for_the_reader(ring):
+    # the writer drains the ring through progress while it is full
+    messages = []
+    data = payload(ring.capacity * 3 + 100, 2)
+    ring.write(1, 2, 3, _BUFFER, data, progress=lambda: messages.extend(
+        ring.read()))
+    messages.extend(ring.read())
+    assert messages == [(1, 2, 3, _BUFFER, data)]
+
+
+def test_records_wrap_around_the_ring(ring):
+    rng = np.random.default_rng(3)
+    sent, received = [], []
+    for i in range(200):
+        message = (i % 5, i, 1, _BUFFER,
+                   payload(int(rng.integers(0, ring.capacity // 3)), i))
+        ring.write(*message, progress=lambda: received.extend(ring.read()))
+        sent.append(message)
+        if i % 3 == 0:
+            received.extend(ring.read())
+    received.extend(ring.read())
+    assert int(ring.pos[0]) > 10 * ring.capacity
+    assert received == sent
+
+
+def exchange_on_split_communicators():
+    from mpi4py import MPI
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    # overlapping communicators must never receive each other's messages
+    halves = comm.Split(rank % 2, rank)
+    assert halves.allgather(rank) == list(range(rank % 2, 4, 2))
+    quiet = comm.Split(MPI.UNDEFINED if rank == 0 else 0, rank)
+    assert (quiet is MPI.COMM_NULL) == (rank == 0)
+    ring_comm = comm.Create_dist_graph_adjacent([(rank - 1) % 4],
+                                                [(rank + 1) % 4])
+    received = np.zeros(1, dtype=np.int64)
+    ring_comm.Neighbor_alltoall(np.array([rank], dtype=np.int64), received)
+    assert received[0] == (rank - 1) % 4
+    contexts = comm.allgather((halves.context, ring_comm.context))
+    assert len({context for context, _ in contexts}) == 1
+    assert len({context for _, context in contexts}) == 1
+    if quiet is not MPI.COMM_NULL:
+        assert quiet.allgather(rank) == [1, 2, 3]
+        assert len({halves.context, quiet.context, ring_comm.context,
+                    comm.context}) == 4
+
+
+def test_communicators_agree_on_context_ids():
+    assert SharedMemoryMPI.launch(4, exchange_on_split_communicators,
+                                  ring_size=2**16) == 0
+
+
+def share_partition():
+    from mpi4py import MPI
+    from CSRGraph import CSRGraph
+    from Enums import VertexStatus
+    host = MPI.COMM_WORLD.Split_type(MPI.COMM_TYPE_SHARED)
+    graph = CSRGraph(None)
+    if host.Get_rank() == 0:
+        graph.build([10, 10, 20, 30], [20, 30, 40, 10])
+    graph.to_shared(host)
+    assert graph.num_local_vertices() == 3
+    assert sorted(graph.get_neighbors(10)) == [20, 30]
+    assert graph.get_neighbors(40) == []
+    # the burn status stays private to every rank
+    if host.Get_rank() == 1:
+        graph.set_vertex_status(20, VertexStatus.BURNED)
+    host.Barrier()
+    burned = graph.get_vertex_status(20) == VertexStatus.BURNED
+    assert burned == (host.Get_rank() == 1)
+    host.Barrier()
+
+
+def test_partition_is_shared_between_ranks():
+    assert SharedMemoryMPI.launch(3, share_partition, ring_size=2**16) == 0
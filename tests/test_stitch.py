@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from Enums import STITCH_FIELD
+from Stitch import draw_stitch_edges, stitch_plan, edges_from_positions
+
+
+def test_draws_edges_between_the_samples_without_self_loops():
+    rng = np.random.default_rng(1)
+    src_sample = np.arange(0, 40)
+    dest_sample = np.arange(20, 60)
+    source, destination = draw_stitch_edges(rng, src_sample, dest_sample, 30)
+    assert len(source) == len(destination) <= 30
+    assert (source != destination).all()
+    assert np.isin(source, src_sample).all()
+    assert np.isin(destination, dest_sample).all()
+    # without replacement while the samples are large enough
+    assert len(np.unique(source)) == len(source)
+
+
+@pytest.mark.parametrize("n_compute_nodes", [1, 3, 8])
+def test_plan_splits_sources_and_edges_over_compute_nodes(n_compute_nodes):
+    links = [(np.arange(100), np.arange(50)), (np.arange(5), np.arange(7))]
+    plan = stitch_plan(links, n_compute_nodes, 0.3)
+    assert plan.shape == (n_compute_nodes, 2, len(STITCH_FIELD))
+    for i, (src_sample, dest_sample) in enumerate(links):
+        offsets = plan[:, i, STITCH_FIELD.OFFSET.value]
+        counts = plan[:, i, STITCH_FIELD.COUNT.value]
+        edges = plan[:, i, STITCH_FIELD.EDGES.value]
+        assert offsets.tolist() == (np.cumsum(counts) - counts).tolist()
+        assert counts.sum() == len(src_sample)
+        assert edges.sum() == np.ceil(len(src_sample) * 0.3)
+        assert (edges[counts == 0] == 0).all()
+        assert (plan[:, i, STITCH_FIELD.DESTINATIONS.value] ==
+                len(dest_sample)).all()
+
+
+def test_positions_are_translated_per_link():
+    links = [(np.array([10, 11, 12]), np.array([20, 21])),
+             (np.array([30, 31]), np.array([40, 41, 42]))]
+    # two compute nodes, the first drew one edge of each link, the second
+    # two edges of the first link
+    n_edges = np.array([[1, 1], [2, 0]])
+    positions = np.array([[2, 1], [1, 2], [0, 0], [1, 1]])
+    source, destination = edges_from_positions(links, n_edges, positions)
+    assert source.tolist() == [12, 31, 10, 11]
+    assert destination.tolist() == [21, 42, 20, 21]
+
+
+def test_translated_self_loops_are_dropped():
+    sample = np.array([5, 6, 7])
+    source, destination = edges_from_positions(
+        [(sample, sample)], np.array([[3]]), np.array([[0, 0], [0, 1], [2, 2]]))
+    assert source.tolist() == [5]
+    assert destination.tolist() == [6]
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from VertexPool import VertexPool
+
+
+def assert_consistent(pool, expected):
+    """Checks the pool holds exactly expected and its index is intact."""
+    assert len(pool) == len(expected)
+    assert set(pool.items[:pool.size].tolist()) == expected
+    assert np.array_equal(pool.items[pool.positions],
+                          np.arange(len(pool.items)))
+    for index in range(len(pool.items)):
+        assert (index in pool) == (index in expected)
+
+
+def test_discard_many_matches_discard():
+    rng = np.random.default_rng(1)
+    pool = VertexPool(50)
+    single = VertexPool(50)
+    expected = set(range(50))
+    for _ in range(10):
+        indices = rng.integers(0, 50, size=8)
+        pool.discard_many(indices)
+        for index in indices:
+            single.discard(index)
+        expected -= set(indices.tolist())
+        assert_consistent(pool, expected)
+        assert_consistent(single, expected)
+
+
+def test_discard_many_ignores_removed_and_duplicate_indices():
+    pool = VertexPool(10)
+    pool.discard_many([3, 3, 4])
+    pool.discard_many([4, 5, 5])
+    pool.discard_many([])
+    assert_consistent(pool, set(range(10)) - {3, 4, 5})
+
+
+def test_discard_many_empties_the_pool():
+    pool = VertexPool(6)
+    pool.discard_many([5, 0, 2, 1, 4, 3])
+    assert_consistent(pool, set())
+    pool.reset()
+    assert_consistent(pool, set(range(6)))
+
+
+def test_take_random_returns_distinct_indices_in_the_pool():
+    rng = np.random.default_rng(2)
+    pool = VertexPool(100)
+    pool.discard_many(np.arange(0, 100, 3))
+    expected = set(range(100)) - set(range(0, 100, 3))
+    picked = pool.take_random(20, rng)
+    assert len(picked) == len(set(picked.tolist())) == 20
+    assert set(picked.tolist()) <= expected
+    assert_consistent(pool, expected - set(picked.tolist()))
+
+
+@pytest.mark.parametrize("n", [5, 6])
+def test_take_random_drains_a_small_pool(n):
+    pool = VertexPool(10)
+    pool.discard_many([0, 1, 2, 3, 4])
+    picked = pool.take_random(n, np.random.default_rng(3))
+    assert sorted(picked.tolist()) == [5, 6, 7, 8, 9]
+    assert_consistent(pool, set())